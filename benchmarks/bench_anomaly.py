@@ -0,0 +1,27 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "libs", "wakanda_common"))
+
+from wakanda_common.anomaly import AnomalyDetector
+
+
+def main():
+    rng = np.random.default_rng(0)
+    readings = (50 + rng.normal(0, 0.05, 200_000)).tolist()
+    print(f"{'ventana':>8} {'coste':>12} {'falsos positivos':>17}")
+    for window in (60, 600, 6000, 60000):
+        detector = AnomalyDetector("bench", window=window, sensitivity=4.0, clock=lambda: 0)
+        start = time.perf_counter()
+        flagged = 0
+        for value in readings:
+            if detector.observe("frequency_hz", value, 0) is not None:
+                flagged += 1
+        elapsed = time.perf_counter() - start
+        print(f"{window:>8} {elapsed / len(readings) * 1e6:>8.2f} µs {flagged:>17}")
+
+
+if __name__ == "__main__":
+    main()
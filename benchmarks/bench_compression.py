@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import random
+import timeit
+import hashlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from src.gateway_api.app.compression import CompressionMiddleware, brotli
+
+REPEAT = 5
+# Enlaces para estimar cuánto tiempo de transferencia ahorra cada byte
+LINKS_MBPS = (10, 100)
+
+
+def payloads():
+    rng = random.Random(7)
+    houses = ["Gryffindor", "Slytherin", "Hufflepuff", "Ravenclaw", ""]
+    hogwarts = [{"id": f"{rng.getrandbits(64):016x}", "name": f"Personaje {n}", "alternate_names": [],
+                 "species": "human", "gender": rng.choice(["male", "female"]), "house": rng.choice(houses),
+                 "dateOfBirth": None, "wizard": True, "ancestry": rng.choice(["pure-blood", "half-blood", ""]),
+                 "wand": {"wood": rng.choice(["holly", "yew", "vine"]), "core": "phoenix feather",
+                          "length": round(rng.uniform(9, 14), 1)},
+                 "patronus": "", "hogwartsStudent": rng.random() < 0.5, "actor": f"Actor {n}",
+                 "alive": True, "image": f"https://ik.imagekit.io/hpapi/{n}.jpg"} for n in range(24)]
+    users = [{"id": n, "username": f"ciudadano{n}", "email": f"ciudadano{n}@wakanda.gov", "role": "user",
+              "is_verified": True, "team_id": rng.randint(1, 5), "avatar_url": None,
+              "created_at": "2026-01-01T00:00:00"} for n in range(200)]
+    pods = {"pods": [{"name": f"ms-{n}", "status": "Running", "restarts": rng.randint(0, 3), "age": "3h 12m",
+                      "ip": f"10.1.0.{n}", "start_time": "2026-10-19T08:00:00+00:00"} for n in range(12)],
+            "nodes": [{"name": "docker-desktop", "cpu": "8", "memory": "16318956Ki"}]}
+    history = {"metric": "voltage_v", "resolution": "raw", "start": 0, "end": 3600,
+               "points": [{"t": 1792430000.0 + n * 6, "value": round(230 + rng.gauss(0, 1.5), 2)}
+                          for n in range(600)]}
+    return [("/hogwarts/roster", hogwarts), ("/users", users), ("/admin/k8s/info", pods),
+            ("/energy/history", history)]
+
+
+def per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=REPEAT)) / number * 1e6
+
+
+def main():
+    codecs = [("gzip", level) for level in (1, 6, 9)]
+    if brotli is not None:
+        codecs += [("br", quality) for quality in (1, 4, 11)]
+    else:
+        print("brotli no está instalado: solo gzip")
+    links = "  ".join(f"{'ahorro @' + str(mbps) + 'Mb':>13}" for mbps in LINKS_MBPS)
+    print(f"{'ruta':<18} {'códec':<8} {'bytes':>7} {'comprimido':>10} {'ratio':>6} {'CPU':>9}  {links}")
+    for path, content in payloads():
+        body = json.dumps(content).encode()
+        number = max(5, 100000 // len(body))
+        etag = per_call(lambda: hashlib.blake2b(body, digest_size=16).hexdigest(), number * 10)
+        for encoding, level in codecs:
+            middleware = CompressionMiddleware(None, gzip_level=level, brotli_quality=level)
+            compressed = middleware.compress(body, encoding)
+            cpu = per_call(lambda: middleware.compress(body, encoding), number)
+            saved = [(len(body) - len(compressed)) * 8 / (mbps * 1e6) * 1e6 - cpu for mbps in LINKS_MBPS]
+            savings = "  ".join(f"{s / 1000:>10.2f} ms" for s in saved)
+            print(f"{path:<18} {encoding + str(level):<8} {len(body):>7} {len(compressed):>10} "
+                  f"{len(body) / len(compressed):>5.1f}x {cpu:>6.0f} µs  {savings}")
+        print(f"{path:<18} {'etag':<8} {len(body):>7} {'304: 0':>10} {'':>6} {etag:>6.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
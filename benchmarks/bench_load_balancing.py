@@ -0,0 +1,105 @@
+import os
+import sys
+import heapq
+import random
+from collections import deque
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from src.gateway_api.app.balancer import Upstream
+
+REPLICAS = 3
+WORKERS = 4                 # peticiones simultáneas que atiende cada pod
+SERVICE_MS = 10.0           # tiempo medio de servicio de un pod sano
+SLOW_FACTOR = 3.0           # el pod lento tarda esto más
+LOAD = 0.4                  # carga respecto a la capacidad total
+REQUESTS = 100000
+SEED = 11
+
+
+class Replica:
+    def __init__(self, mean_ms):
+        self.mean_ms = mean_ms
+        self.busy = 0
+        self.queue = deque()
+        self.served = 0
+
+
+def simulate(strategy):
+    rng = random.Random(SEED)
+    means = [SERVICE_MS * SLOW_FACTOR] + [SERVICE_MS] * (REPLICAS - 1)
+    replicas = [Replica(mean) for mean in means]
+    capacity = sum(WORKERS / mean for mean in means)
+    arrival_rate = capacity * LOAD
+
+    now = [0.0]
+    upstream = Upstream("sim", [(f"pod-{n}", 8000) for n in range(REPLICAS)], strategy=strategy,
+                        slow_start=0, clock=lambda: now[0], rng=random.Random(SEED))
+    endpoints = list(upstream.endpoints.values())
+    rr = [0]
+
+    def choose():
+        if strategy == "random":
+            return rng.randrange(REPLICAS), None
+        if strategy == "round_robin":
+            rr[0] = (rr[0] + 1) % REPLICAS
+            return rr[0], None
+        endpoint = upstream.pick()
+        return endpoints.index(endpoint), endpoint
+
+    events = []
+    seq = 0
+    latencies = []
+
+    def start(index, arrived, endpoint):
+        nonlocal seq
+        replica = replicas[index]
+        replica.busy += 1
+        seq += 1
+        heapq.heappush(events, (now[0] + rng.expovariate(1 / replica.mean_ms), seq, "done", (index, arrived, endpoint)))
+
+    t = 0.0
+    for _ in range(REQUESTS):
+        t += rng.expovariate(arrival_rate)
+        seq += 1
+        heapq.heappush(events, (t, seq, "arrive", None))
+
+    while events:
+        now[0], _, kind, data = heapq.heappop(events)
+        if kind == "arrive":
+            index, endpoint = choose()
+            replica = replicas[index]
+            if replica.busy < WORKERS:
+                start(index, now[0], endpoint)
+            else:
+                replica.queue.append((now[0], endpoint))
+        else:
+            index, arrived, endpoint = data
+            replica = replicas[index]
+            replica.busy -= 1
+            replica.served += 1
+            latencies.append(now[0] - arrived)
+            if endpoint is not None:
+                upstream.release(endpoint, ok=True)
+            if replica.queue:
+                queued_at, queued_endpoint = replica.queue.popleft()
+                start(index, queued_at, queued_endpoint)
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    slow_share = replicas[0].served / REQUESTS
+    return pick(0.5), pick(0.99), pick(0.999), sum(latencies) / len(latencies), slow_share
+
+
+def main():
+    print(f"{REPLICAS} pods ({WORKERS} workers), uno {SLOW_FACTOR:.0f}x más lento, carga {LOAD:.0%}, "
+          f"{REQUESTS} peticiones")
+    print(f"{'estrategia':<12} {'p50':>8} {'p99':>9} {'p99.9':>9} {'media':>8} {'al lento':>9}")
+    for strategy in ("random", "round_robin", "least", "p2c"):
+        p50, p99, p999, mean, slow = simulate(strategy)
+        print(f"{strategy:<12} {p50:>5.1f} ms {p99:>6.1f} ms {p999:>6.1f} ms {mean:>5.1f} ms {slow:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
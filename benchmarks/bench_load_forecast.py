@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.gestion_energia.app.forecast import LoadForecaster
+
+MINUTES_PER_YEAR = 365 * 24 * 60
+HORIZON = 60
+
+
+def synthetic_year(seed=0):
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(MINUTES_PER_YEAR)
+    hours = minutes / 60.0
+    daily = 15 * np.sin(2 * np.pi * (hours - 8) / 24)
+    weekly = np.where((hours // 24 + 3) % 7 >= 5, -8.0, 0.0)
+    drift = 5 * np.sin(2 * np.pi * minutes / MINUTES_PER_YEAR)
+    return minutes * 60.0, 60 + daily + weekly + drift + rng.normal(0, 2, MINUTES_PER_YEAR)
+
+
+def main():
+    timestamps, loads = synthetic_year()
+    forecaster = LoadForecaster()
+    ts_list, load_list = timestamps.tolist(), loads.tolist()
+
+    errors, naive = [], []
+    start = time.perf_counter()
+    for i, (ts, value) in enumerate(zip(ts_list, load_list)):
+        forecaster.update(ts, value)
+        if i > 14 * 1440 and i % 997 == 0 and i + HORIZON < len(load_list):
+            errors.append(abs(forecaster.predict(ts + HORIZON * 60) - load_list[i + HORIZON]))
+            naive.append(abs(value - load_list[i + HORIZON]))
+    elapsed = time.perf_counter() - start
+    # Los errores se muestrean dentro del bucle, así que el coste por lectura está ligeramente sobreestimado.
+    print(f"{len(load_list)} lecturas en {elapsed:.2f} s -> {elapsed / len(load_list) * 1e6:.2f} µs/lectura")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        forecaster.forecast(ts_list[-1], HORIZON, 5)
+    print(f"previsión a {HORIZON} min: {(time.perf_counter() - start) * 1000:.3f} µs/previsión")
+    print(f"MAE a {HORIZON} min: {np.mean(errors):.2f} (persistencia: {np.mean(naive):.2f})")
+
+
+if __name__ == "__main__":
+    main()
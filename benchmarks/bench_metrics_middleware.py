@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "libs", "wakanda_common"))
+
+from fastapi import FastAPI
+from wakanda_common.metrics import MetricsMiddleware
+
+
+def build_app(instrumented):
+    app = FastAPI()
+    if instrumented:
+        app.add_middleware(MetricsMiddleware, service="bench")
+
+    @app.get("/drones/{drone_id}")
+    async def get_drone(drone_id: int):
+        return {"id": drone_id}
+
+    return app
+
+
+async def run(app, requests):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(requests):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/drones/{i % 500}", "raw_path": b"", "root_path": "",
+            "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    requests = 20000
+    bare, instrumented = build_app(False), build_app(True)
+    asyncio.run(run(bare, 1000))
+    asyncio.run(run(instrumented, 1000))
+    base, timed = [], []
+    for _ in range(7):
+        base.append(asyncio.run(run(bare, requests)))
+        timed.append(asyncio.run(run(instrumented, requests)))
+    base, timed = sorted(base)[3], sorted(timed)[3]
+    print(f"sin middleware: {base * 1e6:.1f} µs/petición")
+    print(f"con middleware: {timed * 1e6:.1f} µs/petición (+{(timed - base) * 1e6:.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
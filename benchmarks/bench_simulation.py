@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "libs", "wakanda_common"))
+
+from wakanda_common.simulation import SimulationEngine
+
+
+def bench(size, ticks=20):
+    engine = SimulationEngine(size, seed=42)
+    engine.add_flag("active", active=0.65)
+    engine.add_field("speed_kmh", 200, 800, common=60)
+    engine.add_field("separation_m", 20, 500, common=40)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        engine.advance(1.0)
+    tick_ms = (time.perf_counter() - start) / ticks * 1000
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        engine.count("active")
+        engine.mean("speed_kmh", where="active")
+    snapshot_ms = (time.perf_counter() - start) / ticks * 1000
+    print(f"{size:>9} entidades | tick {tick_ms:8.2f} ms | snapshot {snapshot_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    for size in (1_000, 10_000, 100_000, 1_000_000):
+        bench(size)
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.gestion_trafico.app.spatial import DroneTracker
+
+SIZE_M = 50_000
+QUERIES = 2_000
+
+
+def timed(label, fn, points):
+    start = time.perf_counter()
+    for x, y in points:
+        fn(x, y)
+    print(f"{label:<28} {(time.perf_counter() - start) / len(points) * 1e6:9.1f} µs/consulta")
+
+
+def main(drones=100_000):
+    tracker = DroneTracker(drones, SIZE_M, SIZE_M, 500, seed=1, clock=lambda: 0.0)
+    index = tracker.index
+    rng = np.random.default_rng(2)
+    points = rng.uniform(0, SIZE_M, (QUERIES, 2)).tolist()
+    print(f"{drones} drones, rejilla {index.cols}x{index.rows}")
+
+    timed("k-nearest (k=10)", lambda x, y: index.nearest(x, y, 10), points)
+    timed("radio 1 km", lambda x, y: index.radius(x, y, 1000), points)
+    timed("corredor 2x0.5 km", lambda x, y: index.bbox(x, y, x + 2000, y + 500), points)
+    timed("k-nearest escaneo lineal", lambda x, y: np.argpartition(np.hypot(index.x - x, index.y - y), 10)[:10],
+          points[:200])
+
+    speeds = np.full(drones, 520.0)
+    start = time.perf_counter()
+    moved = tracker.advance(1.0, speeds)
+    print(f"tick de 1 s: {(time.perf_counter() - start) * 1000:.1f} ms ({moved} cambios de celda)")
+    start = time.perf_counter()
+    index.heatmap()
+    print(f"heatmap: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.gestion_residuos.app.routing import BinRegistry, RoutePlanner
+
+
+def main():
+    city = 20000
+    print(f"{'contenedores':>12} {'camiones':>9} {'depósitos':>10} {'registro':>10} {'plan':>10} {'km':>9} {'pendientes':>11}")
+    for bins, trucks, depots, workers in ((500, 10, 1, 1), (2000, 30, 1, 1), (5000, 60, 1, 1), (5000, 60, 4, 1),
+                                          (5000, 60, 4, 4)):
+        rng = np.random.default_rng(bins)
+        registry = BinRegistry()
+        start = time.perf_counter()
+        registry.load([f"B{i:05d}" for i in range(bins)], rng.uniform(0, city, bins), rng.uniform(0, city, bins),
+                      rng.uniform(20, 100, bins))
+        load_ms = (time.perf_counter() - start) * 1000
+
+        sites = rng.uniform(0, city, (depots, 2))
+        fleet = [{"id": f"D{d}", "x": x, "y": y, "trucks": [40000] * (trucks // depots)}
+                 for d, (x, y) in enumerate(sites)]
+        planner = RoutePlanner(registry, workers=workers)
+        plan = planner.plan(fleet, min_fill_pct=60, time_limit=2.0)
+        planner.close()
+        km = sum(d["distance_m"] for d in plan["depots"]) / 1000
+        label = f"{depots}x{workers}p"
+        print(f"{bins:>12} {trucks:>9} {label:>10} {load_ms:>8.1f}ms {plan['elapsed_ms']:>8.1f}ms "
+              f"{km:>9.1f} {plan['pending_bins']:>11}")
+
+    start = time.perf_counter()
+    for i in range(200):
+        registry.upsert(f"N{i}", rng.uniform(0, city), rng.uniform(0, city), 80)
+    for i in range(200):
+        registry.remove(f"N{i}")
+    print(f"alta+baja incremental: {(time.perf_counter() - start) / 200 * 1e6:.1f} µs/contenedor")
+
+
+if __name__ == "__main__":
+    main()
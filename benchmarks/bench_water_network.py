@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.gestion_agua.app.network import PipeNetwork
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'uniones':>8} {'factorizar':>12} {'resolver':>10} {'demanda':>10} {'válvula':>10}")
+    for side in (30, 60, 120, 240, 400):
+        start = time.perf_counter()
+        network = PipeNetwork.grid(side, seed=1)
+        factor_ms = (time.perf_counter() - start) * 1000
+
+        network.pressures()
+        solve_ms = network.solve_seconds * 1000
+
+        network.set_demand(int(rng.integers(1, side * side - 1)), 0.05)
+        network.pressures()
+        demand_ms = network.solve_seconds * 1000
+
+        start = time.perf_counter()
+        network.set_valve(int(rng.integers(len(network.pipes))), False)
+        network.pressures()
+        valve_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{side * side:>8} {factor_ms:>10.1f}ms {solve_ms:>8.2f}ms {demand_ms:>8.2f}ms {valve_ms:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
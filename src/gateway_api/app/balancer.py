@@ -0,0 +1,245 @@
+import time
+import random
+import asyncio
+import logging
+import httpx
+
+logger = logging.getLogger("WakandaGateway")
+
+
+class Endpoint:
+    __slots__ = ("host", "port", "outstanding", "failures", "ejections", "ejected_until", "warm_from")
+
+    def __init__(self, host, port, now):
+        self.host = host
+        self.port = port
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.warm_from = now
+
+    def weight(self, now, slow_start):
+        """
+        Peso de 0.1 a 1 mientras calienta tras entrar (o volver) al grupo
+        """
+        if slow_start <= 0:
+            return 1.0
+        return min(1.0, max(0.1, (now - self.warm_from) / slow_start))
+
+    def __repr__(self):
+        return f"{self.host}:{self.port}"
+
+
+class Upstream:
+    """
+    Pods de un servicio y elección del siguiente: menos peticiones en curso
+    ("least") o la mejor de dos al azar ("p2c"), ponderando por el
+    calentamiento. Tras `max_failures` fallos seguidos un pod se expulsa
+    durante `ejection_time` segundos (el doble en cada expulsión, hasta
+    `max_ejection_time`) y vuelve con arranque lento.
+    """
+
+    def __init__(self, name, addresses, strategy="p2c", max_failures=5, ejection_time=10.0,
+                 max_ejection_time=300.0, slow_start=30.0, clock=time.monotonic, rng=None):
+        self.name = name
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.slow_start = slow_start
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.endpoints = {}
+        # Los pods del arranque no pasan por el calentamiento
+        self.update(addresses, warm=True)
+
+    def update(self, addresses, warm=False):
+        now = self.clock()
+        current = {}
+        for host, port in addresses:
+            endpoint = self.endpoints.get((host, port))
+            if endpoint is None:
+                endpoint = Endpoint(host, port, now - self.slow_start if warm else now)
+            current[(host, port)] = endpoint
+        self.endpoints = current
+
+    def available(self, now):
+        healthy = [e for e in self.endpoints.values() if e.ejected_until <= now]
+        # Con todos expulsados se reparte entre todos antes que no responder
+        return healthy or list(self.endpoints.values())
+
+    def score(self, endpoint, now):
+        return (endpoint.outstanding + 1) / endpoint.weight(now, self.slow_start)
+
+    def pick(self):
+        now = self.clock()
+        candidates = self.available(now)
+        if len(candidates) == 1:
+            chosen = candidates[0]
+        elif self.strategy == "least":
+            chosen = min(candidates, key=lambda e: (self.score(e, now), self.rng.random()))
+        else:
+            a, b = self.rng.sample(candidates, 2)
+            chosen = a if self.score(a, now) <= self.score(b, now) else b
+        chosen.outstanding += 1
+        return chosen
+
+    def release(self, endpoint, ok):
+        """
+        `ok=None`: la petición no llegó a un resultado (cancelada) y solo se
+        descuenta
+        """
+        endpoint.outstanding -= 1
+        if ok is None:
+            return
+        now = self.clock()
+        if ok:
+            endpoint.failures = 0
+            if endpoint.weight(now, self.slow_start) >= 1.0:
+                endpoint.ejections = 0
+            return
+        endpoint.failures += 1
+        if endpoint.failures >= self.max_failures and endpoint.ejected_until <= now:
+            endpoint.ejections += 1
+            duration = min(self.max_ejection_time, self.ejection_time * 2 ** (endpoint.ejections - 1))
+            endpoint.ejected_until = endpoint.warm_from = now + duration
+            endpoint.failures = 0
+            logger.warning(f"{self.name}: {endpoint} expulsado {duration:.0f}s tras fallos seguidos")
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """
+    Cuerpo de la respuesta que libera el pod al terminar de leerse
+    """
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+
+class BalancedTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte httpx compartido por todos los clientes del gateway: un único
+    pool de conexiones reutilizables y, para los servicios registrados, reparto
+    de cada petición entre sus pods. Las URLs de otros hosts pasan sin cambios.
+
+    Los clientes pueden cerrarse (`async with`) sin cerrar el pool; se cierra
+    con `close()`.
+    """
+
+    def __init__(self, transport=None, **options):
+        self.transport = transport or httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50))
+        self.options = options
+        self.upstreams = {}
+
+    def add(self, base_url, addresses=None):
+        """
+        Registra un servicio por su URL base; sin direcciones, la propia URL es
+        el único destino hasta que el descubrimiento aporte los pods.
+        """
+        url = httpx.URL(base_url)
+        key = (url.host, url.port or 80)
+        upstream = Upstream(url.host, addresses or [key], **self.options)
+        self.upstreams[key] = upstream
+        return upstream
+
+    async def handle_async_request(self, request):
+        upstream = self.upstreams.get((request.url.host, request.url.port or 80))
+        if upstream is None:
+            return await self.transport.handle_async_request(request)
+
+        endpoint = upstream.pick()
+        request.url = request.url.copy_with(host=endpoint.host, port=endpoint.port)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            upstream.release(endpoint, ok=False)
+            raise
+        except BaseException:
+            # Cancelada desde fuera: el pod no ha fallado
+            upstream.release(endpoint, ok=None)
+            raise
+        ok = response.status_code < 500
+        if response.is_closed:
+            upstream.release(endpoint, ok)
+        else:
+            response.stream = _ReleasingStream(response.stream, lambda: upstream.release(endpoint, ok))
+        return response
+
+    async def __aexit__(self, exc_type=None, exc_value=None, traceback=None):
+        pass
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        await self.transport.aclose()
+
+
+def parse_endpoints(value):
+    """
+    "10.1.0.5:8000,10.1.0.6:8000" -> [("10.1.0.5", 8000), ("10.1.0.6", 8000)]
+    """
+    endpoints = []
+    for item in value.split(","):
+        item = item.strip().removeprefix("http://")
+        if item:
+            host, _, port = item.rpartition(":")
+            endpoints.append((host, int(port)))
+    return endpoints
+
+
+class KubernetesDiscovery:
+    """
+    Direcciones listas de los pods de un Service según su objeto Endpoints.
+    """
+
+    def __init__(self, namespace="default"):
+        self.namespace = namespace
+        self.api = None
+
+    def addresses(self, service, port):
+        if self.api is None:
+            from kubernetes import client, config
+            try:
+                config.load_incluster_config()
+            except Exception:
+                config.load_kube_config()
+            self.api = client.CoreV1Api()
+        found = []
+        for subset in self.api.read_namespaced_endpoints(service, self.namespace).subsets or []:
+            ports = [p.port for p in subset.ports or []]
+            target = port if port in ports or not ports else ports[0]
+            found += [(address.ip, target) for address in subset.addresses or []]
+        return found
+
+
+async def discover(transport, discovery, interval=10.0):
+    """
+    Refresca periódicamente los pods de cada servicio registrado. Si el
+    descubrimiento falla o no devuelve nada, se mantienen los actuales.
+    """
+    while True:
+        for (host, port), upstream in list(transport.upstreams.items()):
+            try:
+                addresses = await asyncio.to_thread(discovery.addresses, host, port)
+            except Exception as e:
+                logger.warning(f"Descubrimiento de {host} fallido: {e}")
+                continue
+            if addresses:
+                upstream.update(addresses)
+        await asyncio.sleep(interval)
@@ -0,0 +1,192 @@
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+import httpx
+from prometheus_client import Counter, Gauge
+from .balancer import _ReleasingStream
+
+logger = logging.getLogger("WakandaGateway")
+
+BULKHEAD_LIMIT = Gauge("wakanda_bulkhead_limit", "Límite de concurrencia actual por servicio de origen",
+                       ["upstream"], multiprocess_mode="liveall")
+BULKHEAD_IN_FLIGHT = Gauge("wakanda_bulkhead_in_flight", "Peticiones en curso por servicio de origen",
+                           ["upstream"], multiprocess_mode="livesum")
+BULKHEAD_LIMIT_CHANGES = Counter("wakanda_bulkhead_limit_changes_total", "Cambios del límite de concurrencia",
+                                 ["upstream", "direction"])
+BULKHEAD_REJECTED = Counter("wakanda_bulkhead_rejected_total", "Peticiones rechazadas por el bulkhead",
+                            ["upstream", "reason"])
+
+
+class BulkheadFull(Exception):
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} saturado")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class AdaptiveLimit:
+    """
+    Límite AIMD guiado por la latencia: sube 1 por cada "límite" respuestas
+    rápidas con el límite casi agotado y baja un `backoff` ante un error o una
+    latencia por encima de `tolerance` veces la de referencia (la mínima
+    reciente, que se olvida poco a poco para seguir cambios del servicio).
+    """
+
+    def __init__(self, initial=20, min_limit=2, max_limit=200, tolerance=2.0, backoff=0.9,
+                 min_latency=0.005, clock=time.monotonic):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.min_latency = min_latency
+        self.clock = clock
+        self.baseline = None
+        self.latency = None
+        self.last_decrease = 0.0
+
+    def sample(self, latency, ok, in_flight):
+        """
+        Devuelve +1/-1 si el límite entero cambia, 0 si no
+        """
+        before = int(self.limit)
+        self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline *= 1.001
+        target = max(self.min_latency, self.baseline * self.tolerance)
+        now = self.clock()
+        if not ok or latency > target:
+            # Una bajada por "ronda" de latencia: las respuestas lentas de la
+            # misma ráfaga no hunden el límite de golpe
+            if now - self.last_decrease >= latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+        elif in_flight >= self.limit - 1:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        after = int(self.limit)
+        return (after > before) - (after < before)
+
+
+class Bulkhead:
+    """
+    Compartimento de concurrencia de un servicio de origen: como mucho
+    `limit` peticiones en curso y una cola acotada en tamaño y en tiempo de
+    espera. Lo que no cabe falla enseguida con BulkheadFull.
+    """
+
+    def __init__(self, name, limit=None, queue_timeout=0.5, max_queue=50, clock=time.monotonic):
+        self.name = name
+        self.limit = limit or AdaptiveLimit(clock=clock)
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.clock = clock
+        self.in_flight = 0
+        self.waiters = deque()
+        self.limit_gauge = BULKHEAD_LIMIT.labels(name)
+        self.in_flight_gauge = BULKHEAD_IN_FLIGHT.labels(name)
+        self.limit_gauge.set(int(self.limit.limit))
+
+    def retry_after(self):
+        latency = self.limit.latency or self.queue_timeout
+        return max(1, math.ceil(latency * (len(self.waiters) + 1) / max(1, int(self.limit.limit))))
+
+    def reject(self, reason):
+        BULKHEAD_REJECTED.labels(self.name, reason).inc()
+        raise BulkheadFull(self.name, self.retry_after())
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit.limit) and not self.waiters:
+            self.in_flight += 1
+            self.in_flight_gauge.inc()
+            return
+        if len(self.waiters) >= self.max_queue:
+            self.reject("cola_llena")
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.reject("espera_agotada")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def _abandon(self, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # El hueco llegó justo al rendirse: se devuelve
+            self.release(None, True)
+        else:
+            waiter.cancel()
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def release(self, latency, ok):
+        if latency is not None:
+            change = self.limit.sample(latency, ok, self.in_flight)
+            if change:
+                self.limit_gauge.set(int(self.limit.limit))
+                BULKHEAD_LIMIT_CHANGES.labels(self.name, "up" if change > 0 else "down").inc()
+        # El hueco pasa directamente al siguiente en la cola si cabe
+        while self.waiters and self.in_flight <= int(self.limit.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+        self.in_flight_gauge.dec()
+
+
+class BulkheadTransport(httpx.AsyncBaseTransport):
+    """
+    Envuelve el transporte del gateway con un Bulkhead por host de origen
+    (servicios internos y APIs externas por separado).
+    """
+
+    def __init__(self, transport, **options):
+        self.transport = transport
+        self.options = options
+        self.bulkheads = {}
+
+    def bulkhead(self, host):
+        bulkhead = self.bulkheads.get(host)
+        if bulkhead is None:
+            options = dict(self.options)
+            limit = AdaptiveLimit(**options.pop("limit", {}))
+            bulkhead = self.bulkheads[host] = Bulkhead(host, limit, **options)
+        return bulkhead
+
+    async def handle_async_request(self, request):
+        bulkhead = self.bulkhead(request.url.host)
+        await bulkhead.acquire()
+        start = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            bulkhead.release(time.monotonic() - start, False)
+            raise
+        except BaseException:
+            # Cancelada desde fuera (cliente desconectado...): se devuelve el
+            # hueco sin tomarla como muestra de latencia
+            bulkhead.release(None, True)
+            raise
+        ok = response.status_code < 500
+        if response.is_closed:
+            bulkhead.release(time.monotonic() - start, ok)
+        else:
+            response.stream = _ReleasingStream(response.stream,
+                                               lambda: bulkhead.release(time.monotonic() - start, ok))
+        return response
+
+    async def __aexit__(self, exc_type=None, exc_value=None, traceback=None):
+        pass
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        await self.transport.close()
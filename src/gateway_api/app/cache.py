@@ -0,0 +1,138 @@
+import json
+import time
+import asyncio
+from typing import NamedTuple
+
+
+class Snapshot(NamedTuple):
+    """
+    Respuesta de un servicio tal como se guarda (y se comparte) en la caché
+    """
+    content: bytes
+    status_code: int
+    headers: dict
+
+    @classmethod
+    def of(cls, response):
+        return cls(response.content, response.status_code,
+                   {"content-type": response.headers.get("content-type", "application/json")})
+
+    def dumps(self):
+        return json.dumps([self.status_code, self.headers]).encode() + b"\n" + self.content
+
+    @classmethod
+    def loads(cls, data):
+        head, _, content = data.partition(b"\n")
+        status_code, headers = json.loads(head)
+        return cls(content, status_code, headers)
+
+
+class MicroCache:
+    """
+    Caché de vida corta por clave. Dentro del TTL se sirve el valor guardado;
+    al caducar, un único refresco por clave va al origen y las peticiones
+    concurrentes esperan a ese mismo refresco.
+
+    El último valor bueno se conserva hasta `max_stale` segundos: si el origen
+    falla (excepción o valor no válido) se devuelve marcado como obsoleto.
+
+    Con `shared` (un backend de estado) los valores buenos se publican para las
+    demás réplicas, y un refresco mira primero si otra réplica ya tiene uno
+    dentro del TTL. Los valores deben tener `dumps()` y `codec.loads()`.
+    """
+
+    def __init__(self, ttl=1.0, max_stale=600.0, clock=time.time, shared=None, codec=Snapshot, prefix="cache:"):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.clock = clock
+        self.shared = shared
+        self.codec = codec
+        self.prefix = prefix
+        self.entries = {}
+        self.inflight = {}
+
+    def last_good(self, key):
+        """
+        (valor, edad) del último valor bueno si no supera `max_stale`
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        age = self.clock() - entry[0]
+        if age > self.max_stale:
+            del self.entries[key]
+            return None
+        return entry[1], age
+
+    async def get(self, key, fetch, valid=lambda value: True):
+        """
+        Devuelve (valor, edad, obsoleto). Sin valor bueno que servir, propaga
+        la excepción del origen o devuelve su respuesta no válida.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry[0]
+            if age < self.ttl:
+                return entry[1], age, False
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self._refresh(key, fetch, valid))
+        # shield: si un cliente se desconecta, el refresco sigue para los demás
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key, fetch, valid):
+        try:
+            if await self._adopt_shared(key):
+                stored_at, value = self.entries[key]
+                age = self.clock() - stored_at
+                if age < self.ttl:
+                    return value, age, False
+            value = await fetch()
+        except Exception:
+            cached = self.last_good(key)
+            if cached is None:
+                raise
+            return cached[0], cached[1], True
+        finally:
+            self.inflight.pop(key, None)
+        if valid(value):
+            stored_at = self.clock()
+            self.entries[key] = (stored_at, value)
+            await self._publish(key, stored_at, value)
+            return value, 0.0, False
+        cached = self.last_good(key)
+        if cached is None:
+            return value, 0.0, False
+        return cached[0], cached[1], True
+
+    async def _adopt_shared(self, key):
+        """
+        Toma el valor de otra réplica si es más reciente que el local
+        """
+        if self.shared is None:
+            return False
+        try:
+            data = await self.shared.get(self.prefix + key)
+        except Exception:
+            return False
+        if data is None:
+            return False
+        stamp, _, payload = data.partition(b" ")
+        stored_at = float(stamp)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] >= stored_at:
+            return False
+        self.entries[key] = (stored_at, self.codec.loads(payload))
+        return True
+
+    async def _publish(self, key, stored_at, value):
+        if self.shared is None:
+            return
+        try:
+            await self.shared.set(self.prefix + key, repr(stored_at).encode() + b" " + value.dumps(),
+                                  ttl=self.max_stale)
+        except Exception:
+            pass
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,134 @@
+import gzip
+import hashlib
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+NOT_MODIFIED_DROP = ("content-length", "content-type", "content-encoding")
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    Codificación que prefiere el cliente (Accept-Encoding con valores q) entre
+    las que ofrece el servidor; en empate gana el orden de `encodings`.
+    """
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.partition(";")
+        token = token.strip()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+class CompressionMiddleware:
+    """
+    Comprime (br o gzip, según el cliente) las respuestas completas a partir de
+    `minimum_size` bytes y añade un ETag calculado sobre el contenido, de modo
+    que un GET con If-None-Match igual recibe 304 sin cuerpo.
+
+    Las respuestas en streaming (SSE) y las que ya traen Content-Encoding pasan
+    sin tocar.
+    """
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4, etag=True):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.etag = etag
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        conditional = scope["method"] in ("GET", "HEAD") and self.etag
+        start = None
+        chunks = []
+        streaming = False
+
+        async def buffered_send(message):
+            nonlocal start, streaming
+            if streaming:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                if message.get("more_body", False) and not chunks:
+                    streaming = True
+                    await send(start)
+                    await send(message)
+                    return
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await self.respond(start, b"".join(chunks), request_headers, conditional, send)
+            else:
+                await send(message)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def respond(self, start, body, request_headers, conditional, send):
+        headers = MutableHeaders(raw=list(start["headers"]))
+        status = start["status"]
+        if "content-encoding" in headers:
+            await self.send(send, status, headers, body)
+            return
+
+        if conditional and status == 200:
+            etag = headers.get("etag")
+            if etag is None:
+                etag = headers["etag"] = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            if "cache-control" not in headers:
+                headers["cache-control"] = "no-cache"
+            if_none_match = request_headers.get("if-none-match")
+            if if_none_match and etag_matches(if_none_match, etag):
+                for name in NOT_MODIFIED_DROP:
+                    del headers[name]
+                await self.send(send, 304, headers, b"")
+                return
+
+        if len(body) >= self.minimum_size and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+            headers.add_vary_header("Accept-Encoding")
+            encoding = negotiate(request_headers.get("accept-encoding", ""), self.encodings)
+            if encoding is not None:
+                body = self.compress(body, encoding)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+        await self.send(send, status, headers, body)
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    @staticmethod
+    async def send(send, status, headers, body):
+        await send({"type": "http.response.start", "status": status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,118 @@
+import asyncio
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+class PokemonCard(NamedTuple):
+    """
+    Los campos que usa el frontend de un detalle de PokeAPI (el original pesa
+    cientos de KB)
+    """
+    id: int
+    name: str
+    image: str
+    types: tuple
+    height: int
+    weight: int
+    abilities: tuple
+
+    @classmethod
+    def of(cls, data):
+        return cls(
+            data["id"],
+            data["name"],
+            data["sprites"]["other"]["official-artwork"]["front_default"],
+            tuple(t["type"]["name"] for t in data["types"]),
+            data["height"],
+            data["weight"],
+            tuple(a["ability"]["name"] for a in data["abilities"]),
+        )
+
+    def as_dict(self):
+        card = self._asdict()
+        card["types"], card["abilities"] = list(self.types), list(self.abilities)
+        return card
+
+
+class LRUCache:
+    def __init__(self, maxsize=2048):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class PokemonGallery:
+    """
+    Páginas del catálogo con el detalle reducido de cada Pokémon. Los
+    detalles que faltan se piden a la vez (como mucho `concurrency` en curso)
+    y las fichas y páginas se guardan en un LRU: los datos de PokeAPI no
+    cambian, así que no caducan.
+
+    `fetch(url)` devuelve el JSON de PokeAPI o None si no existe.
+    """
+
+    def __init__(self, base_url, fetch, concurrency=8, maxsize=2048):
+        self.base_url = base_url
+        self.fetch = fetch
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = LRUCache(maxsize)
+        self.inflight = {}
+
+    async def card(self, key):
+        """
+        Ficha por id o nombre; varias peticiones de la misma ficha comparten
+        una sola descarga
+        """
+        key = str(key).lower()
+        card = self.cache.get(key)
+        if card is not None:
+            return card
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self._load(key))
+        return await asyncio.shield(task)
+
+    async def _load(self, key):
+        try:
+            async with self.semaphore:
+                data = await self.fetch(f"{self.base_url}/{key}")
+        finally:
+            self.inflight.pop(key, None)
+        if data is None:
+            return None
+        card = PokemonCard.of(data)
+        self.cache.put(str(card.id), card)
+        self.cache.put(card.name, card)
+        return card
+
+    async def page(self, offset=0, limit=20):
+        listing = self.cache.get(("page", offset, limit))
+        if listing is None:
+            data = await self.fetch(f"{self.base_url}?offset={offset}&limit={limit}")
+            if data is None:
+                return None
+            listing = (data["count"], tuple(item["name"] for item in data["results"]))
+            self.cache.put(("page", offset, limit), listing)
+        count, names = listing
+        cards = await asyncio.gather(*(self.card(name) for name in names), return_exceptions=True)
+        return {
+            "count": count,
+            "offset": offset,
+            "limit": limit,
+            "results": [card.as_dict() for card in cards if isinstance(card, PokemonCard)],
+            "missing": [name for name, card in zip(names, cards) if not isinstance(card, PokemonCard)],
+        }
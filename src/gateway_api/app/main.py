@@ -1,17 +1,46 @@
 import os
+import json
 import httpx
+import asyncio
 import random
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
-from kubernetes import client, config
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from wakanda_common.responses import JSONResponse, json_response
+from wakanda_common.metrics import MetricsMiddleware, metrics_app
+from wakanda_common.tracing import TRACER, TracingMiddleware, critical_path
+from wakanda_common.profiling import profile_response
 from .resilience import fetch_from_service, post_to_service
+from .compression import CompressionMiddleware
+from .cache import MicroCache, Snapshot
+from .state import create_backend, SharedCounter, CountRequests
+from .balancer import BalancedTransport, KubernetesDiscovery, discover, parse_endpoints
+from .bulkhead import BulkheadTransport, BulkheadFull
+from .stream import SnapshotHub
+from .tracing import TracingTransport
+from .rollout import KubernetesDeployments, RolloutManager
+from .gallery import PokemonGallery
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("WakandaGateway")
 
-app = FastAPI(title="Wakanda API Gateway")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(sync_state())]
+    if UPSTREAM_DISCOVERY == "kubernetes":
+        tasks.append(asyncio.create_task(discover(BALANCER, KubernetesDiscovery(), DISCOVERY_INTERVAL)))
+    yield
+    for task in tasks + list(ROLLOUTS.tasks.values()):
+        task.cancel()
+    STATUS_HUB.stop()
+    await UPSTREAMS.close()
+
+
+app = FastAPI(title="Wakanda API Gateway", lifespan=lifespan, default_response_class=JSONResponse)
 
 TRAFFIC_SERVICE_URL = os.getenv("TRAFFIC_SERVICE_URL", "http://gestion_trafico:8000")
 ENERGY_SERVICE_URL = os.getenv("ENERGY_SERVICE_URL", "http://gestion_energia:8000")
@@ -21,13 +50,67 @@ SECURITY_SERVICE_URL = os.getenv("SECURITY_SERVICE_URL", "http://seguridad_vigil
 USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://gestion-usuarios:8000")
 PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus:9090")
 
+# Reparto entre pods: "static" usa <SERVICIO>_SERVICE_ENDPOINTS ("ip:puerto,...")
+# si existe; "kubernetes" los lee del objeto Endpoints de cada Service
+UPSTREAM_DISCOVERY = os.getenv("UPSTREAM_DISCOVERY", "static")
+DISCOVERY_INTERVAL = float(os.getenv("DISCOVERY_INTERVAL", "10"))
+BALANCER = BalancedTransport(
+    strategy=os.getenv("BALANCER_STRATEGY", "p2c"),
+    max_failures=int(os.getenv("BALANCER_MAX_FAILURES", "5")),
+    ejection_time=float(os.getenv("BALANCER_EJECTION_SECONDS", "10")),
+    slow_start=float(os.getenv("BALANCER_SLOW_START_SECONDS", "30")),
+)
+SERVICE_URLS = {
+    "TRAFFIC": TRAFFIC_SERVICE_URL, "ENERGY": ENERGY_SERVICE_URL, "WATER": WATER_SERVICE_URL,
+    "WASTE": WASTE_SERVICE_URL, "SECURITY": SECURITY_SERVICE_URL, "USERS": USERS_SERVICE_URL,
+}
+for name, url in SERVICE_URLS.items():
+    endpoints = os.getenv(f"{name}_SERVICE_ENDPOINTS")
+    BALANCER.add(url, parse_endpoints(endpoints) if endpoints else None)
+
+# Bulkhead por host de origen: límite de concurrencia adaptativo y cola corta.
+# El span de cada llamada incluye la espera en el bulkhead
+UPSTREAMS = TracingTransport(BulkheadTransport(
+    BALANCER,
+    queue_timeout=float(os.getenv("BULKHEAD_QUEUE_TIMEOUT", "0.5")),
+    max_queue=int(os.getenv("BULKHEAD_MAX_QUEUE", "50")),
+    limit={
+        "initial": int(os.getenv("BULKHEAD_INITIAL_LIMIT", "20")),
+        "min_limit": int(os.getenv("BULKHEAD_MIN_LIMIT", "2")),
+        "max_limit": int(os.getenv("BULKHEAD_MAX_LIMIT", "200")),
+    },
+))
+
 SECRET_CLUB_API_URL = "https://rickandmortyapi.com/api/character"
 POKEMON_API_URL = "https://pokeapi.co/api/v2/pokemon"
 HARRY_POTTER_API_URL = "https://hp-api.onrender.com/api/characters"
+GALLERY_MAX_LIMIT = 50
 
+# Marcas de reinicio (locales y de otras réplicas). Las de los reinicios de
+# esta réplica se renuevan mientras el despliegue sigue en curso y se borran al
+# terminar; una marca sin renovar caduca a los RESTART_DURATION segundos
 restarting_services = {}
 RESTART_DURATION = 10
 
+KUBE = KubernetesDeployments(os.getenv("K8S_NAMESPACE", "default"))
+
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "2.0"))
+STREAM_KEEPALIVE = 15
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# memory:// vale para una réplica; con varias, redis://... para compartir estado
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "memory://")
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "1.0"))
+STATE = create_backend(STATE_BACKEND_URL, local_ttl=float(os.getenv("STATE_LOCAL_TTL", "0.5")))
+REQUEST_RATE = SharedCounter(STATE, "requests", window=10)
+
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "1.0"))
+STATUS_MAX_STALE = float(os.getenv("STATUS_MAX_STALE", "600"))
+STATUS_CACHE = MicroCache(ttl=STATUS_CACHE_TTL, max_stale=STATUS_MAX_STALE, shared=STATE)
+
 origins = ["http://localhost:30000", "http://localhost:5173", "http://localhost:3000", "http://127.0.0.1:30000", "*"]
 
 app.add_middleware(
@@ -37,9 +120,72 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES,
+                   gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY)
+app.add_middleware(CountRequests, counter=REQUEST_RATE)
+app.add_middleware(MetricsMiddleware, service="gateway_api")
+app.add_middleware(TracingMiddleware, service="gateway_api")
+app.mount("/metrics", metrics_app())
+
+
+@app.exception_handler(BulkheadFull)
+async def bulkhead_full(request: Request, exc: BulkheadFull):
+    return JSONResponse({"detail": f"Servicio saturado: {exc.upstream}"}, status_code=503,
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+def rollout_changed(name: str, active: bool):
+    if active:
+        restarting_services[name] = datetime.now()
+    else:
+        restarting_services.pop(name, None)
+        asyncio.ensure_future(forget_restart_marker(name))
+
+
+async def forget_restart_marker(name: str):
+    try:
+        await STATE.delete(f"restart:{name}")
+    except Exception as e:
+        logger.warning(f"No se pudo borrar la marca de reinicio de {name}: {e}")
+
+
+ROLLOUTS = RolloutManager(KUBE, concurrency=int(os.getenv("ROLLOUT_CONCURRENCY", "2")),
+                          timeout=float(os.getenv("ROLLOUT_TIMEOUT", "300")), on_change=rollout_changed,
+                          shared=STATE)
+
+
+async def sync_restart_markers():
+    """
+    Publica las marcas de reinicio locales y recoge las de las otras réplicas;
+    check_restart_mode solo lee el dict local.
+    """
+    now = datetime.now()
+    for name in list(ROLLOUTS.rollouts):
+        if ROLLOUTS.in_progress(name):
+            restarting_services[name] = now
+    for name, started in list(restarting_services.items()):
+        remaining = RESTART_DURATION - (now - started).total_seconds()
+        if remaining > 0:
+            await STATE.set(f"restart:{name}", started.timestamp(), ttl=remaining)
+    for key, value in (await STATE.scan("restart:")).items():
+        name, started = key[len("restart:"):], datetime.fromtimestamp(float(value))
+        if name not in restarting_services or restarting_services[name] < started:
+            restarting_services[name] = started
+
+
+async def sync_state():
+    while True:
+        try:
+            await sync_restart_markers()
+            await REQUEST_RATE.flush()
+        except Exception as e:
+            logger.warning(f"Sincronización de estado fallida: {e}")
+        await asyncio.sleep(STATE_SYNC_INTERVAL)
 
 
 def check_restart_mode(service_name: str):
+    if ROLLOUTS.in_progress(service_name):
+        return True
     if service_name in restarting_services:
         start_time = restarting_services[service_name]
         if datetime.now() - start_time < timedelta(seconds=RESTART_DURATION):
@@ -54,88 +200,191 @@ async def root():
     return {"message": "Wakanda OS Gateway Online", "status": "OK"}
 
 
+def relay(upstream):
+    """
+    Reenvía la respuesta del servicio tal cual (bytes, código y tipo de
+    contenido) sin decodificar el JSON para volver a codificarlo.
+    """
+    return Response(content=upstream.content, status_code=upstream.status_code,
+                    media_type=upstream.headers.get("content-type", "application/json"))
+
+
+def stale_snapshot(upstream, age: float, reason: str):
+    """
+    Último estado bueno del servicio marcado como obsoleto, con su antigüedad.
+    Si no es un objeto JSON se reenvía tal cual, solo con la cabecera Age.
+    """
+    try:
+        body = json.loads(upstream.content)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        response = relay(upstream)
+        response.headers["Age"] = str(int(age))
+        return response
+    body.update({"stale": True, "stale_reason": reason, "age_seconds": round(age, 1)})
+    return JSONResponse(body, status_code=upstream.status_code, headers={"Age": str(int(age))})
+
+
+async def proxy_status(service_name: str, url: str):
+    """
+    Estado de un servicio a través de la microcaché: como mucho una petición al
+    servicio por TTL y, si está caído o reiniciándose, el último estado bueno.
+    """
+    if check_restart_mode(service_name):
+        cached = STATUS_CACHE.last_good(url)
+        if cached is None:
+            return {"status": "RESTARTING"}
+        return stale_snapshot(*cached, "RESTARTING")
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=UPSTREAMS) as client:
+            return Snapshot.of(await fetch_from_service(url, client))
+
+    upstream, age, stale = await STATUS_CACHE.get(url, fetch, valid=lambda r: 200 <= r.status_code < 300)
+    if stale:
+        return stale_snapshot(upstream, age, "ERROR")
+    response = relay(upstream)
+    response.headers["Age"] = str(int(age))
+    return response
+
+
 @app.get("/traffic/status")
 async def proxy_traffic():
-    if check_restart_mode("ms-trafico"):
-        return {"status": "RESTARTING"}
-    async with httpx.AsyncClient() as client:
-        return (await fetch_from_service(f"{TRAFFIC_SERVICE_URL}/traffic/status", client)).json()
+    return await proxy_status("ms-trafico", f"{TRAFFIC_SERVICE_URL}/traffic/status")
 
 
 @app.get("/energy/grid")
 async def proxy_energy():
-    if check_restart_mode("ms-energia"):
-        return {"status": "RESTARTING"}
-    async with httpx.AsyncClient() as client:
-        return (await fetch_from_service(f"{ENERGY_SERVICE_URL}/energy/grid", client)).json()
+    return await proxy_status("ms-energia", f"{ENERGY_SERVICE_URL}/energy/grid")
 
 
 @app.get("/water/pressure")
 async def proxy_water():
-    if check_restart_mode("ms-agua"):
-        return {"status": "RESTARTING"}
-    async with httpx.AsyncClient() as client:
-        return (await fetch_from_service(f"{WATER_SERVICE_URL}/water/pressure", client)).json()
+    return await proxy_status("ms-agua", f"{WATER_SERVICE_URL}/water/pressure")
 
 
 @app.get("/waste/status")
 async def proxy_waste():
-    if check_restart_mode("ms-residuos"):
-        return {"status": "RESTARTING"}
-    async with httpx.AsyncClient() as client:
-        return (await fetch_from_service(f"{WASTE_SERVICE_URL}/waste/status", client)).json()
+    return await proxy_status("ms-residuos", f"{WASTE_SERVICE_URL}/waste/status")
 
 
 @app.get("/security/alerts")
 async def proxy_security():
-    if check_restart_mode("ms-seguridad"):
-        return {"status": "RESTARTING"}
-    async with httpx.AsyncClient() as client:
-        return (await fetch_from_service(f"{SECURITY_SERVICE_URL}/security/alerts", client)).json()
+    return await proxy_status("ms-seguridad", f"{SECURITY_SERVICE_URL}/security/alerts")
+
+
+async def proxy_history(service_url: str, path: str, request: Request):
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
+        return relay(await fetch_from_service(f"{service_url}{path}?{request.url.query}", client))
+
+
+@app.get("/traffic/history")
+async def proxy_traffic_history(request: Request):
+    return await proxy_history(TRAFFIC_SERVICE_URL, "/traffic/history", request)
+
+
+@app.get("/energy/history")
+async def proxy_energy_history(request: Request):
+    return await proxy_history(ENERGY_SERVICE_URL, "/energy/history", request)
+
+
+@app.get("/water/history")
+async def proxy_water_history(request: Request):
+    return await proxy_history(WATER_SERVICE_URL, "/water/history", request)
+
+
+@app.get("/waste/history")
+async def proxy_waste_history(request: Request):
+    return await proxy_history(WASTE_SERVICE_URL, "/waste/history", request)
+
+
+@app.get("/security/history")
+async def proxy_security_history(request: Request):
+    return await proxy_history(SECURITY_SERVICE_URL, "/security/history", request)
+
+
+STATUS_HUB = SnapshotHub({
+    "traffic": proxy_traffic,
+    "energy": proxy_energy,
+    "water": proxy_water,
+    "waste": proxy_waste,
+    "security": proxy_security,
+}, interval=STREAM_INTERVAL)
+
+
+@app.get("/stream/status")
+async def stream_status(request: Request):
+    subscriber = STATUS_HUB.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                chunks = await subscriber.next(STREAM_KEEPALIVE)
+                if not chunks:
+                    yield b": keep-alive\n\n"
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            STATUS_HUB.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.get("/secret-club/roster")
 async def get_rick_roster():
-    async with httpx.AsyncClient() as client:
-        resp = await fetch_from_service(SECRET_CLUB_API_URL, client)
-        return resp.json()
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
+        return relay(await fetch_from_service(SECRET_CLUB_API_URL, client))
 
 
 @app.get("/secret-club/{id}")
 async def get_rick_member(id: int):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await fetch_from_service(f"{SECRET_CLUB_API_URL}/{id}", client)
         if resp.status_code != 200: raise HTTPException(404, "Morty no encontrado")
-        return resp.json()
+        return relay(resp)
 
 
 @app.get("/pokemon/roster")
 async def get_pokemon_roster():
-    async with httpx.AsyncClient() as client:
-        resp = await fetch_from_service(f"{POKEMON_API_URL}?limit=20", client)
-        return resp.json()
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
+        return relay(await fetch_from_service(f"{POKEMON_API_URL}?limit=20", client))
+
+
+async def fetch_pokeapi(url: str):
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
+        resp = await fetch_from_service(url, client)
+    return resp.json() if resp.status_code == 200 else None
+
+
+POKEMON_GALLERY = PokemonGallery(POKEMON_API_URL, fetch_pokeapi,
+                                 concurrency=int(os.getenv("POKEMON_PREFETCH_CONCURRENCY", "8")),
+                                 maxsize=int(os.getenv("POKEMON_CACHE_SIZE", "2048")))
+
+
+@app.get("/pokemon/gallery")
+async def get_pokemon_gallery(offset: int = 0, limit: int = 20):
+    """
+    Una página del catálogo con la ficha de cada Pokémon, en una sola llamada
+    """
+    if offset < 0 or not 1 <= limit <= GALLERY_MAX_LIMIT:
+        raise HTTPException(422, f"offset >= 0 y limit entre 1 y {GALLERY_MAX_LIMIT}")
+    page = await POKEMON_GALLERY.page(offset, limit)
+    if page is None: raise HTTPException(502, "PokeAPI no responde")
+    return json_response(page)
 
 
 @app.get("/pokemon/{id}")
 async def get_pokemon_detail(id: str):
-    async with httpx.AsyncClient() as client:
-        resp = await fetch_from_service(f"{POKEMON_API_URL}/{id}", client)
-        if resp.status_code != 200: raise HTTPException(404, "Pokémon escapó")
-        data = resp.json()
-        return {
-            "id": data["id"],
-            "name": data["name"],
-            "image": data["sprites"]["other"]["official-artwork"]["front_default"],
-            "types": [t["type"]["name"] for t in data["types"]],
-            "height": data["height"],
-            "weight": data["weight"],
-            "abilities": [a["ability"]["name"] for a in data["abilities"]]
-        }
+    card = await POKEMON_GALLERY.card(id)
+    if card is None: raise HTTPException(404, "Pokémon escapó")
+    return card.as_dict()
 
 
 @app.get("/hogwarts/roster")
 async def get_hp_roster():
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await fetch_from_service(HARRY_POTTER_API_URL, client)
         all_chars = resp.json()
         return all_chars[:24]
@@ -143,7 +392,7 @@ async def get_hp_roster():
 
 @app.get("/hogwarts/{id}")
 async def get_hp_detail(id: str):
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await fetch_from_service(HARRY_POTTER_API_URL, client)
         all_chars = resp.json()
         try:
@@ -159,65 +408,85 @@ async def get_hp_detail(id: str):
 async def proxy_register(request: Request):
     form_data = await request.form()
     data = dict(form_data)
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await post_to_service(f"{USERS_SERVICE_URL}/register", data=data, client=client)
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code,
                                                         detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/login")
 async def proxy_login(request: Request):
     form_data = await request.form()
     data = dict(form_data)
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await post_to_service(f"{USERS_SERVICE_URL}/login", data=data, client=client)
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code,
                                                         detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/verify-account")
 async def proxy_verify_account(request: Request):
     form_data = await request.form()
     data = dict(form_data)
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await post_to_service(f"{USERS_SERVICE_URL}/verify-account", data=data, client=client)
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code,
                                                         detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/resend-code")
 async def proxy_resend_code(request: Request):
     form_data = await request.form()
     data = dict(form_data)
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await post_to_service(f"{USERS_SERVICE_URL}/resend-code", data=data, client=client)
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code,
                                                         detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.get("/me")
 async def proxy_users_me(request: Request):
     token = request.headers.get("authorization")
     headers = {"Authorization": token} if token else {}
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
         resp = await client.get(f"{USERS_SERVICE_URL}/me")
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code, detail="No autorizado")
-        return resp.json()
+        return relay(resp)
+
+
+@app.post("/logout")
+async def proxy_logout(request: Request):
+    return await forward_logout("/logout", request)
+
+
+@app.post("/logout/all")
+async def proxy_logout_all(request: Request):
+    return await forward_logout("/logout/all", request)
+
+
+async def forward_logout(path: str, request: Request):
+    token = request.headers.get("authorization")
+    headers = {"Authorization": token} if token else {}
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
+        resp = await client.post(f"{USERS_SERVICE_URL}{path}")
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=resp.status_code, detail=resp.json().get('detail', 'Error'))
+        return relay(resp)
 
 
 @app.get("/users")
 async def proxy_get_all_users(request: Request):
     token = request.headers.get("authorization")
     headers = {"Authorization": token} if token else {}
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
         resp = await client.get(f"{USERS_SERVICE_URL}/users")
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.put("/users/{user_id}")
@@ -225,31 +494,31 @@ async def proxy_update_user(user_id: int, request: Request):
     token = request.headers.get("authorization")
     headers = {"Authorization": token} if token else {}
     body = await request.json()
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
         resp = await client.put(f"{USERS_SERVICE_URL}/users/{user_id}", json=body)
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/recover/request")
 async def proxy_recover_request(request: Request):
     body = await request.json()
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await client.post(f"{USERS_SERVICE_URL}/recover/request", json=body)
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/recover/confirm")
 async def proxy_recover_confirm(request: Request):
     body = await request.json()
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=UPSTREAMS) as client:
         resp = await client.post(f"{USERS_SERVICE_URL}/recover/confirm", json=body)
         if resp.status_code >= 400:
             raise HTTPException(status_code=resp.status_code, detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/clubs/verify")
@@ -257,22 +526,22 @@ async def proxy_club_verify(request: Request):
     token = request.headers.get("authorization")
     headers = {"Authorization": token} if token else {}
     body = await request.json()
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
         resp = await client.post(f"{USERS_SERVICE_URL}/clubs/verify", json=body)
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code,
                                                         detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/me/team")
 async def proxy_change_team(team_id: int, request: Request):
     token = request.headers.get("authorization")
     headers = {"Authorization": token} if token else {}
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
         resp = await client.post(f"{USERS_SERVICE_URL}/me/team", params={"team_id": team_id})
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code,
                                                         detail=resp.json().get('detail', 'Error'))
-        return resp.json()
+        return relay(resp)
 
 
 @app.post("/me/avatar")
@@ -283,47 +552,42 @@ async def proxy_upload_avatar(request: Request):
     file = form.get("file")
     if not file: raise HTTPException(400, "No file uploaded")
     files = {"file": (file.filename, await file.read(), file.content_type)}
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, transport=UPSTREAMS) as client:
         resp = await client.post(f"{USERS_SERVICE_URL}/me/avatar", files=files)
         if resp.status_code >= 400: raise HTTPException(status_code=resp.status_code, detail="Error subiendo imagen")
-        return resp.json()
+        return relay(resp)
 
 
-@app.post("/admin/restart/{service_name}")
-def restart_service(service_name: str):
+@app.post("/admin/restart")
+async def restart_services(request: Request):
+    """
+    Reinicia varios Deployments ({"services": [...]}) con como mucho
+    ROLLOUT_CONCURRENCY a la vez; el progreso se consulta en /admin/restart/status
+    """
     try:
-        restarting_services[service_name] = datetime.now()
-        try:
-            config.load_incluster_config()
-        except:
-            config.load_kube_config()
+        services = (await request.json()).get("services")
+    except Exception:
+        services = None
+    if not services or not all(isinstance(name, str) for name in services):
+        raise HTTPException(status_code=422, detail="Se esperaba {\"services\": [\"deployment\", ...]}")
+    return JSONResponse({"status": "Reiniciando...", "rollouts": await ROLLOUTS.restart(services)}, status_code=202)
 
-        v1 = client.AppsV1Api()
-        deploy = v1.read_namespaced_deployment(name=service_name, namespace="default")
-        current_restarts = int((deploy.metadata.annotations or {}).get("wakanda.os/restarts", "0"))
-        new_count = current_restarts + 1
 
-        patch_body = {
-            "metadata": {"annotations": {"wakanda.os/restarts": str(new_count)}},
-            "spec": {"template": {
-                "metadata": {"annotations": {"kubectl.kubernetes.io/restartedAt": datetime.now().isoformat()}}}}
-        }
-        v1.patch_namespaced_deployment(name=service_name, namespace="default", body=patch_body)
-        return {"status": "Reiniciando...", "restarts": new_count}
-    except Exception as e:
-        return {"status": "Error", "detail": str(e)}
+@app.get("/admin/restart/status")
+async def restart_status():
+    return {"rollouts": await ROLLOUTS.status()}
+
+
+@app.post("/admin/restart/{service_name}")
+async def restart_service(service_name: str):
+    rollout = (await ROLLOUTS.restart([service_name])).get(service_name)
+    return {"status": "Reiniciando...", "rollout": rollout}
 
 
 @app.get("/admin/k8s/info")
 def get_k8s_info():
     try:
-        try:
-            config.load_incluster_config()
-        except:
-            config.load_kube_config()
-
-        core_v1 = client.CoreV1Api()
-        apps_v1 = client.AppsV1Api()
+        apps_v1, core_v1 = KUBE.load()
 
         manual_restarts_map = {
             d.metadata.name: int((d.metadata.annotations or {}).get("wakanda.os/restarts", "0"))
@@ -388,10 +652,60 @@ def get_k8s_info():
         return {"pods": [], "nodes": [], "error": str(e)}
 
 
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """
+    Traza completa: spans del gateway más los que guarda cada servicio, y
+    su camino crítico.
+    """
+    spans = TRACER.spans(trace_id)
+    unavailable = []
+    async with httpx.AsyncClient(timeout=2.0, transport=UPSTREAMS) as client:
+        responses = await asyncio.gather(*(client.get(f"{url}/traces/{trace_id}") for url in SERVICE_URLS.values()),
+                                         return_exceptions=True)
+    for (name, url), resp in zip(SERVICE_URLS.items(), responses):
+        if isinstance(resp, Exception) or resp.status_code != 200:
+            unavailable.append(name.lower())
+            continue
+        spans += resp.json()["spans"]
+    if not spans:
+        raise HTTPException(404, "Traza no encontrada")
+    spans.sort(key=lambda s: s["startTimeUnixNano"])
+    return {"trace_id": trace_id, "spans": spans, "critical_path": critical_path(spans), "unavailable": unavailable}
+
+
+async def require_admin(request: Request):
+    """
+    El gateway no valida tokens: pregunta al servicio de usuarios quién es
+    """
+    token = request.headers.get("authorization")
+    if not token:
+        raise HTTPException(status_code=401, detail="No autorizado")
+    async with httpx.AsyncClient(headers={"Authorization": token}, timeout=5.0, transport=UPSTREAMS) as client:
+        resp = await client.get(f"{USERS_SERVICE_URL}/me")
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=401, detail="No autorizado")
+    if resp.json().get("role") != "ADMIN":
+        raise HTTPException(status_code=403, detail="Requiere privilegios de administrador")
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(seconds: float = 10, interval_ms: float = 5, heap: bool = False, top: int = 20,
+                      idle: bool = False, format: str = "json"):
+    """
+    Perfil por muestreo de este proceso del gateway (ver wakanda_common.profiling)
+    """
+    return await profile_response(seconds, interval_ms, heap, top, idle, format)
+
+
 @app.get("/admin/system/metrics")
 async def get_system_metrics():
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
+        requests_per_sec = round(await REQUEST_RATE.rate(), 2)
+    except Exception:
+        requests_per_sec = 0
+    try:
+        async with httpx.AsyncClient(timeout=2.0, transport=UPSTREAMS) as client:
             cpu = await client.get(f"{PROMETHEUS_URL}/api/v1/query", params={
                 "query": 'sum(rate(container_cpu_usage_seconds_total{namespace="default"}[1m]))'})
             mem = await client.get(f"{PROMETHEUS_URL}/api/v1/query",
@@ -401,7 +715,7 @@ async def get_system_metrics():
                 'result'] else 0
             return {
                 "latency_ms": random.randint(20, 150),
-                "requests_per_sec": random.randint(500, 2000),
+                "requests_per_sec": requests_per_sec,
                 "error_rate_percent": round(random.uniform(0.1, 2.5), 2),
                 "cpu_usage_percent": round(cpu_v, 2),
                 "memory_usage_percent": round(mem_v, 2),
@@ -410,7 +724,7 @@ async def get_system_metrics():
     except:
         return {
             "latency_ms": random.randint(20, 150),
-            "requests_per_sec": random.randint(500, 2000),
+            "requests_per_sec": requests_per_sec,
             "error_rate_percent": round(random.uniform(0.1, 2.5), 2),
             "cpu_usage_percent": random.randint(30, 80),
             "memory_usage_percent": random.randint(40, 75),
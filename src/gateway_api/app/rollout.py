@@ -0,0 +1,291 @@
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+from wakanda_common.tracing import detached
+
+logger = logging.getLogger("WakandaGateway")
+
+RESTARTS_ANNOTATION = "wakanda.os/restarts"
+IN_PROGRESS = ("pendiente", "reiniciando")
+
+
+def rollout_complete(state, generation):
+    """
+    Mismo criterio que `kubectl rollout status`: el controlador vio la nueva
+    generación, todas las réplicas están actualizadas y disponibles y no queda
+    ningún pod antiguo.
+    """
+    return (state["observed_generation"] >= generation
+            and state["updated"] >= state["desired"]
+            and state["current"] <= state["updated"]
+            and state["available"] >= state["updated"])
+
+
+def _snapshot(deploy):
+    status = deploy.status
+    conditions = status.conditions or []
+    return {
+        "generation": deploy.metadata.generation or 0,
+        "observed_generation": status.observed_generation or 0,
+        "desired": deploy.spec.replicas if deploy.spec.replicas is not None else 1,
+        "current": status.replicas or 0,
+        "updated": status.updated_replicas or 0,
+        "ready": status.ready_replicas or 0,
+        "available": status.available_replicas or 0,
+        "restarts": int((deploy.metadata.annotations or {}).get(RESTARTS_ANNOTATION, "0")),
+        "failed": any(c.type == "Progressing" and c.reason == "ProgressDeadlineExceeded" for c in conditions),
+    }
+
+
+class KubernetesDeployments:
+    """
+    Deployments de un namespace a través de un cliente de Kubernetes creado
+    una sola vez. Las llamadas del cliente (bloqueantes) van a hilos aparte.
+    """
+
+    def __init__(self, namespace="default"):
+        self.namespace = namespace
+        self._apps = None
+        self._core = None
+
+    def load(self):
+        if self._apps is None:
+            from kubernetes import client, config
+            try:
+                config.load_incluster_config()
+            except Exception:
+                config.load_kube_config()
+            self._apps, self._core = client.AppsV1Api(), client.CoreV1Api()
+        return self._apps, self._core
+
+    @property
+    def apps(self):
+        return self.load()[0]
+
+    @property
+    def core(self):
+        return self.load()[1]
+
+    async def read(self, name):
+        return _snapshot(await asyncio.to_thread(self.apps.read_namespaced_deployment, name, self.namespace))
+
+    async def restart(self, name):
+        """
+        Cambia la anotación de la plantilla (como `kubectl rollout restart`) y
+        devuelve el estado con la nueva generación
+        """
+        state = await self.read(name)
+        body = {
+            "metadata": {"annotations": {RESTARTS_ANNOTATION: str(state["restarts"] + 1)}},
+            "spec": {"template": {
+                "metadata": {"annotations": {"kubectl.kubernetes.io/restartedAt": datetime.now().isoformat()}}}}
+        }
+        deploy = await asyncio.to_thread(self.apps.patch_namespaced_deployment, name, self.namespace, body)
+        return _snapshot(deploy)
+
+    async def watch(self, name, timeout):
+        from kubernetes import watch
+        watcher = watch.Watch()
+        stream = watcher.stream(self.apps.list_namespaced_deployment, self.namespace,
+                                field_selector=f"metadata.name={name}", timeout_seconds=max(1, int(timeout)))
+        try:
+            while True:
+                event = await asyncio.to_thread(next, stream, None)
+                if event is None:
+                    return
+                yield _snapshot(event["object"])
+        finally:
+            watcher.stop()
+
+
+class FakeDeployments:
+    """
+    Deployments simulados para probar sin clúster: cada reinicio sustituye un
+    pod cada `step` segundos hasta completar el despliegue. Los de `stuck`
+    nunca avanzan.
+    """
+
+    def __init__(self, replicas, step=0.01, stuck=()):
+        self.step = step
+        self.stuck = set(stuck)
+        self.states = {name: {"generation": 1, "observed_generation": 1, "desired": n, "current": n, "updated": n,
+                              "ready": n, "available": n, "restarts": 0, "failed": False}
+                       for name, n in replicas.items()}
+        self.watchers = {}
+        self.rolling = set()
+        self.max_rolling = 0
+        self.tasks = []
+
+    async def read(self, name):
+        if name not in self.states:
+            raise LookupError(f"Deployment {name} no encontrado")
+        return dict(self.states[name])
+
+    async def restart(self, name):
+        state = self.states[name]
+        state["generation"] += 1
+        state["restarts"] += 1
+        state["updated"] = 0
+        self.rolling.add(name)
+        self.max_rolling = max(self.max_rolling, len(self.rolling))
+        self._notify(name)
+        if name not in self.stuck:
+            self.tasks.append(asyncio.ensure_future(self._roll(name, state["generation"])))
+        return dict(state)
+
+    async def _roll(self, name, generation):
+        state = self.states[name]
+        while state["generation"] == generation and state["updated"] < state["desired"]:
+            await asyncio.sleep(self.step)
+            state["observed_generation"] = generation
+            state["failed"] = False
+            state["updated"] += 1
+            state["current"] = state["desired"] + 1
+            state["available"] = state["ready"] = state["desired"] - 1 + (state["updated"] == state["desired"])
+            self._notify(name)
+        await asyncio.sleep(self.step)
+        state["current"] = state["ready"] = state["available"] = state["desired"]
+        self.rolling.discard(name)
+        self._notify(name)
+
+    def _notify(self, name):
+        for queue in self.watchers.get(name, ()):
+            queue.put_nowait(dict(self.states[name]))
+
+    async def watch(self, name, timeout):
+        queue = asyncio.Queue()
+        self.watchers.setdefault(name, []).append(queue)
+        deadline = time.monotonic() + timeout
+        try:
+            yield dict(self.states[name])
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    yield await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    return
+        finally:
+            self.watchers[name].remove(queue)
+
+
+class RolloutManager:
+    """
+    Reinicios de Deployments en segundo plano: como mucho `concurrency`
+    desplegándose a la vez y, para cada uno, seguimiento por watch hasta que
+    los pods nuevos están listos (o `timeout`).
+
+    Con `shared` (el estado compartido del gateway) los registros se publican
+    en `rollout:<nombre>` para que cualquier réplica los sirva, y el reinicio
+    se reserva con `rollout-lock:<nombre>` para que dos réplicas no reinicien
+    el mismo Deployment a la vez. La reserva caduca sola si la réplica muere.
+
+    `on_change(nombre, en_curso)` avisa al empezar y al terminar cada uno.
+    """
+
+    def __init__(self, backend, concurrency=2, timeout=300.0, on_change=None, shared=None, history=3600.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.on_change = on_change
+        self.shared = shared
+        self.history = history
+        self.rollouts = {}
+        self.tasks = {}
+
+    def in_progress(self, name):
+        """
+        Solo los de esta réplica; los de las demás llegan por las marcas de reinicio
+        """
+        rollout = self.rollouts.get(name)
+        return rollout is not None and rollout["status"] in IN_PROGRESS
+
+    async def status(self, names=None):
+        found = {}
+        if self.shared is not None:
+            for key, value in (await self.shared.scan("rollout:")).items():
+                found[key[len("rollout:"):]] = json.loads(value)
+        found.update((name, dict(rollout)) for name, rollout in self.rollouts.items())
+        return {name: rollout for name, rollout in found.items() if names is None or name in names}
+
+    async def restart(self, names):
+        """
+        Encola el reinicio de cada Deployment (los que ya están en curso aquí o
+        en otra réplica se dejan como están) y devuelve su estado sin esperar
+        """
+        for name in dict.fromkeys(names):
+            if self.in_progress(name) or not await self._claim(name):
+                continue
+            self.rollouts[name] = {"status": "pendiente", "requested_at": datetime.now().isoformat(),
+                                   "started_at": None, "finished_at": None, "progress": None, "detail": None}
+            await self._publish(name)
+            self._changed(name, True)
+            self.tasks[name] = detached(self._run(name))
+        return await self.status(names)
+
+    async def wait(self):
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def _changed(self, name, active):
+        if self.on_change is not None:
+            self.on_change(name, active)
+
+    async def _claim(self, name):
+        if self.shared is None:
+            return True
+        # Margen sobre el timeout para la espera en el semáforo
+        return await self.shared.add(f"rollout-lock:{name}", datetime.now().isoformat(), ttl=self.timeout * 2)
+
+    async def _publish(self, name, final=False):
+        if self.shared is None:
+            return
+        try:
+            ttl = self.history if final else self.timeout * 2
+            await self.shared.set(f"rollout:{name}", json.dumps(self.rollouts[name]), ttl=ttl)
+            if final:
+                await self.shared.delete(f"rollout-lock:{name}")
+        except Exception as e:
+            logger.warning(f"No se pudo publicar el reinicio de {name}: {e}")
+
+    async def _run(self, name):
+        rollout = self.rollouts[name]
+        try:
+            async with self.semaphore:
+                rollout["status"] = "reiniciando"
+                rollout["started_at"] = datetime.now().isoformat()
+                await self._publish(name)
+                state = await self.backend.restart(name)
+                rollout["progress"] = state
+                rollout["status"], rollout["detail"] = await self._follow(name, state["generation"], rollout)
+        except Exception as e:
+            rollout["status"], rollout["detail"] = "error", str(e)
+            logger.warning(f"Reinicio de {name} fallido: {e}")
+        finally:
+            rollout["finished_at"] = datetime.now().isoformat()
+            self.tasks.pop(name, None)
+            await self._publish(name, final=True)
+            self._changed(name, False)
+
+    async def _follow(self, name, generation, rollout):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "tiempo_agotado", f"Sin completar tras {self.timeout:.0f}s"
+            async for state in self.backend.watch(name, remaining):
+                rollout["progress"] = state
+                if rollout_complete(state, generation):
+                    return "listo", None
+                # Un fallo de una generación anterior no cuenta hasta que el
+                # controlador vea la nueva
+                if state["failed"] and state["observed_generation"] >= generation:
+                    return "error", "ProgressDeadlineExceeded"
+            # El watch se cortó (timeout del servidor): se mira el estado actual
+            state = await self.backend.read(name)
+            rollout["progress"] = state
+            await self._publish(name)
+            if rollout_complete(state, generation):
+                return "listo", None
@@ -0,0 +1,253 @@
+import time
+import fnmatch
+
+
+class MemoryBackend:
+    """
+    Estado en el propio proceso: válido con una sola réplica del gateway.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.values = {}
+
+    def _alive(self, key):
+        item = self.values.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= self.clock():
+            del self.values[key]
+            return None
+        return value
+
+    async def get(self, key):
+        return self._alive(key)
+
+    async def set(self, key, value, ttl=None):
+        self.values[key] = (value, None if ttl is None else self.clock() + ttl)
+
+    async def add(self, key, value, ttl=None):
+        if self._alive(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def incr(self, key, amount=1, ttl=None):
+        value = int(self._alive(key) or 0) + amount
+        expires = self.values[key][1] if key in self.values else None
+        if expires is None and ttl is not None:
+            expires = self.clock() + ttl
+        self.values[key] = (value, expires)
+        return value
+
+    async def scan(self, prefix):
+        found = {}
+        for key in list(self.values):
+            if key.startswith(prefix):
+                value = self._alive(key)
+                if value is not None:
+                    found[key] = value
+        return found
+
+
+class RedisBackend:
+    """
+    Estado compartido entre réplicas sobre cualquier cliente con la API de
+    `redis.asyncio` (GET, SET PX NX, DEL, INCRBY, PEXPIRE, SCAN, MGET).
+    """
+
+    def __init__(self, client, namespace="wakanda:gateway:"):
+        self.client = client
+        self.namespace = namespace
+
+    async def get(self, key):
+        return await self.client.get(self.namespace + key)
+
+    async def set(self, key, value, ttl=None):
+        await self.client.set(self.namespace + key, value, px=None if ttl is None else int(ttl * 1000))
+
+    async def add(self, key, value, ttl=None):
+        return bool(await self.client.set(self.namespace + key, value, px=None if ttl is None else int(ttl * 1000),
+                                          nx=True))
+
+    async def delete(self, key):
+        await self.client.delete(self.namespace + key)
+
+    async def incr(self, key, amount=1, ttl=None):
+        value = await self.client.incrby(self.namespace + key, amount)
+        if ttl is not None and value == amount:
+            await self.client.pexpire(self.namespace + key, int(ttl * 1000))
+        return value
+
+    async def scan(self, prefix):
+        keys = [key async for key in self.client.scan_iter(match=self.namespace + prefix + "*")]
+        if not keys:
+            return {}
+        values = await self.client.mget(keys)
+        strip = len(self.namespace)
+        return {_text(key)[strip:]: value for key, value in zip(keys, values) if value is not None}
+
+
+class FakeRedis:
+    """
+    Subconjunto en memoria de `redis.asyncio.Redis` para pruebas y desarrollo
+    local (`STATE_BACKEND_URL=fake://`). Guarda bytes, como Redis.
+    """
+
+    def __init__(self, clock=time.time):
+        self.store = MemoryBackend(clock)
+
+    async def get(self, key):
+        return await self.store.get(key)
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx:
+            return await self.store.add(key, _bytes(value), None if px is None else px / 1000) or None
+        await self.store.set(key, _bytes(value), None if px is None else px / 1000)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            await self.store.delete(key)
+        return len(keys)
+
+    async def incrby(self, key, amount):
+        value = int(await self.store.get(key) or 0) + amount
+        item = self.store.values.get(key)
+        self.store.values[key] = (_bytes(value), item[1] if item else None)
+        return value
+
+    async def pexpire(self, key, ms):
+        item = self.store.values.get(key)
+        if item is None:
+            return False
+        self.store.values[key] = (item[0], self.store.clock() + ms / 1000)
+        return True
+
+    async def scan_iter(self, match="*"):
+        for key in list(self.store.values):
+            if fnmatch.fnmatchcase(key, match) and self.store._alive(key) is not None:
+                yield key.encode()
+
+    async def mget(self, keys):
+        return [await self.store.get(_text(key)) for key in keys]
+
+
+class CachedBackend:
+    """
+    Lectura a través de una copia local con TTL corto, para que las lecturas
+    frecuentes no vayan al almacén compartido en cada petición. Las escrituras
+    van directas al almacén y actualizan la copia local.
+    """
+
+    def __init__(self, backend, ttl=0.5, clock=time.monotonic):
+        self.backend = backend
+        self.ttl = ttl
+        self.clock = clock
+        self.local = {}
+
+    async def get(self, key):
+        item = self.local.get(key)
+        if item is not None and self.clock() - item[1] < self.ttl:
+            return item[0]
+        value = await self.backend.get(key)
+        self.local[key] = (value, self.clock())
+        return value
+
+    async def set(self, key, value, ttl=None):
+        await self.backend.set(key, value, ttl)
+        self.local[key] = (value, self.clock())
+
+    async def add(self, key, value, ttl=None):
+        added = await self.backend.add(key, value, ttl)
+        self.local.pop(key, None)
+        return added
+
+    async def delete(self, key):
+        await self.backend.delete(key)
+        self.local.pop(key, None)
+
+    async def incr(self, key, amount=1, ttl=None):
+        return await self.backend.incr(key, amount, ttl)
+
+    async def scan(self, prefix):
+        return await self.backend.scan(prefix)
+
+
+def create_backend(url, local_ttl=0.5):
+    """
+    memory:// (por proceso), redis://host:puerto/db (compartido) o fake://
+    (Redis simulado en memoria).
+    """
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith("fake://"):
+        return CachedBackend(RedisBackend(FakeRedis()), ttl=local_ttl)
+    if url.startswith(("redis://", "rediss://")):
+        from redis import asyncio as aioredis
+        return CachedBackend(RedisBackend(aioredis.from_url(url)), ttl=local_ttl)
+    raise ValueError(f"Backend de estado no soportado: {url}")
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class SharedCounter:
+    """
+    Contador en ventanas de un segundo sumado entre todas las réplicas. Cada
+    réplica acumula en memoria y lo vuelca al backend con `flush`, fuera del
+    camino de la petición.
+    """
+
+    def __init__(self, backend, name, window=60, clock=time.time):
+        self.backend = backend
+        self.name = name
+        self.window = window
+        self.clock = clock
+        self.pending = {}
+
+    def add(self, amount=1):
+        second = int(self.clock())
+        self.pending[second] = self.pending.get(second, 0) + amount
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        for second, amount in pending.items():
+            await self.backend.incr(f"{self.name}:{second}", amount, ttl=self.window * 2)
+
+    async def rate(self):
+        """
+        Media por segundo de la última ventana completa
+        """
+        now = int(self.clock())
+        total = 0
+        for key, value in (await self.backend.scan(self.name + ":")).items():
+            if now - self.window <= int(key.rsplit(":", 1)[1]) < now:
+                total += int(value)
+        return total / self.window
+
+
+class CountRequests:
+    """
+    Middleware ASGI que suma cada petición HTTP a un SharedCounter.
+    """
+
+    def __init__(self, app, counter):
+        self.app = app
+        self.counter = counter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.counter.add()
+        await self.app(scope, receive, send)
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from wakanda_common.tracing import detached
+
+logger = logging.getLogger("WakandaGateway")
+
+
+class Subscriber:
+    """
+    Cola por cliente con un hueco por servicio: si llega una instantánea nueva
+    antes de que el cliente lea la anterior, la anterior se descarta.
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, name, chunk):
+        if self.pending.pop(name, None) is not None:
+            self.dropped += 1
+        self.pending[name] = chunk
+        self.ready.set()
+
+    async def next(self, timeout):
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        chunks = list(self.pending.values())
+        self.pending.clear()
+        self.ready.clear()
+        return chunks
+
+
+class SnapshotHub:
+    """
+    Un único sondeo por servicio, compartido por todos los clientes conectados.
+    Los sondeos arrancan con el primer cliente y se detienen con el último.
+    """
+
+    def __init__(self, sources, interval=2.0):
+        self.sources = sources
+        self.interval = interval
+        self.subscribers = set()
+        self.latest = {}
+        self.tasks = {}
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        for name, chunk in self.latest.items():
+            subscriber.push(name, chunk)
+        self.subscribers.add(subscriber)
+        if not self.tasks:
+            self.tasks = {name: detached(self._poll(name, fetch)) for name, fetch in self.sources.items()}
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers:
+            self.stop()
+
+    def stop(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks = {}
+
+    def publish(self, name, snapshot):
+        # Las respuestas ya serializadas (reenviadas del servicio) se publican con sus bytes
+        body = getattr(snapshot, "body", None)
+        if body is None:
+            body = json.dumps(snapshot, default=str).encode()
+        # Un cuerpo de varias líneas (JSON con sangría, una página de error) va
+        # en varias líneas `data:`, que el cliente vuelve a unir con "\n"
+        data = b"".join(b"data: " + line.rstrip(b"\r") + b"\n" for line in body.split(b"\n"))
+        chunk = b"event: " + name.encode() + b"\n" + data + b"\n"
+        self.latest[name] = chunk
+        for subscriber in self.subscribers:
+            subscriber.push(name, chunk)
+
+    async def _poll(self, name, fetch):
+        while True:
+            try:
+                self.publish(name, await fetch())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Sondeo de {name} fallido: {e}")
+                self.publish(name, {"status": "ERROR", "detail": str(e)})
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,34 @@
+import httpx
+from wakanda_common.tracing import TRACER
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    Span de cliente por cada llamada saliente (también cada reintento), con
+    la cabecera `traceparent` para que el servicio continúe la misma traza.
+    """
+
+    def __init__(self, transport, tracer=TRACER):
+        self.transport = transport
+        self.tracer = tracer
+
+    async def handle_async_request(self, request):
+        url = str(request.url.copy_with(query=None))
+        with self.tracer.span(f"{request.method} {request.url.host}", url=url) as span:
+            if span is None:
+                return await self.transport.handle_async_request(request)
+            request.headers["traceparent"] = span.traceparent()
+            response = await self.transport.handle_async_request(request)
+            span.attributes["status"] = response.status_code
+            if response.status_code >= 500:
+                span.error = f"HTTP {response.status_code}"
+            return response
+
+    async def __aexit__(self, exc_type=None, exc_value=None, traceback=None):
+        pass
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        await self.transport.close()
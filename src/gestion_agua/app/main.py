@@ -1,24 +1,50 @@
 import os
-import random
-from fastapi import FastAPI, Depends
+from fastapi import Depends, HTTPException
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from prometheus_client import make_asgi_app, Counter
-from wakanda_common import get_db_engine, get_db_session_maker
+from wakanda_common import create_service_app, get_db, json_response, RollupStore, SimulationEngine, AnomalyDetector
+from .network import PipeNetwork
 
-app = FastAPI(title="Servicio de agua wakanda")
+WATER_HISTORY = RollupStore()
+WATER_ANOMALIES = AnomalyDetector("gestion_agua", limits={"ph_level": (6.5, 8.5)})
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_db_engine(DATABASE_URL)
-AsyncSessionLocal = get_db_session_maker(engine)
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+PIPES = SimulationEngine(int(os.getenv("SIM_PIPE_SEGMENTS", "5000")), seed=SIM_SEED)
+PIPES.add_field("pressure_psi", 35, 90, mean=62, common=6)
+PIPES.add_field("ph_level", 6.5, 7.8, mean=7.2, common=0.15)
+PIPES.add_field("purity", 98.0, 99.9, mean=99.2, spread=0.3, common=0.2)
+TANKS = SimulationEngine(int(os.getenv("SIM_WATER_TANKS", "40")), seed=SIM_SEED)
+TANKS.add_field("level", 50, 100, mean=78, common=8, reversion=0.01)
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+WATER_NETWORK_SIDE = int(os.getenv("WATER_NETWORK_SIDE", "60"))
+NETWORK = None
+LOW_PRESSURE_PSI = float(os.getenv("LOW_PRESSURE_PSI", "45"))
+
+def water_status(pressure):
+    if pressure < 50:
+        return "BAJA PRESIÓN"
+    if pressure > 75:
+        return "ALTA PRESIÓN"
+    if 58 <= pressure <= 66:
+        return "OPTIMO"
+    return "NORMAL"
+
+def water_network():
+    """
+    Red de tuberías; se factoriza en el arranque del proceso, no al importar
+    """
+    global NETWORK
+    if NETWORK is None:
+        NETWORK = PipeNetwork.grid(WATER_NETWORK_SIDE, seed=SIM_SEED)
+    return NETWORK
+
+app = create_service_app(
+    "gestion_agua", "Servicio de agua wakanda",
+    requests_metric=("water_requests_total", "Peticiones al servicio de agua"),
+    startup=[water_network],
+)
+WATER_REQUESTS = app.state.requests
 
-WATER_REQUESTS = Counter('water_requests_total', 'Peticiones al servicio de agua')
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
 
 @app.get("/water/pressure")
 async def get_water_pressure(db: AsyncSession = Depends(get_db)):
@@ -32,18 +58,79 @@ async def get_water_pressure(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         db_status = f"Error DB: {str(e)}"
 
-    estados = ["NORMAL", "ALTA PRESIÓN", "BAJA PRESIÓN", "OPTIMO"]
+    PIPES.tick()
+    TANKS.tick()
+    pressure = round(PIPES.mean("pressure_psi"))
+    ph = round(PIPES.mean("ph_level"), 2)
+    purity = PIPES.mean("purity")
+    reserve = round(TANKS.mean("level"))
+
+    readings = {
+        "pressure_psi": pressure,
+        "ph_level": ph,
+        "purity_level": purity,
+        "reserve_level": reserve,
+    }
+    for metric, value in readings.items():
+        WATER_HISTORY.record(metric, value)
+    WATER_ANOMALIES.observe_many(readings)
 
     return {
         "service": "Gestión de Agua",
-        "status": random.choice(estados),
-        "pressure_psi": random.randint(35, 90),
-        "ph_level": round(random.uniform(6.5, 7.8), 2),
-        "purity_level": f"{random.uniform(98.0, 99.9):.1f}%",
-        "reserve_level": f"{random.randint(50, 100)}%",
+        "status": water_status(pressure),
+        "pressure_psi": pressure,
+        "ph_level": ph,
+        "purity_level": f"{purity:.1f}%",
+        "reserve_level": f"{reserve}%",
+        "anomalies": WATER_ANOMALIES.recent(),
         "db_connection": db_status
     }
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+@app.get("/water/history")
+async def get_water_history(metric: str = "pressure_psi", start: float = None, end: float = None,
+                            points: int = 500):
+    """
+    Histórico agregado de una métrica del agua (crudo, minuto, hora o día)
+    """
+    if metric not in WATER_HISTORY.metrics():
+        raise HTTPException(404, "Métrica sin lecturas")
+    return json_response(WATER_HISTORY.history(metric, start, end, points))
+
+@app.get("/water/districts")
+async def get_water_districts():
+    """
+    Presión por distrito calculada sobre la red de tuberías
+    """
+    network = water_network()
+    districts = network.districts(LOW_PRESSURE_PSI)
+    return json_response({
+        "junctions": len(network.elevation),
+        "pipes": len(network.pipes),
+        "solve_ms": round(network.solve_seconds * 1000, 3),
+        "low_pressure_zones": [d["district"] for d in districts if d["low_pressure"]],
+        "districts": districts
+    })
+
+@app.put("/water/valves/{pipe_id}")
+async def set_water_valve(pipe_id: int, open: bool):
+    """
+    Abre o cierra la válvula de una tubería
+    """
+    network = water_network()
+    if not 0 <= pipe_id < len(network.pipes):
+        raise HTTPException(404, "Tubería no encontrada")
+    network.set_valve(pipe_id, open)
+    return {"pipe": pipe_id, "open": open, "pending_updates": len(network.pending)}
+
+@app.put("/water/demand/{junction_id}")
+async def set_water_demand(junction_id: int, demand: float):
+    """
+    Cambia la demanda de consumo en una unión de la red
+    """
+    network = water_network()
+    if not 0 <= junction_id < len(network.elevation):
+        raise HTTPException(404, "Unión no encontrada")
+    if junction_id in network.reservoirs:
+        raise HTTPException(400, "La unión es un depósito")
+    network.set_demand(junction_id, max(demand, 0.0))
+    return {"junction": junction_id, "demand": network.demand[junction_id]}
@@ -0,0 +1,97 @@
+SLOTS_PER_WEEK = 7 * 24
+EPOCH_WEEKDAY = 3
+
+
+def week_slot(ts):
+    return (int(ts // 3600) + EPOCH_WEEKDAY * 24) % SLOTS_PER_WEEK
+
+
+class LoadForecaster:
+    """
+    Previsión de carga con suavizado exponencial: nivel lento con tendencia amortiguada,
+    perfil estacional aditivo por hora de la semana y una corrección de corto plazo
+    que se desvanece con el horizonte.
+
+    Cada lectura actualiza un número fijo de estadísticos, sin releer el histórico;
+    la previsión se construye a demanda a partir de ese estado.
+    """
+
+    def __init__(self, alpha=0.002, beta=0.001, gamma=0.05, short_alpha=0.3, short_decay=0.97,
+                 damping=0.995, error_alpha=0.01):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.short_alpha = short_alpha
+        self.short_decay = short_decay
+        self.damping = damping
+        self.error_alpha = error_alpha
+        self.level = None
+        self.trend = 0.0
+        self.short = 0.0
+        self.seasonal = [0.0] * SLOTS_PER_WEEK
+        self.seen = [0] * SLOTS_PER_WEEK
+        self.mean_abs_error = 0.0
+        self.last_ts = None
+        self.updates = 0
+
+    def predict(self, ts):
+        if self.level is None:
+            return None
+        steps = max((ts - self.last_ts) / 60.0, 0.0)
+        growth = self.damping * (1 - self.damping ** steps) / (1 - self.damping)
+        slot = week_slot(ts)
+        # Franjas aún sin lecturas (primera semana): se arrastra la última franja observada
+        season = self.seasonal[slot] if self.seen[slot] else self.seasonal[week_slot(self.last_ts)]
+        return self.level + self.trend * growth + season + self.short * self.short_decay ** steps
+
+    def update(self, ts, value):
+        slot = week_slot(ts)
+        self.updates += 1
+        if self.level is None:
+            self.level = value
+            self.last_ts = ts
+            self.seen[slot] += 1
+            return
+
+        expected = self.predict(ts)
+        self.mean_abs_error += self.error_alpha * (abs(value - expected) - self.mean_abs_error)
+
+        minutes = max((ts - self.last_ts) / 60.0, 1e-6)
+        alpha = 1 - (1 - self.alpha) ** minutes
+        previous = self.level
+        season = self.seasonal[slot]
+        self.level += alpha * (value - season - self.level)
+        self.trend += self.beta * ((self.level - previous) / minutes - self.trend)
+        gamma = max(self.gamma, 1.0 / (self.seen[slot] + 1))
+        self.seasonal[slot] = season + gamma * (value - self.level - season)
+        self.seen[slot] += 1
+        residual = value - self.level - self.seasonal[slot]
+        self.short += self.short_alpha * (residual - self.short)
+        self.last_ts = ts
+
+    def forecast(self, now, horizon_minutes=60, step_minutes=5):
+        if self.level is None:
+            return []
+        band = 2 * self.mean_abs_error
+        points = []
+        for minute in range(step_minutes, horizon_minutes + 1, step_minutes):
+            ts = now + minute * 60
+            value = self.predict(ts)
+            points.append({
+                "t": ts,
+                "load": round(value, 2),
+                "low": round(value - band, 2),
+                "high": round(value + band, 2),
+            })
+        return points
+
+    def peak_warning(self, points, threshold):
+        for point in points:
+            if point["high"] >= threshold:
+                return {
+                    "t": point["t"],
+                    "expected_load": point["load"],
+                    "threshold": threshold,
+                    "certain": point["low"] >= threshold,
+                }
+        return None
@@ -1,26 +1,40 @@
 import os
-import random
-from fastapi import FastAPI, Depends
+import time
+from fastapi import Depends, HTTPException
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from prometheus_client import make_asgi_app, Counter
-from wakanda_common import get_db_engine, get_db_session_maker
+from wakanda_common import create_service_app, get_db, json_response, RollupStore, SimulationEngine, AnomalyDetector
+from .forecast import LoadForecaster
 
-app = FastAPI(title="Servicio de energía vibranium")
+ENERGY_HISTORY = RollupStore()
+ENERGY_ANOMALIES = AnomalyDetector("gestion_energia", limits={"frequency_hz": (49.9, 50.1)})
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_db_engine(DATABASE_URL)
-AsyncSessionLocal = get_db_session_maker(engine)
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+TURBINES = SimulationEngine(int(os.getenv("SIM_TURBINES", "16")), seed=SIM_SEED)
+TURBINES.add_flag("online", active=0.75, switch_rate=0.005)
+TURBINES.add_field("load_pct", 30, 95, mean=60, common=12, reversion=0.02)
+TURBINES.add_field("voltage_v", 215, 245, mean=230, spread=3, common=3)
+TURBINES.add_field("frequency_hz", 49.8, 50.2, mean=50.0, spread=0.03, common=0.04, reversion=0.2)
 
+LOAD_FORECAST = LoadForecaster()
+PEAK_LOAD_PCT = float(os.getenv("PEAK_LOAD_PCT", "85"))
+PEAK_LOOKAHEAD_MIN = int(os.getenv("PEAK_LOOKAHEAD_MIN", "30"))
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
 
+def energy_status(core_load):
+    if core_load >= PEAK_LOAD_PCT:
+        return "PICO CONSUMO"
+    if core_load >= 70:
+        return "CARGA ALTA"
+    if core_load >= 50:
+        return "ESTABLE"
+    return "OPTIMO"
 
-ENERGY_REQUESTS = Counter('energy_requests_total', 'Peticiones al servicio de energía')
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
+app = create_service_app(
+    "gestion_energia", "Servicio de energía vibranium",
+    requests_metric=("energy_requests_total", "Peticiones al servicio de energía"),
+)
+ENERGY_REQUESTS = app.state.requests
 
 
 @app.get("/energy/grid")
@@ -35,19 +49,63 @@ async def get_energy_grid(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         db_status = f"Error DB: {str(e)}"
 
-    estados = ["ESTABLE", "PICO CONSUMO", "CARGA ALTA", "OPTIMO"]
+    TURBINES.tick()
+    voltage = round(TURBINES.mean("voltage_v", where="online"))
+    frequency = round(TURBINES.mean("frequency_hz", where="online"), 2)
+    core_load = round(TURBINES.mean("load_pct", where="online"))
+    turbines = TURBINES.count("online")
+    now = time.time()
+    LOAD_FORECAST.update(now, TURBINES.mean("load_pct", where="online"))
+    upcoming = LOAD_FORECAST.forecast(now, PEAK_LOOKAHEAD_MIN, 5)
+
+    readings = {
+        "voltage_v": voltage,
+        "frequency_hz": frequency,
+        "vibranium_core_load": core_load,
+        "active_turbines": turbines,
+    }
+    for metric, value in readings.items():
+        ENERGY_HISTORY.record(metric, value)
+    ENERGY_ANOMALIES.observe_many(readings)
 
     return {
         "service": "Gestión de Energía",
-        "status": random.choice(estados),
-        "voltage_v": random.randint(215, 245),
-        "frequency_hz": round(random.uniform(49.8, 50.2), 2),
-        "vibranium_core_load": f"{random.randint(30, 95)}%",
-        "active_turbines": random.randint(8, 16),
+        "status": energy_status(core_load),
+        "peak_warning": LOAD_FORECAST.peak_warning(upcoming, PEAK_LOAD_PCT),
+        "voltage_v": voltage,
+        "frequency_hz": frequency,
+        "vibranium_core_load": f"{core_load}%",
+        "active_turbines": turbines,
+        "anomalies": ENERGY_ANOMALIES.recent(),
         "db_connection": db_status
     }
 
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+@app.get("/energy/history")
+async def get_energy_history(metric: str = "voltage_v", start: float = None, end: float = None,
+                             points: int = 500):
+    """
+    Histórico agregado de una métrica de la red (crudo, minuto, hora o día)
+    """
+    if metric not in ENERGY_HISTORY.metrics():
+        raise HTTPException(404, "Métrica sin lecturas")
+    return json_response(ENERGY_HISTORY.history(metric, start, end, points))
+
+
+@app.get("/energy/forecast")
+async def get_energy_forecast(horizon: int = 60, step: int = 5):
+    """
+    Previsión de carga del núcleo de vibranium y aviso de pico
+    """
+    if LOAD_FORECAST.level is None:
+        raise HTTPException(404, "Sin lecturas de carga todavía")
+    horizon = min(max(horizon, 1), 24 * 60)
+    step = min(max(step, 1), horizon)
+    points = LOAD_FORECAST.forecast(time.time(), horizon, step)
+    return json_response({
+        "horizon_minutes": horizon,
+        "readings": LOAD_FORECAST.updates,
+        "mean_abs_error": round(LOAD_FORECAST.mean_abs_error, 2),
+        "points": points,
+        "peak_warning": LOAD_FORECAST.peak_warning(points, PEAK_LOAD_PCT)
+    })
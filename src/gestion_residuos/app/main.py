@@ -1,24 +1,90 @@
 import os
-import random
-from fastapi import FastAPI, Depends
+import asyncio
+from typing import List, Optional
+import numpy as np
+from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from prometheus_client import make_asgi_app, Counter
-from wakanda_common import get_db_engine, get_db_session_maker
+from wakanda_common import create_service_app, get_db, json_response, RollupStore, SimulationEngine, AnomalyDetector
+from .routing import BinRegistry, RoutePlanner
 
-app = FastAPI(title="Servicio de gestión de residuos")
+WASTE_HISTORY = RollupStore()
+WASTE_ANOMALIES = AnomalyDetector("gestion_residuos", limits={"incinerator_temp": (850, 1200)})
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_db_engine(DATABASE_URL)
-AsyncSessionLocal = get_db_session_maker(engine)
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+TRUCKS = SimulationEngine(int(os.getenv("SIM_TRUCKS", "30")), seed=SIM_SEED)
+TRUCKS.add_flag("active", active=0.6, switch_rate=0.01)
+BINS = SimulationEngine(int(os.getenv("SIM_BINS", "2000")), seed=SIM_SEED)
+BINS.add_field("fill_pct", 10, 95, mean=50, common=10, reversion=0.01)
+CENTERS = SimulationEngine(5, seed=SIM_SEED)
+CENTERS.add_flag("online", active=0.8, switch_rate=0.002)
+CENTERS.add_field("incinerator_temp", 850, 1250, mean=1050, common=40)
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+CITY_SIZE_M = float(os.getenv("CITY_SIZE_M", "20000"))
+TRUCK_CAPACITY_L = float(os.getenv("TRUCK_CAPACITY_L", "16000"))
+SIM_BIN_IDS = [f"B{i:05d}" for i in range(BINS.size)]
+BIN_REGISTRY = BinRegistry()
+ROUTE_PLANNER = RoutePlanner(
+    BIN_REGISTRY,
+    bin_volume_l=float(os.getenv("BIN_VOLUME_L", "1100")),
+    workers=int(os.getenv("ROUTE_WORKERS", "1")),
+)
+ROUTE_LOCK = asyncio.Lock()
+# (versión del registro, posiciones simuladas registradas, su posición en el registro)
+_sim_positions = (None, None, None)
+
+
+class BinState(BaseModel):
+    x: float
+    y: float
+    fill_pct: float = 0.0
+
+
+class Depot(BaseModel):
+    id: str
+    x: float
+    y: float
+    trucks: List[float]
+
+
+class RouteRequest(BaseModel):
+    depots: Optional[List[Depot]] = None
+    min_fill_pct: float = 60.0
+    time_limit_s: float = 2.0
+
+
+def sync_bin_fill():
+    """
+    Copia el llenado simulado a los contenedores originales que siguen registrados
+    """
+    global _sim_positions
+    BINS.tick()
+    if _sim_positions[0] != BIN_REGISTRY.version:
+        positions = BIN_REGISTRY.positions(SIM_BIN_IDS)
+        registered = np.flatnonzero(positions >= 0)
+        _sim_positions = (BIN_REGISTRY.version, registered, positions[registered])
+    _, registered, targets = _sim_positions
+    BIN_REGISTRY.fill[targets] = BINS.values("fill_pct")[registered]
+
+def load_simulated_bins():
+    """
+    Alta de los contenedores simulados, en el arranque
+    """
+    if len(BIN_REGISTRY):
+        return
+    sites = np.random.default_rng(SIM_SEED).uniform(0, CITY_SIZE_M, (BINS.size, 2))
+    BIN_REGISTRY.load(SIM_BIN_IDS, sites[:, 0], sites[:, 1], BINS.values("fill_pct"))
+
+app = create_service_app(
+    "gestion_residuos", "Servicio de gestión de residuos",
+    requests_metric=("waste_requests_total", "Peticiones al servicio de residuos"),
+    startup=[load_simulated_bins],
+    shutdown=[ROUTE_PLANNER.close],
+)
+WASTE_REQUESTS = app.state.requests
 
-WASTE_REQUESTS = Counter('waste_requests_total', 'Peticiones al servicio de residuos')
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
 
 @app.get("/waste/status")
 async def get_waste_status(db: AsyncSession = Depends(get_db)):
@@ -32,16 +98,77 @@ async def get_waste_status(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         db_status = f"Error DB: {str(e)}"
 
+    TRUCKS.tick()
+    BINS.tick()
+    CENTERS.tick()
+    trucks = TRUCKS.count("active")
+    centers = CENTERS.count("online")
+    fill_level = round(BINS.mean("fill_pct"))
+    incinerator_temp = round(CENTERS.mean("incinerator_temp", where="online"))
+
+    readings = {
+        "trucks_active": trucks,
+        "recycling_centers_online": centers,
+        "avg_bin_fill_level": fill_level,
+        "incinerator_temp": incinerator_temp,
+    }
+    for metric, value in readings.items():
+        WASTE_HISTORY.record(metric, value)
+    WASTE_ANOMALIES.observe_many(readings)
+
     return {
         "service": "Gestión de Residuos",
         "status": "OPERATIVO",
-        "trucks_active": random.randint(5, 30),
-        "recycling_centers_online": random.randint(2, 5),
-        "avg_bin_fill_level": f"{random.randint(10, 95)}%",
-        "incinerator_temp": f"{random.randint(850, 1250)}°C",
+        "trucks_active": trucks,
+        "recycling_centers_online": centers,
+        "avg_bin_fill_level": f"{fill_level}%",
+        "incinerator_temp": f"{incinerator_temp}°C",
+        "anomalies": WASTE_ANOMALIES.recent(),
         "db_connection": db_status
     }
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+@app.get("/waste/history")
+async def get_waste_history(metric: str = "avg_bin_fill_level", start: float = None, end: float = None,
+                            points: int = 500):
+    """
+    Histórico agregado de una métrica de residuos (crudo, minuto, hora o día)
+    """
+    if metric not in WASTE_HISTORY.metrics():
+        raise HTTPException(404, "Métrica sin lecturas")
+    return json_response(WASTE_HISTORY.history(metric, start, end, points))
+
+@app.put("/waste/bins/{bin_id}")
+async def put_waste_bin(bin_id: str, state: BinState):
+    """
+    Alta o actualización de un contenedor
+    """
+    async with ROUTE_LOCK:
+        BIN_REGISTRY.upsert(bin_id, state.x, state.y, state.fill_pct)
+    return {"bin_id": bin_id, "bins": len(BIN_REGISTRY)}
+
+@app.delete("/waste/bins/{bin_id}")
+async def delete_waste_bin(bin_id: str):
+    """
+    Baja de un contenedor
+    """
+    async with ROUTE_LOCK:
+        if bin_id not in BIN_REGISTRY:
+            raise HTTPException(404, "Contenedor no encontrado")
+        BIN_REGISTRY.remove(bin_id)
+    return {"bin_id": bin_id, "bins": len(BIN_REGISTRY)}
+
+@app.post("/waste/routes")
+async def plan_waste_routes(request: RouteRequest):
+    """
+    Rutas de recogida por camión a partir del llenado de los contenedores
+    """
+    if request.depots:
+        depots = [depot.model_dump() for depot in request.depots]
+    else:
+        TRUCKS.tick()
+        trucks = [TRUCK_CAPACITY_L] * TRUCKS.count("active")
+        depots = [{"id": "central", "x": CITY_SIZE_M / 2, "y": CITY_SIZE_M / 2, "trucks": trucks}]
+    time_limit = min(max(request.time_limit_s, 0.0), 30.0)
+    async with ROUTE_LOCK:
+        sync_bin_fill()
+        return await run_in_threadpool(ROUTE_PLANNER.plan, depots, request.min_fill_pct, time_limit)
@@ -0,0 +1,299 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+class BinRegistry:
+    """
+    Contenedores con su posición y nivel de llenado en arrays contiguos.
+
+    Las distancias no se guardan: una matriz entre todos los contenedores crece
+    con n² (cientos de MB con unos miles, en cada worker). Cada plan calcula solo
+    los vecinos próximos de los que va a recoger y la matriz de cada ruta.
+
+    Darlo de baja mueve el último a su hueco; `version` cambia con cada alta o
+    baja para que quien guarde posiciones sepa cuándo recalcularlas.
+    """
+
+    def __init__(self, capacity=1024):
+        self.ids = []
+        self.index = {}
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.fill = np.zeros(capacity)
+        self.version = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, bin_id):
+        return bin_id in self.index
+
+    def _grow(self, needed):
+        n, capacity = len(self.ids), len(self.x)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("x", "y", "fill"):
+            grown = np.zeros(capacity)
+            grown[:n] = getattr(self, name)[:n]
+            setattr(self, name, grown)
+
+    def _add(self, bin_id):
+        self._grow(len(self.ids) + 1)
+        pos = len(self.ids)
+        self.ids.append(bin_id)
+        self.index[bin_id] = pos
+        self.version += 1
+        return pos
+
+    def upsert(self, bin_id, x, y, fill_pct):
+        pos = self.index.get(bin_id)
+        if pos is None:
+            pos = self._add(bin_id)
+        self.x[pos], self.y[pos], self.fill[pos] = x, y, fill_pct
+        return pos
+
+    def remove(self, bin_id):
+        pos = self.index.pop(bin_id)
+        last = len(self.ids) - 1
+        if pos != last:
+            moved = self.ids[last]
+            self.ids[pos] = moved
+            self.index[moved] = pos
+            self.x[pos], self.y[pos], self.fill[pos] = self.x[last], self.y[last], self.fill[last]
+        self.ids.pop()
+        self.version += 1
+
+    def load(self, ids, xs, ys, fills):
+        self._grow(len(self.ids) + len(ids))
+        positions = np.array([self.index[bin_id] if bin_id in self.index else self._add(bin_id) for bin_id in ids],
+                             dtype=np.intp)
+        self.x[positions], self.y[positions], self.fill[positions] = xs, ys, fills
+
+    def positions(self, ids):
+        """
+        Posición de cada id en los arrays (-1 si no está registrado)
+        """
+        return np.fromiter((self.index.get(bin_id, -1) for bin_id in ids), dtype=np.intp, count=len(ids))
+
+    def distances(self, positions):
+        """
+        Matriz de distancias entre los contenedores de `positions`
+        """
+        return pairwise(self.x[positions], self.y[positions])
+
+    def distances_from(self, x, y):
+        n = len(self.ids)
+        return np.hypot(self.x[:n] - x, self.y[:n] - y)
+
+
+def pairwise(xs, ys):
+    return np.hypot(xs[:, None] - xs[None, :], ys[:, None] - ys[None, :])
+
+
+def nearest(xs, ys, k, block=512):
+    """
+    Los `k` puntos más próximos a cada uno (más él mismo), por bloques de filas
+    para no tener nunca la matriz m x m entera en memoria
+    """
+    m = len(xs)
+    near = np.empty((m, k + 1), dtype=np.intp)
+    for start in range(0, m, block):
+        rows = slice(start, start + block)
+        dx, dy = xs[rows, None] - xs[None, :], ys[rows, None] - ys[None, :]
+        # El cuadrado ordena igual y se ahorra la raíz
+        near[rows] = np.argpartition(dx * dx + dy * dy, k, axis=1)[:, :k + 1]
+    return near
+
+
+def route_length(dist, depot_dist, route):
+    if not route:
+        return 0.0
+    route = np.asarray(route)
+    return float(depot_dist[route[0]] + dist[route[:-1], route[1:]].sum() + depot_dist[route[-1]])
+
+
+def savings_routes(xs, ys, depot_dist, volumes, capacity, neighbours=20):
+    """
+    Ahorros de Clarke-Wright limitados a los `neighbours` contenedores más próximos
+    de cada uno, para no evaluar los n² pares.
+    """
+    m = len(volumes)
+    if m == 0:
+        return []
+    k = min(neighbours, m - 1)
+    if k > 0:
+        i = np.repeat(np.arange(m), k + 1)
+        j = nearest(xs, ys, k).ravel()
+        keep = i < j
+        i, j = i[keep], j[keep]
+        saving = depot_dist[i] + depot_dist[j] - np.hypot(xs[i] - xs[j], ys[i] - ys[j])
+        order = np.argsort(-saving, kind="stable")
+        order = order[saving[order] > 0]
+        pairs = zip(i[order].tolist(), j[order].tolist())
+    else:
+        pairs = []
+
+    routes = {r: [r] for r in range(m)}
+    route_of = list(range(m))
+    load = [float(v) for v in volumes]
+    for a, b in pairs:
+        ra, rb = route_of[a], route_of[b]
+        if ra == rb or load[ra] + load[rb] > capacity:
+            continue
+        first, second = routes[ra], routes[rb]
+        if first[-1] != a:
+            if first[0] != a:
+                continue
+            first.reverse()
+        if second[0] != b:
+            if second[-1] != b:
+                continue
+            second.reverse()
+        if len(first) >= len(second):
+            first.extend(second)
+            merged, gone, relabel = ra, rb, second
+        else:
+            second[:0] = first
+            merged, gone, relabel = rb, ra, first
+        for node in relabel:
+            route_of[node] = merged
+        load[merged] += load[gone]
+        del routes[gone]
+    return list(routes.values())
+
+
+def two_opt(dist, depot_dist, route, deadline):
+    """
+    2-opt sobre una ruta cerrada en el depósito: cada pasada evalúa todos los
+    cruces de golpe con NumPy y aplica el que más acorta, hasta agotar el tiempo.
+    """
+    if len(route) < 3:
+        return route
+    m = len(route)
+    local = np.empty((m + 1, m + 1))
+    local[:m, :m] = dist[np.ix_(route, route)]
+    local[m, :m] = local[:m, m] = depot_dist[route]
+    local[m, m] = 0
+    tour = np.concatenate([[m], np.arange(m), [m]])
+    valid = np.triu(np.ones((m + 1, m + 1), dtype=bool), k=2)
+    valid[0, m] = False
+    while time.perf_counter() < deadline:
+        a, b = tour[:-1], tour[1:]
+        edge = local[a, b]
+        delta = local[np.ix_(a, a)] + local[np.ix_(b, b)] - edge[:, None] - edge[None, :]
+        delta[~valid] = 0
+        best = int(np.argmin(delta))
+        i, j = divmod(best, m + 1)
+        if delta[i, j] > -1e-6:
+            break
+        tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+    return [route[node] for node in tour[1:-1].tolist()]
+
+
+def plan_depot(xs, ys, depot_dist, volumes, capacities, time_limit, neighbours=20):
+    """
+    Rutas de un depósito: (camión, índices locales de contenedores, metros) por
+    ruta y los que no caben.
+    """
+    deadline = time.perf_counter() + time_limit
+    routes = savings_routes(xs, ys, depot_dist, volumes, max(capacities, default=0), neighbours)
+    routes.sort(key=lambda route: -sum(volumes[node] for node in route))
+
+    trucks = sorted(range(len(capacities)), key=lambda t: capacities[t])
+    assigned, unassigned = [], []
+    for route in routes:
+        load = sum(volumes[node] for node in route)
+        truck = next((t for t in trucks if capacities[t] >= load), None)
+        if truck is None:
+            unassigned.extend(route)
+            continue
+        trucks.remove(truck)
+        assigned.append((truck, route))
+
+    for done, (truck, route) in enumerate(assigned):
+        budget = (deadline - time.perf_counter()) / (len(assigned) - done)
+        # Matriz solo de los contenedores de la ruta
+        dist, d_dist = pairwise(xs[route], ys[route]), depot_dist[route]
+        local = two_opt(dist, d_dist, list(range(len(route))), time.perf_counter() + budget)
+        assigned[done] = (truck, [route[node] for node in local], route_length(dist, d_dist, local))
+    return assigned, unassigned
+
+
+class RoutePlanner:
+    """
+    Reparte los contenedores a recoger entre depósitos y planifica cada depósito
+    por separado; con varios depósitos, cada uno va a un proceso distinto.
+    """
+
+    def __init__(self, registry, bin_volume_l=1100, workers=1, neighbours=20):
+        self.registry = registry
+        self.bin_volume_l = bin_volume_l
+        self.workers = workers
+        self.neighbours = neighbours
+        self.pool = None
+
+    def _executor(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def plan(self, depots, min_fill_pct=60, time_limit=2.0):
+        start = time.perf_counter()
+        registry = self.registry
+        n = len(registry)
+        fill = registry.fill[:n]
+        if not depots or n == 0:
+            return {"depots": [], "pending_bins": 0, "elapsed_ms": 0.0}
+
+        depot_dist = np.stack([registry.distances_from(d["x"], d["y"]) for d in depots])
+        home = np.argmin(depot_dist, axis=0)
+        jobs = []
+        pending = 0
+        for d, depot in enumerate(depots):
+            capacities = list(depot["trucks"])
+            candidates = np.flatnonzero((home == d) & (fill >= min_fill_pct))
+            candidates = candidates[np.argsort(-fill[candidates], kind="stable")]
+            volumes = fill[candidates] / 100 * self.bin_volume_l
+            take = int(np.searchsorted(np.cumsum(volumes), sum(capacities), side="right"))
+            pending += len(candidates) - take
+            chosen = candidates[:take]
+            jobs.append((chosen, (
+                registry.x[chosen], registry.y[chosen], depot_dist[d, chosen], volumes[:take],
+                capacities, time_limit, self.neighbours)))
+
+        if self.workers > 1 and len(jobs) > 1:
+            futures = [self._executor().submit(plan_depot, *args) for _, args in jobs]
+            results = [future.result() for future in futures]
+        else:
+            results = [plan_depot(*args) for _, args in jobs]
+
+        plans = []
+        for depot, (chosen, args), (assigned, unassigned) in zip(depots, jobs, results):
+            volumes, capacities = args[3:5]
+            routes = [{
+                "truck": truck,
+                "capacity_l": capacities[truck],
+                "load_l": round(float(sum(volumes[node] for node in route)), 1),
+                "distance_m": round(distance, 1),
+                "bins": [registry.ids[chosen[node]] for node in route],
+            } for truck, route, distance in sorted(assigned)]
+            plans.append({
+                "depot": depot.get("id"),
+                "routes": routes,
+                "distance_m": round(sum(r["distance_m"] for r in routes), 1),
+                "unassigned": [registry.ids[chosen[node]] for node in unassigned],
+            })
+            pending += len(unassigned)
+        return {
+            "depots": plans,
+            "pending_bins": pending,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
@@ -1,24 +1,95 @@
 import os
-import random
-from fastapi import FastAPI, Depends
+import asyncio
+import logging
+from fastapi import Depends, HTTPException
+from pydantic import BaseModel
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from prometheus_client import make_asgi_app, Counter
-from wakanda_common import get_db_engine, get_db_session_maker
+from wakanda_common import create_service_app, get_db, json_response, RollupStore, SimulationEngine, AnomalyDetector
+from wakanda_common.tracing import detached
+from .spatial import DroneTracker
 
-app = FastAPI(title="Servicio de tráfico aéreo")
+TRAFFIC_HISTORY = RollupStore()
+TRAFFIC_ANOMALIES = AnomalyDetector("gestion_trafico")
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_db_engine(DATABASE_URL)
-AsyncSessionLocal = get_db_session_maker(engine)
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+DRONES = SimulationEngine(int(os.getenv("SIM_DRONES", "450")), seed=SIM_SEED)
+DRONES.add_flag("active", active=0.65, switch_rate=0.01)
+DRONES.add_field("speed_kmh", 200, 800, mean=520, common=60)
+DRONES.add_field("separation_m", 20, 500, mean=260, common=40)
+INCIDENT_SEPARATION_M = 40
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+AIRSPACE_SIZE_M = float(os.getenv("AIRSPACE_SIZE_M", "50000"))
+AIRSPACE_CELL_M = float(os.getenv("AIRSPACE_CELL_M", "500"))
+AIRSPACE = DroneTracker(DRONES.size, AIRSPACE_SIZE_M, AIRSPACE_SIZE_M, AIRSPACE_CELL_M, seed=SIM_SEED)
+AIRSPACE_TICK_S = float(os.getenv("AIRSPACE_TICK_S", "1"))
+MAX_AREA_RESULTS = 500
+
+logger = logging.getLogger("uvicorn")
+airspace_task = None
+
+
+class DronePosition(BaseModel):
+    x: float
+    y: float
+
+def advance_airspace():
+    DRONES.tick()
+    AIRSPACE.tick(DRONES.values("speed_kmh"))
+
+
+async def run_airspace():
+    """
+    Mueve la flota cada AIRSPACE_TICK_S segundos en segundo plano: las consultas
+    solo leen el índice y no pagan el movimiento de todos los drones
+    """
+    while True:
+        try:
+            advance_airspace()
+        except Exception as e:
+            logger.warning(f"Avance del espacio aéreo fallido: {e}")
+        await asyncio.sleep(AIRSPACE_TICK_S)
+
+
+def start_airspace():
+    global airspace_task
+    airspace_task = detached(run_airspace())
+
+
+def stop_airspace():
+    if airspace_task is not None:
+        airspace_task.cancel()
+
+
+def drone_rows(ids, distances=None):
+    index = AIRSPACE.index
+    active = DRONES.state("active")
+    rows = []
+    for pos, drone in enumerate(ids.tolist()):
+        row = {"id": drone, "x": round(float(index.x[drone]), 1), "y": round(float(index.y[drone]), 1),
+               "active": bool(active[drone])}
+        if distances is not None:
+            row["distance_m"] = round(float(distances[pos]), 1)
+        rows.append(row)
+    return rows
+
+def traffic_status(congestion):
+    if congestion < 25:
+        return "FLUIDO"
+    if congestion < 50:
+        return "MODERADO"
+    if congestion < 75:
+        return "DENSO"
+    return "CONGESTIONADO"
+
+app = create_service_app(
+    "gestion_trafico", "Servicio de tráfico aéreo",
+    requests_metric=("traffic_requests_total", "Peticiones al servicio de tráfico"),
+    startup=[start_airspace],
+    shutdown=[stop_airspace],
+)
+TRAFFIC_REQUESTS = app.state.requests
 
-TRAFFIC_REQUESTS = Counter('traffic_requests_total', 'Peticiones al servicio de tráfico')
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
 
 @app.get("/traffic/status")
 async def get_traffic_status(db: AsyncSession = Depends(get_db)):
@@ -32,19 +103,90 @@ async def get_traffic_status(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         db_status = f"Error DB: {str(e)}"
 
-    estados = ["FLUIDO", "MODERADO", "DENSO", "CONGESTIONADO"]
-    nivel = random.choice(estados)
+    drones = DRONES.count("active")
+    active = DRONES.state("active")
+    congestion = round(100 * drones / DRONES.size * (1 - (DRONES.mean("separation_m", where="active") - 20) / 480))
+    speed = round(DRONES.mean("speed_kmh", where="active"))
+    incidents = int((DRONES.values("separation_m")[active] < INCIDENT_SEPARATION_M).sum())
+    nivel = traffic_status(congestion)
+
+    readings = {
+        "congestion_level": congestion,
+        "avg_speed": speed,
+        "active_drones": drones,
+        "incidents_reported": incidents,
+    }
+    for metric, value in readings.items():
+        TRAFFIC_HISTORY.record(metric, value)
+    TRAFFIC_ANOMALIES.observe_many(readings)
 
     return {
         "service": "Gestión de Tráfico",
         "status": nivel,
-        "congestion_level": f"{random.randint(5, 98)}%",
-        "avg_speed": f"{random.randint(200, 800)} km/h",
-        "active_drones": random.randint(120, 450),
-        "incidents_reported": random.randint(0, 3),
+        "congestion_level": f"{congestion}%",
+        "avg_speed": f"{speed} km/h",
+        "active_drones": drones,
+        "incidents_reported": incidents,
+        "anomalies": TRAFFIC_ANOMALIES.recent(),
         "db_connection": db_status
     }
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+@app.get("/traffic/history")
+async def get_traffic_history(metric: str = "congestion_level", start: float = None, end: float = None,
+                              points: int = 500):
+    """
+    Histórico agregado de una métrica de tráfico (crudo, minuto, hora o día)
+    """
+    if metric not in TRAFFIC_HISTORY.metrics():
+        raise HTTPException(404, "Métrica sin lecturas")
+    return json_response(TRAFFIC_HISTORY.history(metric, start, end, points))
+
+@app.get("/traffic/drones/nearest")
+async def get_nearest_drones(x: float, y: float, k: int = 5):
+    """
+    Los k drones más cercanos a un punto del espacio aéreo
+    """
+    ids, distances = AIRSPACE.index.nearest(x, y, min(max(k, 1), MAX_AREA_RESULTS))
+    return json_response({"x": x, "y": y, "drones": drone_rows(ids, distances)})
+
+@app.get("/traffic/drones/area")
+async def get_drones_in_area(x: float = None, y: float = None, radius: float = None,
+                             min_x: float = None, min_y: float = None, max_x: float = None, max_y: float = None):
+    """
+    Drones dentro de un radio alrededor de un punto o dentro de un corredor rectangular
+    """
+    if None not in (x, y, radius):
+        ids, distances = AIRSPACE.index.radius(x, y, radius)
+    elif None not in (min_x, min_y, max_x, max_y):
+        ids, distances = AIRSPACE.index.bbox(min_x, min_y, max_x, max_y), None
+    else:
+        raise HTTPException(400, "Indica x, y y radius o bien min_x, min_y, max_x y max_y")
+    return json_response({
+        "count": len(ids),
+        "truncated": len(ids) > MAX_AREA_RESULTS,
+        "drones": drone_rows(ids[:MAX_AREA_RESULTS], None if distances is None else distances[:MAX_AREA_RESULTS])
+    })
+
+@app.get("/traffic/heatmap")
+async def get_traffic_heatmap():
+    """
+    Drones activos por celda de la rejilla del espacio aéreo
+    """
+    counts = AIRSPACE.index.heatmap(DRONES.state("active"))
+    return json_response({
+        "cell_size_m": AIRSPACE.index.cell_size,
+        "rows": AIRSPACE.index.rows,
+        "cols": AIRSPACE.index.cols,
+        "max": int(counts.max()),
+        "counts": counts.tolist()
+    })
+
+@app.put("/traffic/drones/{drone_id}/position")
+async def update_drone_position(drone_id: int, position: DronePosition):
+    """
+    Actualiza la posición reportada por un dron
+    """
+    if not 0 <= drone_id < len(AIRSPACE.index):
+        raise HTTPException(404, "Dron no encontrado")
+    AIRSPACE.index.move([drone_id], [position.x], [position.y])
+    return {"id": drone_id, "cell": int(AIRSPACE.index.cell[drone_id])}
@@ -0,0 +1,150 @@
+import time
+from itertools import chain
+import numpy as np
+
+
+class GridIndex:
+    """
+    Rejilla uniforme sobre el espacio aéreo: cada celda guarda el conjunto de drones
+    que contiene. Al moverse, solo se reubican los drones que cambian de celda.
+    """
+
+    def __init__(self, width, height, cell_size):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.cols = int(np.ceil(width / cell_size))
+        self.rows = int(np.ceil(height / cell_size))
+        self.buckets = [set() for _ in range(self.cols * self.rows)]
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.cell = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def cells_of(self, xs, ys):
+        cols = np.clip((np.asarray(xs) // self.cell_size).astype(np.int64), 0, self.cols - 1)
+        rows = np.clip((np.asarray(ys) // self.cell_size).astype(np.int64), 0, self.rows - 1)
+        return rows * self.cols + cols
+
+    def load(self, xs, ys):
+        self.x = np.array(xs, dtype=np.float64)
+        self.y = np.array(ys, dtype=np.float64)
+        self.cell = self.cells_of(self.x, self.y)
+        self.buckets = [set() for _ in range(self.cols * self.rows)]
+        for cell, ids in self._group(np.arange(len(self.x)), self.cell):
+            self.buckets[cell].update(ids)
+
+    def move(self, ids, xs, ys):
+        ids = np.asarray(ids, dtype=np.int64)
+        self.x[ids] = xs
+        self.y[ids] = ys
+        new_cells = self.cells_of(xs, ys)
+        changed = new_cells != self.cell[ids]
+        if not changed.any():
+            return 0
+        moved, old_cells, new_cells = ids[changed], self.cell[ids][changed], new_cells[changed]
+        buckets = self.buckets
+        for drone, old, new in zip(moved.tolist(), old_cells.tolist(), new_cells.tolist()):
+            buckets[old].discard(drone)
+            buckets[new].add(drone)
+        self.cell[moved] = new_cells
+        return len(moved)
+
+    def _group(self, ids, cells):
+        order = np.argsort(cells, kind="stable")
+        ids, cells = ids[order], cells[order]
+        bounds = np.flatnonzero(np.diff(cells)) + 1
+        for chunk_ids, chunk_cells in zip(np.split(ids, bounds), np.split(cells, bounds)):
+            if len(chunk_ids):
+                yield int(chunk_cells[0]), chunk_ids.tolist()
+
+    def _cells_in(self, min_x, min_y, max_x, max_y):
+        c0 = max(int(min_x // self.cell_size), 0)
+        c1 = min(int(max_x // self.cell_size), self.cols - 1)
+        r0 = max(int(min_y // self.cell_size), 0)
+        r1 = min(int(max_y // self.cell_size), self.rows - 1)
+        return [r * self.cols + c for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+    def _candidates(self, cells):
+        buckets = self.buckets
+        return np.fromiter(chain.from_iterable(buckets[c] for c in cells), dtype=np.int64)
+
+    def bbox(self, min_x, min_y, max_x, max_y):
+        ids = self._candidates(self._cells_in(min_x, min_y, max_x, max_y))
+        x, y = self.x[ids], self.y[ids]
+        return ids[(x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)]
+
+    def radius(self, x, y, r):
+        ids = self._candidates(self._cells_in(x - r, y - r, x + r, y + r))
+        dist = np.hypot(self.x[ids] - x, self.y[ids] - y)
+        inside = dist <= r
+        ids, dist = ids[inside], dist[inside]
+        order = np.argsort(dist)
+        return ids[order], dist[order]
+
+    def nearest(self, x, y, k):
+        k = min(k, len(self.x))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # Se busca desde el punto de la rejilla más cercano: un punto muy fuera
+        # no encontraría celdas por mucho que creciera el radio
+        cx, cy = min(max(x, 0.0), self.width), min(max(y, 0.0), self.height)
+        offset = max(abs(x - cx), abs(y - cy))
+        reach = self.cell_size
+        while True:
+            ids = self._candidates(self._cells_in(cx - reach, cy - reach, cx + reach, cy + reach))
+            if len(ids) >= k or reach >= max(self.width, self.height) * 2:
+                break
+            reach *= 2
+        dist = np.hypot(self.x[ids] - x, self.y[ids] - y)
+        kth = np.partition(dist, k - 1)[k - 1]
+        if kth + offset > reach:
+            ids = self._candidates(self._cells_in(x - kth, y - kth, x + kth, y + kth))
+            dist = np.hypot(self.x[ids] - x, self.y[ids] - y)
+        top = np.argpartition(dist, k - 1)[:k]
+        top = top[np.argsort(dist[top])]
+        return ids[top], dist[top]
+
+    def heatmap(self, mask=None):
+        cells = self.cell if mask is None else self.cell[mask]
+        return np.bincount(cells, minlength=self.rows * self.cols).reshape(self.rows, self.cols)
+
+
+class DroneTracker:
+    """
+    Posición y rumbo de cada dron; la velocidad la aporta el motor de simulación.
+    """
+
+    def __init__(self, size, width, height, cell_size, seed=None, clock=time.monotonic):
+        self.rng = np.random.default_rng(seed)
+        self.index = GridIndex(width, height, cell_size)
+        self.index.load(self.rng.uniform(0, width, size), self.rng.uniform(0, height, size))
+        self.heading = self.rng.uniform(0, 2 * np.pi, size)
+        self.clock = clock
+        self.last_tick = clock()
+
+    def advance(self, dt, speeds_kmh):
+        if dt <= 0:
+            return 0
+        index = self.index
+        self.heading += self.rng.normal(0, 0.1 * np.sqrt(dt), len(self.heading))
+        step = np.asarray(speeds_kmh, dtype=np.float64) / 3.6 * dt
+        x = index.x + step * np.cos(self.heading)
+        y = index.y + step * np.sin(self.heading)
+        out_x = (x < 0) | (x > index.width)
+        out_y = (y < 0) | (y > index.height)
+        self.heading[out_x] = np.pi - self.heading[out_x]
+        self.heading[out_y] = -self.heading[out_y]
+        x = np.abs(x)
+        x = np.where(x > index.width, 2 * index.width - x, x)
+        y = np.abs(y)
+        y = np.where(y > index.height, 2 * index.height - y, y)
+        return index.move(np.arange(len(x)), np.clip(x, 0, index.width), np.clip(y, 0, index.height))
+
+    def tick(self, speeds_kmh):
+        now = self.clock()
+        moved = self.advance(now - self.last_tick, speeds_kmh)
+        self.last_tick = now
+        return moved
@@ -5,6 +5,8 @@ import smtplib
 import random
 import re
 import json
+import time
+import uuid
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
@@ -14,12 +16,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from wakanda_common.metrics import MetricsMiddleware, instrument_engine, observe_sync_session_wait, metrics_app
+from wakanda_common.responses import JSONResponse
+from wakanda_common.tracing import TRACER, TracingMiddleware, Traced
+from wakanda_common.profiling import profile_response
+from wakanda_common.querylog import QUERY_LOG
 
 try:
-    from app.models import Base, User, Team, SessionLocal, engine, PasswordHistory
+    from app.models import Base, User, Team, SessionLocal, engine, replica_engine, PasswordHistory, RevokedToken
+    from app.revocation import RevocationList, RevocationNotifier, timestamp
     from app.schemas import ClubVerify, UserUpdate, RecoverRequest, RecoverConfirm
 except ImportError:
-    from .models import Base, User, Team, SessionLocal, engine, PasswordHistory
+    from .models import Base, User, Team, SessionLocal, engine, replica_engine, PasswordHistory, RevokedToken
+    from .revocation import RevocationList, RevocationNotifier, timestamp
     from .schemas import ClubVerify, UserUpdate, RecoverRequest, RecoverConfirm
 
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -29,6 +38,16 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
+# Tokens revocados en memoria, al día con la tabla revoked_tokens. Cada
+# revocación avisa al resto de procesos (NOTIFY); la sincronización periódica
+# queda de respaldo si se pierde la escucha
+REVOCATIONS = RevocationList(sync_interval=float(os.getenv("REVOCATION_SYNC_INTERVAL", "5")),
+                             clock_skew=float(os.getenv("REVOCATION_CLOCK_SKEW", "1")))
+REVOCATION_NOTIFIER = RevocationNotifier(engine, REVOCATIONS)
+REVOCATION_SYNC_OVERLAP = 60
+REVOCATION_PURGE_INTERVAL = float(os.getenv("REVOCATION_PURGE_INTERVAL", "300"))
+next_revocation_purge = 0.0
+
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
 MAIL_FROM = os.getenv("MAIL_FROM", MAIL_USERNAME)
@@ -39,14 +58,14 @@ MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "http://minio:9000")
 MINIO_ACCESS = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET = os.getenv("MINIO_SECRET_KEY", "minioadmin")
 
-s3_client = boto3.client(
+s3_client = Traced(boto3.client(
     's3',
     endpoint_url=MINIO_ENDPOINT,
     aws_access_key_id=MINIO_ACCESS,
     aws_secret_access_key=MINIO_SECRET
-)
+), "s3", ["head_bucket", "create_bucket", "put_bucket_policy", "upload_fileobj"])
 
-app = FastAPI(title="Gestión de Usuarios")
+app = FastAPI(title="Gestión de Usuarios", default_response_class=JSONResponse)
 logger = logging.getLogger("uvicorn")
 
 origins = ["http://localhost:3000", "http://localhost:5173", "*"]
@@ -57,15 +76,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, service="gestion_usuarios")
+app.add_middleware(TracingMiddleware, service="gestion_usuarios")
+app.mount("/metrics", metrics_app())
+
+instrument_engine(engine, "gestion_usuarios")
+if replica_engine is not None:
+    instrument_engine(replica_engine, "gestion_usuarios")
 
 Base.metadata.create_all(bind=engine)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = Traced(CryptContext(schemes=["bcrypt"], deprecated="auto"), "bcrypt", ["hash", "verify"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
 def get_db():
     db = SessionLocal()
+    observe_sync_session_wait(db, "gestion_usuarios")
     try:
         yield db
     finally:
@@ -73,7 +100,7 @@ def get_db():
 
 
 def init_teams():
-    db = SessionLocal()
+    db = SessionLocal(info={"primary": True})
     try:
         teams_data = [
             {"id": 1, "name": "Rick & Morty Club", "description": "Exploradores del multiverso"},
@@ -93,7 +120,7 @@ def init_teams():
 
 
 def init_admin():
-    db = SessionLocal()
+    db = SessionLocal(info={"primary": True})
     try:
         admin_email = "admin@wakanda.es"
         exists = db.query(User).filter(User.email == admin_email).first()
@@ -124,22 +151,98 @@ init_admin()
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # iat con decimales: "cerrar todas las sesiones" no afecta a un token emitido
+    # pasado el margen de reloj (REVOCATION_CLOCK_SKEW)
+    to_encode.update({"exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def sync_revocations(db: Session):
+    """
+    Trae las revocaciones recientes de la tabla (las de otras réplicas) como
+    mucho cada REVOCATION_SYNC_INTERVAL segundos o en cuanto llega un aviso.
+    Lee del primario: el aviso puede llegar antes que la fila a la réplica.
+    """
+    REVOCATION_NOTIFIER.start()
+    if not REVOCATIONS.due():
+        return
+    db.info["primary"] = True
+    query = db.query(RevokedToken.jti, RevokedToken.subject, RevokedToken.not_before, RevokedToken.expires_at) \
+        .filter(RevokedToken.expires_at > datetime.utcnow())
+    if REVOCATIONS.synced_at is not None:
+        since = datetime.utcfromtimestamp(REVOCATIONS.synced_at - REVOCATION_SYNC_OVERLAP)
+        query = query.filter(RevokedToken.created_at >= since)
+    try:
+        rows = query.all()
+    except Exception as e:
+        logger.warning(f"No se pudieron sincronizar las revocaciones: {e}")
+        REVOCATIONS.next_sync = time.time() + REVOCATIONS.sync_interval
+        return
+    REVOCATIONS.refresh((jti, subject, timestamp(not_before) if not_before else None, timestamp(expires_at))
+                        for jti, subject, not_before, expires_at in rows)
+    purge_revocations()
+
+
+def purge_revocations():
+    """
+    Borra de la tabla las revocaciones de tokens ya caducados, como mucho cada
+    REVOCATION_PURGE_INTERVAL segundos por réplica. Va en su propia sesión para
+    no confirmar nada de la petición en curso.
+    """
+    global next_revocation_purge
+    now = time.time()
+    if now < next_revocation_purge:
+        return
+    next_revocation_purge = now + REVOCATION_PURGE_INTERVAL
+    db = SessionLocal(info={"primary": True})
+    try:
+        db.query(RevokedToken).filter(RevokedToken.expires_at <= datetime.utcnow()) \
+            .delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"No se pudieron purgar las revocaciones caducadas: {e}")
+    finally:
+        db.close()
+
+
+def token_revoked_in_db(db: Session, jti: str):
+    # Puede venir de otra réplica hace nada: se pregunta al primario
+    db.info["primary"] = True
+    return db.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+
+
+def get_token_payload(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None: raise HTTPException(status_code=401)
+        if payload.get("sub") is None: raise HTTPException(status_code=401)
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
-    user = db.query(User).filter(User.email == email).first()
+    sync_revocations(db)
+    if REVOCATIONS.is_revoked(payload, lambda jti: token_revoked_in_db(db, jti)):
+        raise HTTPException(status_code=401, detail="Token revocado")
+    return payload
+
+
+def get_current_user(payload: dict = Depends(get_token_payload), db: Session = Depends(get_db)):
+    user = db.query(User).filter(User.email == payload["sub"]).first()
     if not user: raise HTTPException(status_code=401)
     return user
 
 
+def revoke_all_tokens(db: Session, email: str):
+    """
+    Invalida todos los tokens emitidos hasta ahora para el usuario (el commit
+    lo hace quien llama)
+    """
+    not_before = time.time()
+    expires_at = not_before + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    db.add(RevokedToken(subject=email, not_before=datetime.utcfromtimestamp(not_before),
+                        expires_at=datetime.utcfromtimestamp(expires_at)))
+    REVOCATIONS.revoke_all(email, not_before, expires_at)
+    REVOCATION_NOTIFIER.notify(db)
+
+
 def send_email(to_email: str, subject: str, body: str):
     if not MAIL_USERNAME or not MAIL_PASSWORD:
         return
@@ -151,12 +254,13 @@ def send_email(to_email: str, subject: str, body: str):
     msg.attach(MIMEText(body, 'html'))
 
     try:
-        server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT)
-        server.starttls()
-        server.login(MAIL_USERNAME, MAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(MAIL_FROM, to_email, text)
-        server.quit()
+        with TRACER.span("smtp.send", server=MAIL_SERVER):
+            server = smtplib.SMTP(MAIL_SERVER, MAIL_PORT)
+            server.starttls()
+            server.login(MAIL_USERNAME, MAIL_PASSWORD)
+            text = msg.as_string()
+            server.sendmail(MAIL_FROM, to_email, text)
+            server.quit()
     except Exception as e:
         logger.error(f"Fallo al enviar email: {e}")
 
@@ -326,6 +430,27 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer", "status": "LOGIN_SUCCESS"}
 
 
+@app.post("/logout")
+def logout(payload: dict = Depends(get_token_payload), db: Session = Depends(get_db)):
+    if payload.get("jti"):
+        db.add(RevokedToken(jti=payload["jti"], subject=payload["sub"],
+                            expires_at=datetime.utcfromtimestamp(payload["exp"])))
+        REVOCATIONS.revoke(payload["jti"], payload["exp"])
+        REVOCATION_NOTIFIER.notify(db)
+    else:
+        # Tokens anteriores a los jti: no se pueden revocar de uno en uno
+        revoke_all_tokens(db, payload["sub"])
+    db.commit()
+    return {"message": "Sesión cerrada"}
+
+
+@app.post("/logout/all")
+def logout_all(payload: dict = Depends(get_token_payload), db: Session = Depends(get_db)):
+    revoke_all_tokens(db, payload["sub"])
+    db.commit()
+    return {"message": "Se han cerrado todas las sesiones"}
+
+
 @app.post("/verify-account")
 def verify_account(email: str = Form(...), code: str = Form(...), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == email).first()
@@ -545,8 +670,28 @@ def confirm_password_recovery(data: RecoverConfirm, db: Session = Depends(get_db
     user.hashed_password = pwd_context.hash(data.new_password)
     user.email_verification_code = None
     user.email_code_expires_at = None
+    revoke_all_tokens(db, user.email)
     db.commit()
 
     send_password_changed_email(user.email)
 
-    return {"message": "Contraseña restablecida con éxito. Se ha enviado una confirmación a tu correo."}
\ No newline at end of file
+    return {"message": "Contraseña restablecida con éxito. Se ha enviado una confirmación a tu correo."}
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str):
+    return {"service": "gestion_usuarios", "spans": TRACER.spans(trace_id)}
+
+
+@app.get("/admin/profile")
+async def get_profile(seconds: float = 10, interval_ms: float = 5, heap: bool = False, top: int = 20,
+                      idle: bool = False, format: str = "json", user: User = Depends(get_current_user)):
+    if user.role != "ADMIN":
+        raise HTTPException(status_code=403, detail="Requiere privilegios de administrador")
+    return await profile_response(seconds, interval_ms, heap, top, idle, format)
+
+
+@app.get("/admin/queries")
+def get_top_queries(top: int = 20, user: User = Depends(get_current_user)):
+    if user.role != "ADMIN":
+        raise HTTPException(status_code=403, detail="Requiere privilegios de administrador")
+    return {"service": "gestion_usuarios", "queries": QUERY_LOG.top(top, service="gestion_usuarios")}
@@ -3,12 +3,24 @@ from datetime import datetime
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+try:
+    from app.routing import ReplicaRouter, RoutingSession
+except ImportError:
+    from .routing import ReplicaRouter, RoutingSession
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     DATABASE_URL = "sqlite:///./test.db"
 
 engine = create_engine(DATABASE_URL.replace("+asyncpg", ""))
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Réplica de solo lectura opcional para las consultas (ver routing.py)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+replica_engine = create_engine(DATABASE_REPLICA_URL.replace("+asyncpg", "")) if DATABASE_REPLICA_URL else None
+router = ReplicaRouter(engine, replica_engine,
+                       max_lag=float(os.getenv("REPLICA_MAX_LAG", "5")),
+                       check_interval=float(os.getenv("REPLICA_CHECK_INTERVAL", "5")))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=RoutingSession, router=router)
 Base = declarative_base()
 
 class Team(Base):
@@ -48,4 +60,15 @@ class PasswordHistory(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     hashed_password = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Un token concreto (jti) o todos los de un usuario emitidos antes de
+# not_before; la fila sobra a partir de expires_at
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, nullable=True, index=True)
+    subject = Column(String, index=True)
+    not_before = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,196 @@
+import os
+import math
+import time
+import select
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import text
+
+logger = logging.getLogger("uvicorn")
+
+
+class BloomFilter:
+    """
+    Conjunto aproximado: `in` puede dar falsos positivos (como mucho
+    `error_rate` con `capacity` elementos), nunca falsos negativos.
+    """
+
+    def __init__(self, capacity=10000, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        a, b = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((a + i * b) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    Tokens revocados en memoria para comprobarlos en cada petición sin ir a la BD.
+
+    - Los `jti` revocados van a un filtro de Bloom por franja de caducidad
+      (`bucket` segundos). Un token solo se busca en la franja de su propio
+      `exp`, y las franjas ya caducadas se descartan enteras. Si el filtro dice
+      "quizá", la respuesta exacta la da `exact(jti)` (la tabla).
+    - "Cerrar todas las sesiones" guarda por usuario un instante `not_before`:
+      los tokens emitidos antes quedan revocados. Se conserva hasta que caduque
+      el último token afectado.
+
+    `refresh(filas)` incorpora lo que otras réplicas han escrito en la tabla.
+    `clock_skew` da margen a `not_before` frente a relojes de otras réplicas
+    adelantados: también se rechazan los tokens emitidos en ese margen.
+    """
+
+    def __init__(self, bucket=3600, capacity=10000, error_rate=0.01, sync_interval=5.0, clock_skew=0.0,
+                 clock=time.time):
+        self.bucket = bucket
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.clock_skew = clock_skew
+        self.clock = clock
+        self.filters = {}
+        self.not_before = {}
+        self.synced_at = None
+        self.next_sync = 0.0
+
+    def revoke(self, jti, expires_at):
+        """
+        `expires_at` es el `exp` del token (segundos epoch)
+        """
+        if expires_at <= self.clock():
+            return
+        key = int(expires_at // self.bucket)
+        bloom = self.filters.get(key)
+        if bloom is None:
+            bloom = self.filters[key] = BloomFilter(self.capacity, self.error_rate)
+        bloom.add(jti)
+
+    def revoke_all(self, subject, not_before, expires_at):
+        current = self.not_before.get(subject)
+        if current is None or current[0] < not_before:
+            self.not_before[subject] = (not_before, expires_at)
+
+    def is_revoked(self, payload, exact):
+        """
+        ¿Está revocado el token (claims ya verificados)? `exact(jti)` solo se
+        llama cuando el filtro da positivo.
+        """
+        cutoff = self.not_before.get(payload.get("sub"))
+        if cutoff is not None and payload.get("iat", 0) < cutoff[0] + self.clock_skew:
+            return True
+        jti = payload.get("jti")
+        if jti is None:
+            return False
+        bloom = self.filters.get(int(payload.get("exp", 0) // self.bucket))
+        return bloom is not None and jti in bloom and exact(jti)
+
+    def due(self):
+        return self.clock() >= self.next_sync
+
+    def invalidate(self):
+        """
+        Fuerza la sincronización en la próxima comprobación
+        """
+        self.next_sync = 0.0
+
+    def refresh(self, rows):
+        """
+        Incorpora filas (jti, subject, not_before, expires_at) de la tabla y
+        descarta lo caducado. Repetir filas ya vistas no cambia nada, así que
+        cada carga puede solaparse con la anterior.
+        """
+        now = self.clock()
+        for jti, subject, not_before, expires_at in rows:
+            if jti:
+                self.revoke(jti, expires_at)
+            elif subject and not_before is not None:
+                self.revoke_all(subject, not_before, expires_at)
+        self.synced_at = now
+        self.next_sync = now + self.sync_interval
+        self.expire()
+
+    def expire(self):
+        now = self.clock()
+        current = int(now // self.bucket)
+        for key in [k for k in self.filters if k < current]:
+            del self.filters[key]
+        for subject in [s for s, (_, expires_at) in self.not_before.items() if expires_at <= now]:
+            del self.not_before[subject]
+
+
+class RevocationNotifier:
+    """
+    Aviso inmediato de revocaciones entre procesos y réplicas con LISTEN/NOTIFY
+    de PostgreSQL. Quien revoca hace `notify(db)` en la misma transacción (el
+    aviso sale al confirmar) y cada proceso escucha en un hilo propio y adelanta
+    su próxima sincronización, así que la ventana en la que otra réplica acepta
+    un token revocado es la latencia del aviso y no `sync_interval`.
+
+    Con otras BD (SQLite en pruebas) no hace nada y queda la sincronización periódica.
+    """
+
+    channel = "revoked_tokens"
+
+    def __init__(self, engine, revocations, retry=5.0):
+        self.engine = engine
+        self.revocations = revocations
+        self.retry = retry
+        self.enabled = engine.dialect.name == "postgresql"
+        self.pid = None
+
+    def notify(self, db):
+        if self.enabled:
+            db.execute(text(f"NOTIFY {self.channel}"))
+
+    def start(self):
+        """
+        Arranca el hilo una vez por proceso (los workers de gunicorn lo hacen
+        en su primera petición, después del fork)
+        """
+        if not self.enabled or self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        threading.Thread(target=self._listen, name="revocation-listener", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                conn = self.engine.raw_connection()
+                try:
+                    dbapi = conn.driver_connection
+                    dbapi.autocommit = True
+                    with dbapi.cursor() as cursor:
+                        cursor.execute(f"LISTEN {self.channel}")
+                    # Lo revocado mientras no se escuchaba
+                    self.revocations.invalidate()
+                    while True:
+                        if select.select([dbapi], [], [], 60)[0]:
+                            dbapi.poll()
+                            if dbapi.notifies:
+                                dbapi.notifies.clear()
+                                self.revocations.invalidate()
+                finally:
+                    conn.invalidate()
+            except Exception as e:
+                logger.warning(f"Escucha de revocaciones interrumpida: {e}")
+                self.revocations.invalidate()
+                time.sleep(self.retry)
+
+
+def timestamp(value: datetime):
+    """
+    Segundos epoch de un datetime naive en UTC (como los de la BD)
+    """
+    return (value - datetime(1970, 1, 1)).total_seconds()
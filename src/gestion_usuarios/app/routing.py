@@ -0,0 +1,99 @@
+import time
+import logging
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger("uvicorn")
+
+# Segundos de retraso de una réplica de Postgres (0 si ya aplicó todo lo recibido)
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replica_lag(conn):
+    if conn.dialect.name == "postgresql":
+        return float(conn.execute(POSTGRES_LAG).scalar())
+    return 0.0
+
+
+class ReplicaRouter:
+    """
+    Primario para escrituras y réplica para lecturas mientras responda y no
+    lleve más de `max_lag` segundos de retraso. El estado de la réplica se
+    comprueba como mucho cada `check_interval` segundos; mientras no sirve,
+    las lecturas van al primario.
+    """
+
+    def __init__(self, primary, replica=None, max_lag=5.0, check_interval=5.0, probe=replica_lag,
+                 clock=time.monotonic):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.probe = probe
+        self.clock = clock
+        self.healthy = replica is not None
+        self.lag = None
+        self.next_check = 0.0
+
+    def reader(self):
+        if self.replica is None:
+            return self.primary
+        now = self.clock()
+        if now >= self.next_check:
+            self.next_check = now + self.check_interval
+            self.check()
+        return self.replica if self.healthy else self.primary
+
+    def check(self):
+        try:
+            with self.replica.connect() as conn:
+                self.lag = self.probe(conn)
+            healthy = self.lag <= self.max_lag
+            reason = f"retraso de {self.lag:.1f}s"
+        except Exception as e:
+            self.lag = None
+            healthy = False
+            reason = str(e)
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Réplica de usuarios recuperada: vuelven las lecturas")
+            else:
+                logger.warning(f"Réplica de usuarios descartada ({reason}): lecturas al primario")
+        self.healthy = healthy
+
+
+def is_write(clause):
+    if clause is None:
+        return False
+    if getattr(clause, "is_dml", False):
+        return True
+    if getattr(clause, "is_select", False):
+        return False
+    statement = getattr(clause, "text", None)
+    # Texto SQL suelto: solo SELECT/WITH se consideran lecturas
+    return statement is None or not statement.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+class RoutingSession(Session):
+    """
+    Sesión que elige el motor por operación (primario o réplica, ver
+    ReplicaRouter). En cuanto escribe, todo lo que queda de la sesión va al
+    primario: lo recién confirmado se lee siempre. Con info={"primary": True}
+    la sesión entera usa el primario.
+    """
+
+    def __init__(self, *args, router=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = router
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.router is None:
+            return super().get_bind(mapper, clause=clause, **kw)
+        if self._flushing or is_write(clause):
+            self.info["primary"] = True
+        if self.info.get("primary"):
+            return self.router.primary
+        return self.router.reader()
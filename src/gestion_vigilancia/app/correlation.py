@@ -0,0 +1,167 @@
+import time
+import heapq
+from collections import deque
+
+LEVELS = ["VERDE", "AMARILLA", "NARANJA", "ROJA"]
+
+
+class Incident:
+    __slots__ = ("id", "cell", "kind", "first_seen", "last_seen", "events", "duplicates", "sources",
+                 "level", "escalated_at", "bucket")
+
+    def __init__(self, incident_id, cell, kind, ts):
+        self.id = incident_id
+        self.cell = cell
+        self.kind = kind
+        self.first_seen = ts
+        self.last_seen = ts
+        self.events = 0
+        self.duplicates = 0
+        self.sources = {}
+        self.level = 0
+        self.escalated_at = None
+        self.bucket = None
+
+    def as_dict(self, cell_size):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "level": LEVELS[self.level],
+            "x": (self.cell[0] + 0.5) * cell_size,
+            "y": (self.cell[1] + 0.5) * cell_size,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "events": self.events,
+            "duplicates": self.duplicates,
+            "drones": len(self.sources),
+        }
+
+
+class CorrelationEngine:
+    """
+    Agrupa detecciones en incidentes por celda del mapa y tipo de amenaza.
+
+    Un incidente sigue abierto mientras reciba detecciones dentro de la ventana;
+    la misma detección repetida por un dron antes de `dedup_window` solo cuenta como
+    duplicado. El nivel sube al cruzar cada umbral de detecciones distintas.
+
+    Los incidentes abiertos se indexan por cubo temporal de su última detección, así
+    que expirar solo revisa los cubos vencidos; los cerrados se guardan en una cola
+    acotada.
+    """
+
+    def __init__(self, cell_size=500.0, window=60.0, dedup_window=10.0, thresholds=(3, 10, 25),
+                 closed_limit=1000, clock=time.time):
+        self.cell_size = cell_size
+        self.window = window
+        self.dedup_window = dedup_window
+        self.thresholds = tuple(thresholds)
+        self.clock = clock
+        self.open = {}
+        self.buckets = {}
+        self.bucket_heap = []
+        self.oldest_bucket = None
+        self.closed = deque(maxlen=closed_limit)
+        self.escalations = deque(maxlen=closed_limit)
+        self.next_id = 1
+        self.ingested = 0
+        self.deduplicated = 0
+
+    def ingest(self, ts, x, y, kind, source):
+        """
+        Procesa una detección; devuelve el incidente si acaba de subir de nivel.
+        """
+        self.ingested += 1
+        if self.oldest_bucket is not None and ts // self.window - self.oldest_bucket > 2:
+            self.expire(ts)
+        key = (int(x // self.cell_size), int(y // self.cell_size), kind)
+        incident = self.open.get(key)
+        if incident is not None and ts - incident.last_seen > self.window:
+            self._close(key, incident)
+            incident = None
+        if incident is None:
+            incident = Incident(self.next_id, key[:2], kind, ts)
+            self.next_id += 1
+            self.open[key] = incident
+
+        previous = incident.sources.get(source)
+        if previous is not None and ts - previous < self.dedup_window:
+            incident.duplicates += 1
+            self.deduplicated += 1
+            if ts > incident.last_seen:
+                incident.last_seen = ts
+            self._index(key, incident)
+            return None
+
+        incident.sources[source] = ts
+        incident.events += 1
+        if ts > incident.last_seen:
+            incident.last_seen = ts
+        self._index(key, incident)
+
+        level = incident.level
+        while level < len(self.thresholds) and incident.events >= self.thresholds[level]:
+            level += 1
+        if level == incident.level:
+            return None
+        incident.level = level
+        incident.escalated_at = self.clock()
+        self.escalations.append((incident.id, LEVELS[level], incident.escalated_at - ts))
+        return incident
+
+    def ingest_many(self, events):
+        escalated = []
+        for ts, x, y, kind, source in events:
+            incident = self.ingest(ts, x, y, kind, source)
+            if incident is not None:
+                escalated.append(incident)
+        return escalated
+
+    def _index(self, key, incident):
+        bucket = int(incident.last_seen // self.window)
+        if incident.bucket == bucket:
+            return
+        incident.bucket = bucket
+        keys = self.buckets.get(bucket)
+        if keys is None:
+            keys = self.buckets[bucket] = []
+            heapq.heappush(self.bucket_heap, bucket)
+            self.oldest_bucket = self.bucket_heap[0]
+        keys.append(key)
+
+    def _close(self, key, incident):
+        del self.open[key]
+        if incident.level:
+            self.closed.append(incident)
+
+    def expire(self, now=None):
+        """
+        Cierra los incidentes sin detecciones en la última ventana.
+        """
+        now = self.clock() if now is None else now
+        if self.oldest_bucket is None:
+            return 0
+        # Un cubo solo se vacía cuando todo lo que contiene ha vencido seguro
+        limit = int(now // self.window) - 2
+        closed = 0
+        # Solo los cubos que existen: un `ts` muy antiguo no obliga a recorrer el hueco
+        while self.bucket_heap and self.bucket_heap[0] <= limit:
+            bucket = heapq.heappop(self.bucket_heap)
+            for key in self.buckets.pop(bucket, ()):
+                incident = self.open.get(key)
+                if incident is not None and incident.bucket == bucket:
+                    self._close(key, incident)
+                    closed += 1
+        self.oldest_bucket = self.bucket_heap[0] if self.bucket_heap else None
+        return closed
+
+    def incidents(self, now=None, min_level=1):
+        now = self.clock() if now is None else now
+        self.expire(now)
+        active = [i for i in self.open.values() if i.level >= min_level and now - i.last_seen <= self.window]
+        active.sort(key=lambda i: (-i.level, -i.last_seen))
+        return [i.as_dict(self.cell_size) for i in active]
+
+    def level(self, now=None):
+        now = self.clock() if now is None else now
+        return LEVELS[max((i.level for i in self.open.values() if now - i.last_seen <= self.window), default=0)]
@@ -1,24 +1,63 @@
 import os
-import random
-from fastapi import FastAPI, Depends
+import time
+from typing import List, Optional
+import numpy as np
+from fastapi import Depends, HTTPException
+from pydantic import BaseModel
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from prometheus_client import make_asgi_app, Counter
-from wakanda_common import get_db_engine, get_db_session_maker
+from prometheus_client import Counter
+from wakanda_common import create_service_app, get_db, json_response, RollupStore, SimulationEngine, AnomalyDetector
+from .correlation import CorrelationEngine, LEVELS
 
-app = FastAPI(title="Servicio de seguridad y drones")
+SECURITY_DETECTIONS = Counter('security_detections_total', 'Detecciones recibidas por el correlador')
+SECURITY_HISTORY = RollupStore()
+SECURITY_ANOMALIES = AnomalyDetector("gestion_vigilancia")
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = get_db_engine(DATABASE_URL)
-AsyncSessionLocal = get_db_session_maker(engine)
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+SECTORS = SimulationEngine(int(os.getenv("SIM_BORDER_SECTORS", "400")), seed=SIM_SEED)
+SECTORS.add_field("integrity", 92.0, 100.0, mean=97.5, spread=1.0, common=1.0)
+SECTORS.add_flag("threat", active=0.005, switch_rate=0.05)
+PATROLS = SimulationEngine(int(os.getenv("SIM_PATROL_DRONES", "60")), seed=SIM_SEED)
+PATROLS.add_flag("patrolling", active=0.7, switch_rate=0.01)
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
+BORDER_LENGTH_M = float(os.getenv("BORDER_LENGTH_M", "200000"))
+CORRELATOR = CorrelationEngine(
+    cell_size=float(os.getenv("CORRELATION_CELL_M", "500")),
+    window=float(os.getenv("CORRELATION_WINDOW_S", "60")),
+    dedup_window=float(os.getenv("DEDUP_WINDOW_S", "10")),
+    thresholds=[int(t) for t in os.getenv("ESCALATION_THRESHOLDS", "3,10,25").split(",")],
+)
+_detections_rng = np.random.default_rng(SIM_SEED)
+
+
+class Detection(BaseModel):
+    x: float
+    y: float
+    kind: str
+    drone_id: str
+    ts: Optional[float] = None
+
+def simulated_detections(now):
+    """
+    Detecciones que generan los drones de patrulla sobre los sectores con amenaza
+    """
+    sectors = np.flatnonzero(SECTORS.state("threat"))
+    if not len(sectors) or not PATROLS.count("patrolling"):
+        return []
+    width = BORDER_LENGTH_M / SECTORS.size
+    reports = np.repeat(sectors, 4)
+    xs = (reports + 0.5) * width + _detections_rng.normal(0, 50, len(reports))
+    ys = np.abs(_detections_rng.normal(200, 50, len(reports)))
+    drones = _detections_rng.choice(np.flatnonzero(PATROLS.state("patrolling")), len(reports))
+    return [(now, x, y, "intrusion", f"patrol-{d}") for x, y, d in zip(xs.tolist(), ys.tolist(), drones.tolist())]
+
+app = create_service_app(
+    "gestion_vigilancia", "Servicio de seguridad y drones",
+    requests_metric=("security_requests_total", "Peticiones al servicio de seguridad"),
+)
+SECURITY_REQUESTS = app.state.requests
 
-SECURITY_REQUESTS = Counter('security_requests_total', 'Peticiones al servicio de seguridad')
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
 
 @app.get("/security/alerts")
 async def get_security_alerts(db: AsyncSession = Depends(get_db)):
@@ -32,19 +71,62 @@ async def get_security_alerts(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         db_status = f"Error DB: {str(e)}"
 
-    alertas = ["VERDE", "AMARILLA", "NARANJA", "ROJA"]
-    nivel = random.choice(alertas)
+    SECTORS.tick()
+    PATROLS.tick()
+    now = time.time()
+    CORRELATOR.ingest_many(simulated_detections(now))
+    incidents = CORRELATOR.incidents(now)
+    threats = len(incidents)
+    nivel = CORRELATOR.level(now)
+    integrity = SECTORS.mean("integrity")
+    patrols = PATROLS.count("patrolling")
+
+    readings = {
+        "alert_level": LEVELS.index(nivel),
+        "border_integrity": integrity,
+        "detected_threats": threats,
+        "patrol_drones": patrols,
+    }
+    for metric, value in readings.items():
+        SECURITY_HISTORY.record(metric, value)
+    SECURITY_ANOMALIES.observe_many(readings)
 
     return {
         "service": "Seguridad Fronteriza",
         "status": "VIGILANCIA ACTIVA",
         "alert_level": nivel,
-        "border_integrity": f"{random.uniform(92.0, 100.0):.2f}%",
-        "detected_threats": random.randint(0, 5) if nivel != "VERDE" else 0,
-        "patrol_drones": random.randint(20, 60),
+        "border_integrity": f"{integrity:.2f}%",
+        "detected_threats": threats,
+        "patrol_drones": patrols,
+        "incidents": incidents[:50],
+        "anomalies": SECURITY_ANOMALIES.recent(),
         "db_connection": db_status
     }
 
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+@app.post("/security/events")
+async def post_security_events(detections: List[Detection]):
+    """
+    Ingesta de detecciones en bruto; devuelve los incidentes que suben de nivel
+    """
+    now = time.time()
+    for d in detections:
+        if d.ts is not None and abs(d.ts - now) > CORRELATOR.window:
+            raise HTTPException(422, f"Detección de {d.drone_id} fuera de la ventana de correlación "
+                                     f"({CORRELATOR.window:.0f}s respecto a la hora actual)")
+    SECURITY_DETECTIONS.inc(len(detections))
+    escalated = CORRELATOR.ingest_many(
+        (d.ts if d.ts is not None else now, d.x, d.y, d.kind, d.drone_id) for d in detections)
+    return {
+        "accepted": len(detections),
+        "escalated": [incident.as_dict(CORRELATOR.cell_size) for incident in {i.id: i for i in escalated}.values()]
+    }
+
+@app.get("/security/history")
+async def get_security_history(metric: str = "detected_threats", start: float = None, end: float = None,
+                               points: int = 500):
+    """
+    Histórico agregado de una métrica de seguridad (crudo, minuto, hora o día)
+    """
+    if metric not in SECURITY_HISTORY.metrics():
+        raise HTTPException(404, "Métrica sin lecturas")
+    return json_response(SECURITY_HISTORY.history(metric, start, end, points))
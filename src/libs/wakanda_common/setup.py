@@ -5,7 +5,12 @@ setup(
     version="1.0.0",
     packages=find_packages(),
     install_requires=[
+        "fastapi>=0.104.1",
+        "httpx==0.25.1",
         "sqlalchemy==2.0.23",
-        "asyncpg==0.29.0"
-    ]
+        "asyncpg==0.29.0",
+        "numpy==1.26.4",
+        "prometheus-client==0.19.0"
+    ],
+    extras_require={"fast": ["orjson==3.9.10"]}
 )
\ No newline at end of file
@@ -1,12 +1,8 @@
-import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-
-
-def get_db_engine(url):
-    return create_async_engine(url, echo=True)
-
-Base = declarative_base()
-
-def get_db_session_maker(engine):
-    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
\ No newline at end of file
+from .database import get_db_engine, get_db_session_maker, Base, Database
+from .timeseries import RollupStore
+from .simulation import SimulationEngine
+from .anomaly import AnomalyDetector
+from .metrics import MetricsMiddleware, instrument_engine, observe_session_wait, metrics_app
+from .service import create_service_app, get_db
+from .responses import JSONResponse, json_response
+from .tracing import TRACER, TracingMiddleware, Traced, critical_path, span, detached
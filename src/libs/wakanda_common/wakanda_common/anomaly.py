@@ -0,0 +1,158 @@
+import os
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import deque
+from prometheus_client import Counter
+
+ANOMALIES_TOTAL = Counter("wakanda_anomalies_total", "Lecturas anómalas detectadas", ["service", "metric"])
+
+MAD_TO_STD = 1.4826
+
+
+def _kth_deviation(ordered, median, k):
+    """
+    k-ésima menor |x - mediana| (desde 0) de una lista ordenada, sin calcular
+    todas las desviaciones: por debajo y por encima de la mediana ya salen
+    ordenadas, así que es la k-ésima de dos secuencias ordenadas (búsqueda binaria).
+    """
+    split = bisect_left(ordered, median)
+    below, above = split, len(ordered) - split
+
+    def lower(i):
+        return median - ordered[split - 1 - i]
+
+    def upper(j):
+        return ordered[split + j] - median
+
+    lo, hi = max(0, k + 1 - above), min(k + 1, below)
+    while lo < hi:
+        i = (lo + hi) // 2
+        if upper(k - i) > lower(i):
+            lo = i + 1
+        else:
+            hi = i
+    j = k + 1 - lo
+    return max(lower(lo - 1) if lo > 0 else 0.0, upper(j - 1) if j > 0 else 0.0)
+
+
+class _Metric:
+    __slots__ = ("ring", "ordered", "pos", "count", "mean", "m2", "median", "mad", "limits")
+
+    def __init__(self, window, limits):
+        self.ring = array("d", bytes(8 * window))
+        self.ordered = array("d")
+        self.pos = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.median = 0.0
+        self.mad = 0.0
+        self.limits = limits
+
+    def std(self):
+        return (self.m2 / self.count) ** 0.5 if self.count > 1 else 0.0
+
+    def push(self, x):
+        ring, window, ordered = self.ring, len(self.ring), self.ordered
+        if self.count < window:
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = ring[self.pos]
+            mean = self.mean + (x - old) / window
+            self.m2 = max(self.m2 + (x - old) * (x - mean + old - self.mean), 0.0)
+            self.mean = mean
+            del ordered[bisect_left(ordered, old)]
+        ring[self.pos] = x
+        self.pos = (self.pos + 1) % window
+        insort(ordered, x)
+
+        # Mediana y MAD de la ventana sobre la copia ordenada
+        n = len(ordered)
+        half = n // 2
+        if n % 2:
+            self.median = ordered[half]
+            self.mad = _kth_deviation(ordered, self.median, half)
+        else:
+            self.median = (ordered[half - 1] + ordered[half]) / 2
+            self.mad = (_kth_deviation(ordered, self.median, half - 1)
+                        + _kth_deviation(ordered, self.median, half)) / 2
+
+
+class AnomalyDetector:
+    """
+    Detector de lecturas anómalas por métrica.
+
+    Cada métrica guarda una ventana circular de lecturas con media y varianza
+    deslizantes (Welford) y una copia ordenada de la misma ventana (array de
+    doubles), de la que salen la mediana y la MAD exactas. Cada lectura quita
+    e inserta un valor por bisección; el desplazamiento de memoria crece con la
+    ventana, pero es una copia en C que pesa poco frente al resto. Una lectura
+    es anómala si se sale de los límites fijos de la métrica o si se aleja más
+    de `sensitivity` desviaciones tanto de la media como de la mediana.
+    """
+
+    def __init__(self, service, window=None, sensitivity=None, min_samples=30, limits=None, recent_limit=100,
+                 clock=time.time):
+        self.service = service
+        self.window = window or int(os.getenv("ANOMALY_WINDOW", "300"))
+        self.sensitivity = sensitivity or float(os.getenv("ANOMALY_SENSITIVITY", "4.0"))
+        self.min_samples = min(min_samples, self.window)
+        self.limits = dict(limits or {})
+        self.metrics = {}
+        self.recent_anomalies = deque(maxlen=recent_limit)
+        self.clock = clock
+
+    def observe(self, metric, value, ts=None):
+        """
+        Evalúa la lectura contra la ventana previa y la incorpora; devuelve la anomalía o None.
+        """
+        state = self.metrics.get(metric)
+        if state is None:
+            state = self.metrics[metric] = _Metric(self.window, self.limits.get(metric))
+        value = float(value)
+        reason = None
+        score = 0.0
+        if state.limits is not None and not state.limits[0] <= value <= state.limits[1]:
+            reason = "fuera de rango"
+        elif state.count >= self.min_samples:
+            floor = max(abs(state.median) * 1e-3, 1e-9)
+            z = abs(value - state.mean) / max(state.std(), floor)
+            robust = abs(value - state.median) / max(MAD_TO_STD * state.mad, floor)
+            score = min(z, robust)
+            if score > self.sensitivity:
+                reason = "desviación"
+        state.push(value)
+        if reason is None:
+            return None
+
+        anomaly = {
+            "metric": metric,
+            "value": value,
+            "reason": reason,
+            "score": round(score, 2),
+            "expected": round(state.median, 3),
+            "ts": self.clock() if ts is None else ts,
+        }
+        self.recent_anomalies.append(anomaly)
+        ANOMALIES_TOTAL.labels(service=self.service, metric=metric).inc()
+        return anomaly
+
+    def observe_many(self, readings, ts=None):
+        flagged = []
+        for metric, value in readings.items():
+            if self.observe(metric, value, ts) is not None:
+                flagged.append(metric)
+        return flagged
+
+    def recent(self, horizon=300, now=None):
+        now = self.clock() if now is None else now
+        return [a for a in self.recent_anomalies if now - a["ts"] <= horizon]
+
+    def stats(self, metric):
+        state = self.metrics[metric]
+        return {"mean": state.mean, "std": state.std(), "median": state.median,
+                "mad": state.mad, "count": state.count}
@@ -0,0 +1,50 @@
+import os
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker, declarative_base
+from .metrics import instrument_engine
+
+# Imprime cada sentencia; solo para depurar (los tiempos están en /metrics)
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+
+def get_db_engine(url, service=None):
+    engine = create_async_engine(url, echo=SQL_ECHO)
+    if service:
+        instrument_engine(engine, service)
+    return engine
+
+Base = declarative_base()
+
+def get_db_session_maker(engine):
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+class Database:
+    """
+    Motor y fábrica de sesiones de un servicio, creados la primera vez que se
+    necesitan (normalmente en el arranque de la app, no al importar).
+    """
+
+    def __init__(self, url, service=None):
+        self.url = url
+        self.service = service
+        self._engine = None
+        self._sessions = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = get_db_engine(self.url, service=self.service)
+            self._sessions = get_db_session_maker(self._engine)
+        return self._engine
+
+    @property
+    def sessions(self):
+        if self._sessions is None:
+            self.engine
+        return self._sessions
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = self._sessions = None
@@ -0,0 +1,51 @@
+"""
+Configuración de gunicorn compartida por todos los servicios:
+
+    gunicorn app.main:app -c python:wakanda_common.gunicorn_conf
+
+Los workers son de uvicorn. La app se carga una vez en el proceso maestro y los
+workers la heredan al hacer fork, así que arrancar un worker no repite las
+importaciones ni el estado inicial. `kill -HUP` al maestro relee esta
+configuración y sustituye los workers de forma ordenada; para recargar código
+hay que arrancar con GUNICORN_PRELOAD=0.
+
+Con PROMETHEUS_MULTIPROC_DIR definido, cada worker escribe sus métricas en ese
+directorio y /metrics las agrega todas.
+"""
+import os
+import glob
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESSLOG")
+
+PROMETHEUS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_DIR:
+    os.makedirs(PROMETHEUS_DIR, exist_ok=True)
+
+
+def on_starting(server):
+    # Solo al arrancar el maestro (no en cada HUP): restos de una ejecución anterior
+    if PROMETHEUS_DIR:
+        for path in glob.glob(os.path.join(PROMETHEUS_DIR, "*.db")):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    # Las conexiones abiertas por el maestro al importar la app no se comparten
+    from wakanda_common.metrics import ENGINES
+    for engine in ENGINES:
+        getattr(engine, "sync_engine", engine).dispose(close=False)
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,172 @@
+import os
+import time
+from sqlalchemy import event
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, make_asgi_app, multiprocess
+from .querylog import QUERY_LOG
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"}
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "CONNECT", "TRACE"}
+
+HTTP_LATENCY = Histogram("wakanda_http_request_duration_seconds", "Latencia de las peticiones HTTP",
+                         ["service", "method", "route"], buckets=LATENCY_BUCKETS)
+HTTP_RESPONSES = Counter("wakanda_http_responses_total", "Respuestas HTTP por código",
+                         ["service", "method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("wakanda_http_requests_in_flight", "Peticiones HTTP en curso", ["service"],
+                       multiprocess_mode="livesum")
+DB_SESSION_WAIT = Histogram("wakanda_db_session_wait_seconds", "Espera hasta obtener conexión del pool",
+                            ["service"], buckets=LATENCY_BUCKETS)
+DB_QUERY_DURATION = Histogram("wakanda_db_query_duration_seconds", "Duración de las consultas SQL",
+                              ["service", "operation"], buckets=LATENCY_BUCKETS)
+
+UNMATCHED_ROUTE = "sin_ruta"
+ENGINES = []
+
+
+def metrics_app():
+    """
+    App ASGI de /metrics. Con varios workers (PROMETHEUS_MULTIPROC_DIR) agrega
+    los ficheros de todos los procesos en lugar de leer solo el propio.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return make_asgi_app(registry=registry)
+    return make_asgi_app()
+
+
+def route_template(scope, templates):
+    """
+    Plantilla de la ruta que atendió la petición (/drones/{drone_id}, no la URL
+    concreta), guardada en `templates` por endpoint.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    template = templates.get(endpoint)
+    if template is None:
+        template = UNMATCHED_ROUTE
+        for route in getattr(scope.get("app"), "routes", ()):
+            if getattr(route, "endpoint", None) is endpoint:
+                template = route.path_format
+                break
+        templates[endpoint] = template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI con latencia por ruta (la plantilla, no la URL concreta),
+    peticiones en curso y respuestas por código de estado.
+
+    Los hijos etiquetados de cada métrica se guardan la primera vez que aparecen
+    para no resolver etiquetas en cada petición.
+    """
+
+    def __init__(self, app, service, skip_paths=("/metrics",)):
+        self.app = app
+        self.service = service
+        self.skip_paths = tuple(skip_paths)
+        self.in_flight = HTTP_IN_FLIGHT.labels(service=service)
+        self.templates = {}
+        self.latency = {}
+        self.responses = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight.dec()
+            # El método lo elige el cliente: los no estándar van juntos para no crear series sin límite
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "OTHER"
+            key = (method, route_template(scope, self.templates))
+            latency = self.latency.get(key)
+            if latency is None:
+                latency = self.latency[key] = HTTP_LATENCY.labels(self.service, *key)
+            latency.observe(elapsed)
+            counter_key = key + (status,)
+            responses = self.responses.get(counter_key)
+            if responses is None:
+                responses = self.responses[counter_key] = HTTP_RESPONSES.labels(self.service, *key, str(status))
+            responses.inc()
+
+
+def instrument_engine(engine, service):
+    """
+    Registra la duración de cada consulta del motor (síncrono o asíncrono), por
+    operación y por huella (querylog), y dentro de una petición trazada su span.
+    """
+    from .tracing import TRACER
+
+    target = getattr(engine, "sync_engine", engine)
+    children = {}
+    ENGINES.append(engine)
+
+    @event.listens_for(target, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("wakanda_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("wakanda_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        words = statement.split(None, 1)
+        operation = words[0].upper() if words else "OTHER"
+        if operation not in QUERY_OPERATIONS:
+            operation = "OTHER"
+        child = children.get(operation)
+        if child is None:
+            child = children[operation] = DB_QUERY_DURATION.labels(service, operation)
+        child.observe(elapsed)
+        QUERY_LOG.observe(service, statement, parameters, elapsed)
+        TRACER.record(f"db {operation}", elapsed, statement=statement[:200])
+
+    @event.listens_for(target, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("wakanda_query_start") if context.connection is not None else None
+        if starts:
+            TRACER.record("db ERROR", time.perf_counter() - starts.pop(), error=str(context.original_exception),
+                          statement=context.statement[:200] if context.statement else None)
+
+    return engine
+
+
+async def observe_session_wait(session, service):
+    """
+    Pide la conexión de la sesión al pool y mide cuánto tarda. Si la BD no
+    responde, el fallo se deja para la consulta del endpoint, que ya lo informa.
+    """
+    start = time.perf_counter()
+    try:
+        await session.connection()
+    except Exception:
+        pass
+    finally:
+        DB_SESSION_WAIT.labels(service).observe(time.perf_counter() - start)
+
+
+def observe_sync_session_wait(session, service):
+    start = time.perf_counter()
+    try:
+        session.connection()
+    except Exception:
+        pass
+    finally:
+        DB_SESSION_WAIT.labels(service).observe(time.perf_counter() - start)
@@ -0,0 +1,139 @@
+"""
+Perfilado bajo demanda del proceso en marcha: muestreo estadístico de las
+pilas de todos los hilos y, opcionalmente, las asignaciones de memoria
+(tracemalloc) hechas durante la ventana.
+
+No hay coste mientras no se perfila; durante el perfil, un hilo aparte lee
+las pilas cada `interval` segundos. Con varios workers se perfila solo el que
+atiende la petición.
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+from fastapi import HTTPException
+from fastapi.responses import PlainTextResponse
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MIN_INTERVAL = 0.001
+HEAP_FRAMES = 10
+# Hilos bloqueados esperando E/S o un lock: cuentan como espera, no como CPU
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+               ("socket.py", "accept"), ("thread.py", "_worker")}
+
+_LOCK = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(code):
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return f"{code.co_name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+def _collapse(frame, labels):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            label = labels[code] = _frame_label(code)
+        stack.append(label)
+        frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+def sample_stacks(seconds, interval=0.005, idle=False):
+    """
+    Cuenta las pilas colapsadas ("raíz;...;hoja") vistas en cada muestra; sin
+    `idle`, se omiten los hilos en espera. Bloquea durante `seconds`: desde
+    código asíncrono, en un hilo aparte.
+    """
+    own = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    labels = {}
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (not idle and _is_idle(frame)):
+                continue
+            stacks[f"{names.get(ident, ident)};{_collapse(frame, labels)}"] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def heap_top(snapshot, top):
+    stats = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+    ]).statistics("lineno")
+    return [{"file": stat.traceback[0].filename, "line": stat.traceback[0].lineno,
+             "size_kb": round(stat.size / 1024, 1), "count": stat.count} for stat in stats[:top]]
+
+
+async def profile(seconds=10.0, interval=0.005, heap=False, top=20, idle=False):
+    """
+    Perfil de `seconds` segundos del proceso. Devuelve las pilas colapsadas
+    (formato de flamegraph.pl / speedscope), las funciones con más muestras
+    propias y, con `heap`, el top de memoria asignada durante la ventana que
+    sigue viva. Con `idle` se incluyen los hilos en espera (tiempo de reloj).
+
+    Solo un perfil a la vez por proceso (ProfilerBusy).
+    """
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    interval = max(interval, PROFILE_MIN_INTERVAL)
+    if not _LOCK.acquire(blocking=False):
+        raise ProfilerBusy("Ya hay un perfil en curso")
+    started_heap = False
+    try:
+        if heap and not tracemalloc.is_tracing():
+            tracemalloc.start(HEAP_FRAMES)
+            started_heap = True
+        stacks, samples = await asyncio.to_thread(sample_stacks, seconds, interval, idle)
+        result = {
+            "seconds": seconds,
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "collapsed": "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()),
+        }
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        result["top"] = [{"function": name, "samples": count, "percent": round(100 * count / total, 1)}
+                         for name, count in leaves.most_common(top)]
+        if heap:
+            result["heap"] = heap_top(tracemalloc.take_snapshot(), top)
+        return result
+    finally:
+        if started_heap:
+            tracemalloc.stop()
+        _LOCK.release()
+
+
+async def profile_response(seconds, interval_ms, heap, top, idle, format):
+    """
+    Respuesta de los endpoints /admin/profile: JSON o, con format=collapsed,
+    texto para flamegraph.pl / speedscope.
+    """
+    try:
+        result = await profile(seconds, interval_ms / 1000, heap, top, idle)
+    except ProfilerBusy as e:
+        raise HTTPException(409, str(e))
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"] + "\n")
+    return result
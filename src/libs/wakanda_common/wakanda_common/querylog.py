@@ -0,0 +1,126 @@
+"""
+Estadísticas por huella de consulta SQL: la sentencia sin literales ni
+parámetros, para agrupar las que solo cambian en los valores.
+
+Se alimenta desde los eventos del motor (metrics.instrument_engine). Las
+consultas que superan SLOW_QUERY_MS se registran en el log con los
+parámetros sustituidos por su tipo.
+"""
+import os
+import re
+import hashlib
+import logging
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger("uvicorn")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+MAX_FINGERPRINTS = int(os.getenv("MAX_QUERY_FINGERPRINTS", "200"))
+OTHER_FINGERPRINT = "otras"
+
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_FINGERPRINT_DURATION = Histogram("wakanda_db_statement_duration_seconds",
+                                       "Duración de las consultas SQL por huella",
+                                       ["service", "fingerprint"], buckets=STATEMENT_BUCKETS)
+SLOW_QUERIES = Counter("wakanda_db_slow_queries_total", "Consultas por encima de SLOW_QUERY_MS",
+                       ["service", "fingerprint"])
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?\b|\$\d+|%\(\w+\)s|(?<!:):\w+|\?")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(statement):
+    """
+    "SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'"
+      -> "SELECT * FROM t WHERE id IN (?+) AND name = ?"
+    """
+    statement = _SPACES.sub(" ", statement.strip())
+    statement = _LITERALS.sub("?", statement)
+    return _IN_LISTS.sub("(?+)", statement)
+
+
+def fingerprint(statement):
+    normalized = normalize(statement)
+    return hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest(), normalized
+
+
+def redact(parameters):
+    """
+    Parámetros con cada valor sustituido por su tipo (sin datos personales
+    ni contraseñas en los logs)
+    """
+    if isinstance(parameters, dict):
+        return {key: f"<{type(value).__name__}>" for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return {"filas": len(parameters), "primera": redact(parameters[0])}
+        return [f"<{type(value).__name__}>" for value in parameters]
+    return None if parameters is None else f"<{type(parameters).__name__}>"
+
+
+class QueryLog:
+    """
+    Llamadas, tiempo total y máximo por (servicio, huella) en este proceso.
+    Como mucho `max_fingerprints` huellas distintas; el resto se acumula en
+    "otras" para no disparar la cardinalidad de las métricas.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, max_fingerprints=MAX_FINGERPRINTS):
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self.stats = {}
+        self.fingerprints = {}
+        self.histograms = {}
+
+    def fingerprint(self, statement):
+        # Las sentencias con parámetros se repiten idénticas: se normaliza una vez
+        found = self.fingerprints.get(statement)
+        if found is None:
+            found = fingerprint(statement)
+            if len(self.fingerprints) < self.max_fingerprints * 5:
+                self.fingerprints[statement] = found
+        return found
+
+    def observe(self, service, statement, parameters, seconds):
+        fid, normalized = self.fingerprint(statement)
+        key = (service, fid)
+        entry = self.stats.get(key)
+        if entry is None:
+            if len(self.stats) >= self.max_fingerprints:
+                fid, normalized = OTHER_FINGERPRINT, None
+                key = (service, fid)
+                entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = [normalized, 0, 0.0, 0.0]
+        entry[1] += 1
+        entry[2] += seconds
+        entry[3] = max(entry[3], seconds)
+
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = QUERY_FINGERPRINT_DURATION.labels(service, fid)
+        histogram.observe(seconds)
+
+        if seconds * 1000 >= self.slow_ms:
+            SLOW_QUERIES.labels(service, fid).inc()
+            logger.warning(f"Consulta lenta ({service}, {seconds * 1000:.0f} ms, huella {fid}): "
+                           f"{normalize(statement)} parámetros={redact(parameters)}")
+
+    def top(self, n=20, service=None):
+        rows = [
+            {"service": s, "fingerprint": fid, "query": query, "calls": calls,
+             "total_ms": round(total * 1000, 2), "mean_ms": round(total * 1000 / calls, 3),
+             "max_ms": round(worst * 1000, 2)}
+            for (s, fid), (query, calls, total, worst) in self.stats.items()
+            if service is None or s == service
+        ]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows[:n]
+
+    def clear(self):
+        self.stats.clear()
+        self.histograms.clear()
+
+
+QUERY_LOG = QueryLog()
@@ -0,0 +1,30 @@
+"""
+Serialización JSON de las respuestas. Con orjson instalado las respuestas se
+codifican con él; sin orjson (o con FAST_JSON=0) se usa el `json` estándar.
+"""
+import os
+from fastapi.responses import JSONResponse as StdJSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON = orjson is not None and os.getenv("FAST_JSON", "1") == "1"
+
+
+class FastJSONResponse(StdJSONResponse):
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+JSONResponse = FastJSONResponse if FAST_JSON else StdJSONResponse
+
+
+def json_response(content, status_code=200, headers=None):
+    """
+    Respuesta ya serializada. Devolverla desde un endpoint evita que FastAPI
+    recorra el contenido con `jsonable_encoder`; solo para contenido que ya son
+    tipos JSON nativos (dict, list, str, números).
+    """
+    return JSONResponse(content, status_code=status_code, headers=headers)
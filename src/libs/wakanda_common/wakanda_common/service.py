@@ -0,0 +1,125 @@
+import os
+import asyncio
+import inspect
+import logging
+from contextlib import asynccontextmanager
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Request
+from sqlalchemy import text
+from prometheus_client import Counter
+from .database import Database
+from .metrics import MetricsMiddleware, metrics_app, observe_session_wait
+from .responses import JSONResponse
+from .tracing import TRACER, TracingMiddleware
+from .querylog import QUERY_LOG
+
+logger = logging.getLogger("uvicorn")
+
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", "http://gestion-usuarios:8000")
+
+
+async def _run(hooks):
+    for hook in hooks:
+        result = hook()
+        if inspect.isawaitable(result):
+            await result
+
+
+def create_service_app(name, title, requests_metric, startup=(), shutdown=(), database_url=None,
+                       response_class=JSONResponse):
+    """
+    App FastAPI de un servicio de dominio con todo lo común ya montado: motor de
+    BD perezoso, contador de peticiones, métricas HTTP y de BD, trazas, /metrics,
+    /health (vivo), /ready (BD accesible y arranque terminado),
+    /traces/{trace_id} (spans de la traza en este proceso) y /admin/queries
+    (consultas SQL con más tiempo total, solo para administradores).
+
+    El motor y los `startup` se crean en el lifespan de cada proceso, no al
+    importar, y se liberan al parar.
+    """
+    db = Database(database_url or os.getenv("DATABASE_URL"), service=name)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        try:
+            db.engine
+        except Exception as e:
+            logger.warning(f"{name}: motor de BD no disponible: {e}")
+        await _run(startup)
+        app.state.started = True
+        yield
+        app.state.started = False
+        await _run(shutdown)
+        await db.dispose()
+
+    app = FastAPI(title=title, lifespan=lifespan, default_response_class=response_class)
+    app.state.service = name
+    app.state.db = db
+    app.state.started = False
+    app.state.requests = Counter(*requests_metric)
+    app.add_middleware(MetricsMiddleware, service=name)
+    app.add_middleware(TracingMiddleware, service=name)
+    app.mount("/metrics", metrics_app())
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    async def readiness_check():
+        if not app.state.started:
+            return JSONResponse({"status": "starting"}, status_code=503)
+
+        async def ping():
+            async with db.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        try:
+            await asyncio.wait_for(ping(), READY_TIMEOUT)
+        except Exception as e:
+            return JSONResponse({"status": "db_unavailable", "detail": str(e)}, status_code=503)
+        return {"status": "ready"}
+
+    @app.get("/traces/{trace_id}")
+    async def get_trace(trace_id: str):
+        return {"service": name, "spans": TRACER.spans(trace_id)}
+
+    @app.get("/admin/queries", dependencies=[Depends(require_admin)])
+    async def get_top_queries(top: int = 20):
+        return {"service": name, "queries": QUERY_LOG.top(top, service=name)}
+
+    return app
+
+
+async def require_admin(request: Request):
+    """
+    Como en el gateway: los servicios de dominio no validan tokens, preguntan
+    al servicio de usuarios quién es
+    """
+    token = request.headers.get("authorization")
+    if not token:
+        raise HTTPException(status_code=401, detail="No autorizado")
+    try:
+        async with httpx.AsyncClient(headers={"Authorization": token}, timeout=5.0) as client:
+            resp = await client.get(f"{USERS_SERVICE_URL}/me")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Servicio de usuarios no disponible")
+    if resp.status_code >= 400:
+        raise HTTPException(status_code=401, detail="No autorizado")
+    if resp.json().get("role") != "ADMIN":
+        raise HTTPException(status_code=403, detail="Requiere privilegios de administrador")
+
+
+async def get_db(request: Request):
+    """
+    Sesión de BD por petición del servicio al que pertenece la ruta.
+    """
+    db = request.app.state.db
+    try:
+        sessions = db.sessions
+    except Exception:
+        raise HTTPException(503, "Base de datos no disponible")
+    async with sessions() as session:
+        await observe_session_wait(session, request.app.state.service)
+        yield session
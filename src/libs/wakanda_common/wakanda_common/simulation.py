@@ -0,0 +1,97 @@
+import time
+import numpy as np
+
+
+class SimulationEngine:
+    """
+    Estado por entidad (drones, turbinas, tuberías, camiones...) en arrays de NumPy.
+
+    Los campos continuos siguen un proceso de Ornstein-Uhlenbeck acotado alrededor
+    de una media que a su vez deriva con un componente común a toda la ciudad; los
+    indicadores on/off siguen una cadena de Markov de dos estados. Todo se avanza
+    con su solución exacta, así que un único paso vectorizado cubre cualquier `dt`.
+    """
+
+    def __init__(self, size, seed=None, clock=time.monotonic):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock
+        self.last_tick = clock()
+        self.fields = {}
+        self.flags = {}
+
+    def add_field(self, name, low, high, mean=None, spread=None, common=0.0, reversion=0.05):
+        mean = (low + high) / 2 if mean is None else mean
+        spread = (high - low) / 6 if spread is None else spread
+        values = self.rng.normal(mean, spread, self.size).astype(np.float32)
+        np.clip(values, low, high, out=values)
+        self.fields[name] = {
+            "values": values, "low": low, "high": high, "mean": mean, "offset": 0.0,
+            "spread": spread, "common": common, "reversion": reversion,
+        }
+        return values
+
+    def add_flag(self, name, active=0.5, switch_rate=0.02):
+        state = self.rng.random(self.size) < active
+        self.flags[name] = {"state": state, "active": active, "switch_rate": switch_rate}
+        return state
+
+    def advance(self, dt):
+        if dt <= 0:
+            return
+        for field in self.fields.values():
+            values = field["values"]
+            decay = np.exp(-field["reversion"] * dt)
+            jitter = np.sqrt(1 - decay ** 2)
+            if field["common"]:
+                field["offset"] = field["offset"] * decay + field["common"] * jitter * self.rng.standard_normal()
+            center = field["mean"] + field["offset"]
+            noise = self.rng.standard_normal(self.size, dtype=np.float32)
+            noise *= field["spread"] * jitter
+            values -= center
+            values *= decay
+            values += center
+            values += noise
+            np.clip(values, field["low"], field["high"], out=values)
+        for flag in self.flags.values():
+            p = flag["active"]
+            decay = np.exp(-flag["switch_rate"] * dt)
+            draws = self.rng.random(self.size, dtype=np.float32)
+            state = flag["state"]
+            flag["state"] = np.where(state, draws < p + (1 - p) * decay, draws < p * (1 - decay))
+
+    def tick(self):
+        now = self.clock()
+        self.advance(now - self.last_tick)
+        self.last_tick = now
+
+    def values(self, name):
+        return self.fields[name]["values"]
+
+    def state(self, name):
+        return self.flags[name]["state"]
+
+    def count(self, flag):
+        return int(np.count_nonzero(self.flags[flag]["state"]))
+
+    def mean(self, name, where=None):
+        values = self.fields[name]["values"]
+        if where is not None:
+            mask = self.flags[where]["state"]
+            if not mask.any():
+                return float(self.fields[name]["mean"])
+            values = values[mask]
+        return float(values.mean(dtype=np.float64))
+
+    def snapshot(self):
+        snapshot = {"entities": self.size}
+        for name, field in self.fields.items():
+            values = field["values"]
+            snapshot[name] = {
+                "mean": round(float(values.mean(dtype=np.float64)), 3),
+                "min": round(float(values.min()), 3),
+                "max": round(float(values.max()), 3),
+            }
+        for name in self.flags:
+            snapshot[name] = self.count(name)
+        return snapshot
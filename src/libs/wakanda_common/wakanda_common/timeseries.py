@@ -0,0 +1,113 @@
+import time
+from collections import deque
+
+RAW_RETENTION = 3600
+ROLLUP_RESOLUTIONS = (
+    (60, 2 * 86400),
+    (3600, 30 * 86400),
+    (86400, 365 * 86400),
+)
+
+
+class _Rollup:
+    """
+    Agregados min/max/suma/cuenta por cubo de tiempo de una resolución
+    """
+
+    def __init__(self, resolution, retention):
+        self.resolution = resolution
+        self.retention = retention
+        self.buckets = {}
+        self.order = deque()
+
+    def add(self, ts, value):
+        key = int(ts // self.resolution) * self.resolution
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [value, value, value, 1]
+            self.order.append(key)
+        else:
+            if value < bucket[0]: bucket[0] = value
+            if value > bucket[1]: bucket[1] = value
+            bucket[2] += value
+            bucket[3] += 1
+
+    def expire(self, now):
+        limit = now - self.retention
+        while self.order and self.order[0] + self.resolution <= limit:
+            del self.buckets[self.order.popleft()]
+
+    def points(self, start, end):
+        first = int(start // self.resolution) * self.resolution
+        points = []
+        for key in self.order:
+            if first <= key <= end:
+                low, high, total, count = self.buckets[key]
+                points.append({"t": key, "min": low, "max": high, "avg": round(total / count, 4), "count": count})
+        return points
+
+
+class RollupStore:
+    """
+    Histórico de lecturas con rollups incrementales a 1 minuto, 1 hora y 1 día.
+
+    Las lecturas crudas caducan tras `raw_retention` segundos; los rollups
+    se conservan según la retención de cada resolución.
+    """
+
+    def __init__(self, raw_retention=RAW_RETENTION, resolutions=ROLLUP_RESOLUTIONS):
+        self.raw_retention = raw_retention
+        self.resolutions = resolutions
+        self.raw = {}
+        self.rollups = {}
+
+    def record(self, metric, value, ts=None):
+        ts = time.time() if ts is None else ts
+        value = float(value)
+        raw = self.raw.get(metric)
+        if raw is None:
+            raw = self.raw[metric] = deque()
+            self.rollups[metric] = [_Rollup(res, ret) for res, ret in self.resolutions]
+        raw.append((ts, value))
+        limit = ts - self.raw_retention
+        while raw and raw[0][0] < limit:
+            raw.popleft()
+        for rollup in self.rollups[metric]:
+            rollup.add(ts, value)
+            rollup.expire(ts)
+
+    def metrics(self):
+        return list(self.raw)
+
+    def history(self, metric, start=None, end=None, max_points=500, now=None):
+        """
+        Devuelve la serie con la resolución más fina cuyo número de puntos
+        cabe en `max_points` y cuya retención cubre el rango pedido
+        """
+        now = time.time() if now is None else now
+        end = now if end is None else end
+        start = end - 3600 if start is None else start
+        max_points = max(1, max_points)
+        if metric not in self.raw:
+            return {"metric": metric, "resolution": None, "start": start, "end": end, "points": []}
+
+        span = max(end - start, 0)
+        raw = self.raw[metric]
+        if start >= now - self.raw_retention:
+            points = [{"t": ts, "value": v} for ts, v in raw if start <= ts <= end]
+            if len(points) <= max_points:
+                return {"metric": metric, "resolution": "raw", "start": start, "end": end, "points": points}
+
+        rollups = self.rollups[metric]
+        chosen = rollups[-1]
+        for rollup in rollups:
+            if start >= now - rollup.retention and span / rollup.resolution <= max_points:
+                chosen = rollup
+                break
+        return {
+            "metric": metric,
+            "resolution": chosen.resolution,
+            "start": start,
+            "end": end,
+            "points": chosen.points(start, end),
+        }
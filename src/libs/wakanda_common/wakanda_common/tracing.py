@@ -0,0 +1,305 @@
+"""
+Trazas distribuidas ligeras con contexto W3C (`traceparent`).
+
+Cada proceso guarda en memoria las trazas recientes (para poder consultarlas
+aunque no se hayan muestreado) y exporta a TRACE_EXPORT_PATH, en JSON por
+líneas con los nombres de campo de OTLP, las que se muestrearon al entrar
+(TRACE_SAMPLE_RATE) más las lentas (TRACE_SLOW_MS) o con error.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from .metrics import route_template
+
+logger = logging.getLogger("uvicorn")
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "500"))
+TRACE_SKIP_PATHS = ("/metrics", "/health", "/ready", "/traces")
+
+_CURRENT = ContextVar("wakanda_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "service", "start", "end", "attributes", "error",
+                 "sampled", "exported")
+
+    def __init__(self, trace_id, parent_id, name, service, sampled, attributes):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+        self.exported = False
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.time_ns()) - self.start) / 1e6
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def as_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": self.end,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+def parse_traceparent(value):
+    """
+    (trace_id, parent_id, muestreada) de una cabecera W3C válida, o None
+    """
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+class Tracer:
+    def __init__(self, service=None, sample_rate=TRACE_SAMPLE_RATE, slow_ms=TRACE_SLOW_MS,
+                 export_path=TRACE_EXPORT_PATH, buffer=TRACE_BUFFER, rng=None):
+        self.service = service
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self.buffer = buffer
+        self.rng = rng or random.Random()
+        self.recent = OrderedDict()
+
+    def begin(self, name, traceparent=None, service=None, **attributes):
+        """
+        Span de entrada al proceso: continúa la traza de la cabecera o empieza
+        una nueva con decisión de muestreo propia.
+        """
+        remote = parse_traceparent(traceparent)
+        if remote is None:
+            trace_id, parent_id = f"{self.rng.getrandbits(128):032x}", None
+            sampled = self.rng.random() < self.sample_rate
+        else:
+            trace_id, parent_id, sampled = remote
+        span = Span(trace_id, parent_id, name, service or self.service, sampled, attributes)
+        self._keep(span)
+        return span, _CURRENT.set(span)
+
+    def finish(self, span, token):
+        span.end = time.time_ns()
+        _CURRENT.reset(token)
+        if span.sampled or span.error or span.duration_ms >= self.slow_ms:
+            self.export(span.trace_id)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Span hijo del actual; fuera de una petición trazada no hace nada.
+        """
+        parent = self._parent()
+        if parent is None:
+            yield None
+            return
+        span = Span(parent.trace_id, parent.span_id, name, parent.service, parent.sampled, attributes)
+        self._keep(span)
+        token = _CURRENT.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.time_ns()
+            _CURRENT.reset(token)
+
+    def record(self, name, seconds, error=None, **attributes):
+        """
+        Span hijo ya terminado (p. ej. una consulta medida desde los eventos del motor)
+        """
+        parent = self._parent()
+        if parent is None:
+            return None
+        span = Span(parent.trace_id, parent.span_id, name, parent.service, parent.sampled, attributes)
+        span.end = time.time_ns()
+        span.start = span.end - int(seconds * 1e9)
+        span.error = error
+        self._keep(span)
+        return span
+
+    def current(self):
+        return _CURRENT.get()
+
+    def _parent(self):
+        # Una tarea que sobrevive a su petición hereda un span ya cerrado: sus
+        # hijos no se exportarían nunca y alargarían la traza sin sentido
+        parent = _CURRENT.get()
+        return parent if parent is not None and parent.end is None else None
+
+    def traceparent(self):
+        span = _CURRENT.get()
+        return span.traceparent() if span is not None else None
+
+    def spans(self, trace_id):
+        return [span.as_dict() for span in self.recent.get(trace_id, ())]
+
+    def export(self, trace_id):
+        if not self.export_path:
+            return
+        pending = [span for span in self.recent.get(trace_id, ()) if span.end and not span.exported]
+        lines = "".join(json.dumps(span.as_dict()) + "\n" for span in pending)
+        try:
+            with open(self.export_path, "a") as f:
+                f.write(lines)
+        except OSError as e:
+            logger.warning(f"No se pudo exportar la traza {trace_id}: {e}")
+            return
+        for span in pending:
+            span.exported = True
+
+    def _keep(self, span):
+        spans = self.recent.get(span.trace_id)
+        if spans is None:
+            spans = self.recent[span.trace_id] = []
+            if len(self.recent) > self.buffer:
+                self.recent.popitem(last=False)
+        spans.append(span)
+
+
+TRACER = Tracer()
+
+
+def span(name, **attributes):
+    return TRACER.span(name, **attributes)
+
+
+def detached(coro):
+    """
+    Tarea de fondo (sondeos, reinicios...) fuera de la traza de la petición
+    que la arranca
+    """
+    return Context().run(asyncio.create_task, coro)
+
+
+def critical_path(spans):
+    """
+    Cadena de spans que determina la duración total: desde la raíz, el hijo
+    que termina el último en cada nivel. `self_ms` es el tiempo del span no
+    cubierto por sus hijos.
+    """
+    if not spans:
+        return []
+    ids = {s["spanId"] for s in spans}
+    children = {}
+    for s in spans:
+        children.setdefault(s["parentSpanId"], []).append(s)
+    roots = [s for s in spans if s["parentSpanId"] not in ids]
+    node = min(roots, key=lambda s: s["startTimeUnixNano"])
+    path = []
+    while node is not None:
+        end = node["endTimeUnixNano"] or node["startTimeUnixNano"]
+        kids = [k for k in children.get(node["spanId"], ()) if k["endTimeUnixNano"]]
+        covered, cursor = 0, node["startTimeUnixNano"]
+        for kid in sorted(kids, key=lambda k: k["startTimeUnixNano"]):
+            start, stop = max(cursor, kid["startTimeUnixNano"]), min(end, kid["endTimeUnixNano"])
+            if stop > start:
+                covered += stop - start
+                cursor = stop
+        path.append({
+            "name": node["name"],
+            "service": node["service"],
+            "duration_ms": round((end - node["startTimeUnixNano"]) / 1e6, 3),
+            "self_ms": round((end - node["startTimeUnixNano"] - covered) / 1e6, 3),
+            "error": node["status"].get("message"),
+        })
+        node = max(kids, key=lambda k: k["endTimeUnixNano"]) if kids else None
+    return path
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que abre el span de servidor de cada petición con el
+    contexto de `traceparent` y devuelve el identificador en X-Trace-Id.
+    """
+
+    def __init__(self, app, service, tracer=TRACER, skip_paths=TRACE_SKIP_PATHS):
+        self.app = app
+        self.service = service
+        self.tracer = tracer
+        self.skip_paths = tuple(skip_paths)
+        self.templates = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        span, token = self.tracer.begin(scope["method"], traceparent, self.service, path=scope["path"])
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                span.attributes["status"] = message["status"]
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", span.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.name = f"{scope['method']} {route_template(scope, self.templates)}"
+            self.tracer.finish(span, token)
+
+
+class Traced:
+    """
+    Envuelve un cliente (hash de contraseñas, S3...) para que las llamadas a
+    `methods` queden como spans `<prefijo>.<método>`.
+    """
+
+    def __init__(self, target, prefix, methods):
+        self._target = target
+        self._prefix = prefix
+        self._methods = set(methods)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._methods:
+            return attr
+
+        def call(*args, **kwargs):
+            with TRACER.span(f"{self._prefix}.{name}"):
+                return attr(*args, **kwargs)
+        return call
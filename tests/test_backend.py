@@ -1,5 +1,8 @@
 import os
 import sys
+import json
+import time
+import httpx
 import pytest
 import asyncio
 from unittest.mock import MagicMock, patch, AsyncMock
@@ -7,7 +10,7 @@ from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 from jose import jwt
 
-sys.modules["wakanda_common"] = MagicMock()
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "libs", "wakanda_common"))
 
 os.environ["DATABASE_URL"] = "sqlite:///./test.db"
 os.environ["SECRET_KEY"] = "super-secret-test-key"
@@ -18,9 +21,29 @@ os.environ["WASTE_SERVICE_URL"] = "http://mock-waste"
 os.environ["SECURITY_SERVICE_URL"] = "http://mock-security"
 os.environ["USERS_SERVICE_URL"] = "http://mock-users"
 
-from src.gateway_api.app.main import app as gateway_app, check_restart_mode, restarting_services
+from src.gateway_api.app.main import app as gateway_app, check_restart_mode, restarting_services, STATUS_CACHE, sync_restart_markers, ROLLOUTS
+from src.gateway_api.app.cache import MicroCache, Snapshot
+from src.gateway_api.app.balancer import BalancedTransport, Upstream
+from src.gateway_api.app.bulkhead import AdaptiveLimit, Bulkhead, BulkheadFull, BULKHEAD_REJECTED
+from src.gateway_api.app.state import CachedBackend, FakeRedis, MemoryBackend, RedisBackend, SharedCounter
+from src.gateway_api.app.stream import SnapshotHub
+from src.gateway_api.app.compression import negotiate
+from src.gateway_api.app.tracing import TracingTransport
+from src.gateway_api.app.rollout import FakeDeployments, RolloutManager
 from src.gestion_usuarios.app.main import create_access_token, ALGORITHM, SECRET_KEY, app as users_app, pwd_context
-from src.gestion_agua.app.main import get_water_pressure
+from src.gestion_trafico.app.spatial import GridIndex
+from src.gestion_agua.app.network import PipeNetwork
+from src.gestion_energia.app.forecast import LoadForecaster, week_slot
+from src.gestion_vigilancia.app.correlation import CorrelationEngine
+from src.gestion_residuos.app.routing import BinRegistry, RoutePlanner, route_length, two_opt
+from src.gestion_agua.app.main import get_water_pressure, WATER_HISTORY
+from wakanda_common.timeseries import RollupStore
+from wakanda_common.simulation import SimulationEngine
+from wakanda_common.anomaly import AnomalyDetector, ANOMALIES_TOTAL
+from wakanda_common.service import create_service_app
+from wakanda_common.responses import JSONResponse, json_response
+from wakanda_common.metrics import MetricsMiddleware, instrument_engine, HTTP_LATENCY, HTTP_RESPONSES, DB_QUERY_DURATION
+from wakanda_common.tracing import TRACER, TracingMiddleware, critical_path, detached, parse_traceparent
 
 client_gateway = TestClient(gateway_app)
 client_users = TestClient(users_app)
@@ -50,21 +73,495 @@ def test_gateway_proxy_traffic_status(mock_fetch):
     restarting_services.clear()
 
     mock_response = MagicMock()
-    mock_response.json.return_value = {"status": "OK", "congestion": "LOW"}
+    mock_response.content = b'{"status":"OK","congestion":"LOW"}'
+    mock_response.status_code = 200
+    mock_response.headers = {"content-type": "application/json"}
     mock_fetch.return_value = mock_response
 
     response = client_gateway.get("/traffic/status")
     assert response.status_code == 200
     assert response.json() == {"status": "OK", "congestion": "LOW"}
+    assert response.content == mock_response.content
+    mock_response.json.assert_not_called()
 
 
-@patch("src.gateway_api.app.main.config")
-@patch("src.gateway_api.app.main.client.AppsV1Api")
-def test_gateway_admin_restart_service(mock_k8s_client, mock_config):
-    response = client_gateway.post("/admin/restart/ms-trafico")
-    assert response.status_code == 200
-    assert "Reiniciando..." in response.json()["status"]
-    assert "ms-trafico" in restarting_services
+@patch("src.gateway_api.app.main.fetch_from_service")
+def test_gateway_relays_upstream_errors_verbatim(mock_fetch):
+    mock_response = MagicMock()
+    mock_response.content = '{"detail":"Métrica sin lecturas"}'.encode()
+    mock_response.status_code = 404
+    mock_response.headers = {"content-type": "application/json"}
+    mock_fetch.return_value = mock_response
+
+    response = client_gateway.get("/energy/history?metric=nada")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Métrica sin lecturas"}
+
+
+def test_micro_cache_single_flight_and_last_known_good():
+    now = [0.0]
+    calls = []
+    cache = MicroCache(ttl=1.0, max_stale=60.0, clock=lambda: now[0])
+
+    async def fetch():
+        calls.append(now[0])
+        await asyncio.sleep(0.01)
+        if now[0] >= 10:
+            raise RuntimeError("servicio caído")
+        return {"n": len(calls)}
+
+    async def scenario():
+        burst = await asyncio.gather(*(cache.get("traffic", fetch) for _ in range(20)))
+        cached = await cache.get("traffic", fetch)
+        now[0] = 10.5
+        stale = await cache.get("traffic", fetch)
+        now[0] = 100
+        with pytest.raises(RuntimeError):
+            await cache.get("traffic", fetch)
+        return burst, cached, stale
+
+    burst, cached, stale = asyncio.run(scenario())
+    assert len(calls) == 3
+    assert all(result == ({"n": 1}, 0.0, False) for result in burst)
+    assert cached == ({"n": 1}, 0.0, False)
+    assert stale == ({"n": 1}, 10.5, True)
+
+
+def test_state_backend_shares_cache_and_counters_between_replicas():
+    now = [1000.0]
+    redis = FakeRedis(clock=lambda: now[0])
+    replicas = [CachedBackend(RedisBackend(redis), ttl=0.5, clock=lambda: now[0]) for _ in range(2)]
+    caches = [MicroCache(ttl=1.0, clock=lambda: now[0], shared=backend) for backend in replicas]
+    counters = [SharedCounter(backend, "requests", window=10, clock=lambda: now[0]) for backend in replicas]
+    calls = []
+
+    async def fetch():
+        calls.append(now[0])
+        return Snapshot(b'{"status":"OK"}', 200, {"content-type": "application/json"})
+
+    async def scenario():
+        first = await caches[0].get("energy", fetch)
+        now[0] += 0.2
+        second = await caches[1].get("energy", fetch)
+        for counter in counters:
+            for _ in range(30):
+                counter.add()
+            await counter.flush()
+        now[0] += 1
+        rate = await counters[1].rate()
+        now[0] += 700
+        expired = await replicas[0].scan("")
+        return first, second, rate, expired
+
+    first, second, rate, expired = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert second[0] == first[0] and second[1] == pytest.approx(0.2)
+    assert rate == 6.0
+    assert expired == {}
+
+
+def test_restart_markers_sync_through_shared_state():
+    shared = MemoryBackend()
+    restarting_services.clear()
+    restarting_services["ms-agua"] = datetime.now()
+    with patch("src.gateway_api.app.main.STATE", shared):
+        asyncio.run(sync_restart_markers())
+        restarting_services.clear()
+        asyncio.run(sync_restart_markers())
+    assert check_restart_mode("ms-agua") is True
+    restarting_services.clear()
+
+
+def test_upstream_balancing_ejection_and_slow_start():
+    import random
+    now = [0.0]
+    upstream = Upstream("gestion-agua", [("10.0.0.1", 8000), ("10.0.0.2", 8000)], max_failures=3,
+                        ejection_time=10, slow_start=20, clock=lambda: now[0], rng=random.Random(1))
+    busy, idle = upstream.endpoints.values()
+    busy.outstanding = 5
+    picks = [upstream.pick() for _ in range(5)]
+    assert all(endpoint is idle for endpoint in picks)
+    for endpoint in picks:
+        upstream.release(endpoint, ok=False)
+    assert idle.ejected_until == 10
+    assert {upstream.pick() for _ in range(3)} == {busy}
+
+    now[0] = 12
+    assert idle.weight(now[0], upstream.slow_start) == pytest.approx(0.1)
+    now[0] = 40
+    assert idle.weight(now[0], upstream.slow_start) == 1.0
+
+
+def test_balanced_transport_rewrites_and_releases_endpoints():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.host, request.url.port, request.headers["host"]))
+        return httpx.Response(200, json={"ok": True})
+
+    transport = BalancedTransport(httpx.MockTransport(handler), strategy="least")
+    upstream = transport.add("http://gestion-trafico:8000", [("10.0.0.1", 8000), ("10.0.0.2", 8001)])
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport) as client:
+            for _ in range(4):
+                assert (await client.get("http://gestion-trafico:8000/traffic/status")).json() == {"ok": True}
+            await client.get("http://otro-servicio/ping")
+
+    asyncio.run(scenario())
+    assert set(seen[:4]) <= {("10.0.0.1", 8000, "gestion-trafico:8000"), ("10.0.0.2", 8001, "gestion-trafico:8000")}
+    assert seen[4][0] == "otro-servicio"
+    assert all(endpoint.outstanding == 0 for endpoint in upstream.endpoints.values())
+
+
+def test_adaptive_limit_grows_when_saturated_and_backs_off_on_latency():
+    now = [0.0]
+    limit = AdaptiveLimit(initial=4, min_limit=2, max_limit=8, clock=lambda: now[0])
+    for _ in range(40):
+        now[0] += 0.01
+        limit.sample(0.01, True, in_flight=int(limit.limit))
+    assert int(limit.limit) == 8
+    for _ in range(10):
+        now[0] += 1
+        limit.sample(0.5, True, in_flight=1)
+    assert int(limit.limit) < 4
+    now[0] += 1
+    limit.sample(0.01, False, in_flight=1)
+    assert limit.limit >= limit.min_limit
+
+
+def test_bulkhead_queues_then_rejects_fast():
+    bulkhead = Bulkhead("hp-api.test", AdaptiveLimit(initial=2, min_limit=2), queue_timeout=0.05, max_queue=1)
+    rejected = BULKHEAD_REJECTED.labels("hp-api.test", "cola_llena")
+    before = rejected._value.get()
+
+    async def scenario():
+        await bulkhead.acquire()
+        await bulkhead.acquire()
+        queued = asyncio.create_task(bulkhead.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(BulkheadFull):
+            await bulkhead.acquire()
+        bulkhead.release(0.01, True)
+        await queued
+        with pytest.raises(BulkheadFull) as timeout:
+            await bulkhead.acquire()
+        return timeout.value
+
+    error = asyncio.run(scenario())
+    assert bulkhead.in_flight == 2 and not bulkhead.waiters
+    assert error.retry_after >= 1
+    assert rejected._value.get() == before + 1
+
+
+def test_transports_release_slots_when_cancelled():
+    from src.gateway_api.app.bulkhead import BulkheadTransport
+
+    class Hanging(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            await asyncio.sleep(10)
+
+    balanced = BalancedTransport(Hanging())
+    upstream = balanced.add("http://gestion-agua:8000", [("10.0.0.1", 8000)])
+    transport = BulkheadTransport(balanced)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport) as client:
+            call = asyncio.create_task(client.get("http://gestion-agua:8000/water/pressure"))
+            await asyncio.sleep(0.01)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+
+    asyncio.run(scenario())
+    bulkhead = transport.bulkheads["gestion-agua"]
+    assert bulkhead.in_flight == 0 and bulkhead.limit.latency is None
+    endpoint, = upstream.endpoints.values()
+    assert endpoint.outstanding == 0 and endpoint.failures == 0
+
+
+@patch("src.gateway_api.app.main.fetch_from_service")
+def test_gateway_answers_503_with_retry_after_when_upstream_saturated(mock_fetch):
+    mock_fetch.side_effect = BulkheadFull("hp-api.onrender.com", 3)
+    response = client_gateway.get("/hogwarts/roster")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+
+
+@patch("src.gateway_api.app.main.fetch_from_service")
+def test_gateway_serves_stale_status_while_restarting(mock_fetch):
+    restarting_services.clear()
+    STATUS_CACHE.clear()
+    mock_response = MagicMock()
+    mock_response.content = b'{"status":"ESTABLE","voltage_v":230}'
+    mock_response.status_code = 200
+    mock_response.headers = {"content-type": "application/json"}
+    mock_fetch.return_value = mock_response
+
+    assert client_gateway.get("/energy/grid").json() == {"status": "ESTABLE", "voltage_v": 230}
+    client_gateway.get("/energy/grid")
+    assert mock_fetch.call_count == 1
+
+    restarting_services["ms-energia"] = datetime.now()
+    stale = client_gateway.get("/energy/grid")
+    restarting_services.clear()
+    assert stale.json()["voltage_v"] == 230
+    assert stale.json()["stale"] is True and stale.json()["stale_reason"] == "RESTARTING"
+    assert "age" in stale.headers
+
+
+@patch("src.gateway_api.app.main.fetch_from_service")
+def test_gateway_caches_only_successful_status(mock_fetch):
+    restarting_services.clear()
+    STATUS_CACHE.clear()
+    mock_response = MagicMock()
+    mock_response.content = b'{"detail":"No encontrado"}'
+    mock_response.status_code = 404
+    mock_response.headers = {"content-type": "application/json"}
+    mock_fetch.return_value = mock_response
+
+    assert client_gateway.get("/water/pressure").status_code == 404
+    restarting_services["ms-agua"] = datetime.now()
+    assert client_gateway.get("/water/pressure").json() == {"status": "RESTARTING"}
+    restarting_services.clear()
+
+    mock_response.content = b"OK\n"
+    mock_response.status_code = 200
+    mock_response.headers = {"content-type": "text/plain"}
+    client_gateway.get("/water/pressure")
+    restarting_services["ms-agua"] = datetime.now()
+    stale = client_gateway.get("/water/pressure")
+    restarting_services.clear()
+    assert stale.status_code == 200 and stale.content == b"OK\n" and "age" in stale.headers
+
+
+@patch("src.gateway_api.app.main.fetch_from_service")
+def test_gateway_compresses_and_answers_conditional_get(mock_fetch):
+    roster = {"results": [{"id": n, "name": f"Morty {n}", "status": "Alive"} for n in range(100)]}
+    mock_response = MagicMock()
+    mock_response.content = json.dumps(roster).encode()
+    mock_response.status_code = 200
+    mock_response.headers = {"content-type": "application/json"}
+    mock_fetch.return_value = mock_response
+
+    first = client_gateway.get("/secret-club/roster", headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200 and first.json() == roster
+    assert first.headers["content-encoding"] == "gzip"
+    assert int(first.headers["content-length"]) < len(mock_response.content) / 3
+    assert "Accept-Encoding" in first.headers["vary"]
+
+    again = client_gateway.get("/secret-club/roster", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304 and again.content == b""
+
+    plain = client_gateway.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in plain.headers
+    assert negotiate("gzip;q=0.5, br", ("br", "gzip")) == "br"
+    assert negotiate("br;q=0, identity", ("br", "gzip")) is None
+
+
+def test_gateway_admin_restart_service():
+    fake = FakeDeployments({"ms-trafico": 2}, step=0.05)
+    restarting_services.clear()
+    with patch.object(ROLLOUTS, "backend", fake), TestClient(gateway_app) as client:
+        response = client.post("/admin/restart/ms-trafico")
+        assert response.status_code == 200
+        assert "Reiniciando..." in response.json()["status"]
+        assert "ms-trafico" in restarting_services and check_restart_mode("ms-trafico")
+        client.portal.call(ROLLOUTS.wait)
+        rollout = client.get("/admin/restart/status").json()["rollouts"]["ms-trafico"]
+    assert rollout["status"] == "listo" and rollout["progress"]["restarts"] == 1
+    assert "ms-trafico" not in restarting_services and not check_restart_mode("ms-trafico")
+
+
+def test_rollout_manager_caps_concurrency_and_times_out():
+    fake = FakeDeployments({"ms-agua": 2, "ms-energia": 3, "ms-residuos": 1, "ms-seguridad": 1},
+                           step=0.01, stuck={"ms-seguridad"})
+    changes = []
+    manager = RolloutManager(fake, concurrency=2, timeout=0.3,
+                             on_change=lambda name, active: changes.append((name, active)))
+
+    async def run():
+        first = await manager.restart(["ms-agua", "ms-energia", "ms-residuos", "ms-agua"])
+        again = await manager.restart(["ms-agua"])
+        assert set(first) == {"ms-agua", "ms-energia", "ms-residuos"} and again["ms-agua"]["status"] == "pendiente"
+        await manager.wait()
+        await manager.restart(["ms-seguridad"])
+        await manager.wait()
+        return await manager.status()
+
+    status = asyncio.run(run())
+    assert fake.max_rolling == 2
+    assert [status[n]["status"] for n in ("ms-agua", "ms-energia", "ms-residuos")] == ["listo"] * 3
+    assert status["ms-seguridad"]["status"] == "tiempo_agotado"
+    assert fake.states["ms-agua"]["restarts"] == 1
+    assert sorted(changes) == sorted([(n, flag) for n in ("ms-agua", "ms-energia", "ms-residuos", "ms-seguridad")
+                                      for flag in (True, False)])
+
+
+
+def test_rollouts_shared_between_replicas():
+    fake = FakeDeployments({"ms-agua": 2, "ms-energia": 1}, step=0.01)
+    fake.states["ms-energia"]["failed"] = True  # fallo del despliegue anterior
+    shared = MemoryBackend()
+    first, second = (RolloutManager(fake, timeout=1, shared=shared) for _ in range(2))
+
+    async def run():
+        started = await first.restart(["ms-agua", "ms-energia"])
+        seen = await second.restart(["ms-agua"])
+        await first.wait()
+        return started, seen, await second.status()
+
+    started, seen, status = asyncio.run(run())
+    assert started["ms-agua"]["status"] == "pendiente" and seen["ms-agua"]["status"] == "pendiente"
+    assert not second.tasks and fake.states["ms-agua"]["restarts"] == 1
+    assert status["ms-agua"]["status"] == "listo" and status["ms-energia"]["status"] == "listo"
+    assert asyncio.run(shared.get("rollout-lock:ms-agua")) is None
+
+def test_logout_revokes_tokens_across_replicas():
+    from src.gestion_usuarios.app import main as users_main
+    from src.gestion_usuarios.app.models import SessionLocal as UsersSession, RevokedToken
+    from src.gestion_usuarios.app.revocation import RevocationList
+
+    def me(token):
+        return client_users.get("/me", headers={"Authorization": f"Bearer {token}"}).status_code
+
+    first = create_access_token({"sub": "admin@wakanda.es", "role": "ADMIN"})
+    second = create_access_token({"sub": "admin@wakanda.es", "role": "ADMIN"})
+    try:
+        assert me(first) == 200
+        assert client_users.post("/logout", headers={"Authorization": f"Bearer {first}"}).status_code == 200
+        assert me(first) == 401 and me(second) == 200
+
+        # Otra réplica sin nada en memoria lo aprende de la tabla
+        with patch.object(users_main, "REVOCATIONS", RevocationList()):
+            assert me(first) == 401 and me(second) == 200
+            client_users.post("/logout/all", headers={"Authorization": f"Bearer {second}"})
+            assert me(second) == 401
+        # Y la primera réplica en su siguiente sincronización
+        users_main.REVOCATIONS.next_sync = 0
+        assert me(second) == 401
+        # Con margen de reloj: lo emitido justo después también cae, lo posterior no
+        assert me(create_access_token({"sub": "admin@wakanda.es", "role": "ADMIN"})) == 401
+        later = jwt.encode({"sub": "admin@wakanda.es", "role": "ADMIN", "iat": time.time() + 2,
+                            "exp": datetime.utcnow() + timedelta(hours=1), "jti": "posterior"},
+                           SECRET_KEY, algorithm=ALGORITHM)
+        assert me(later) == 200
+
+
+        # Las filas de tokens ya caducados se purgan al sincronizar
+        with UsersSession() as db:
+            db.add(RevokedToken(jti="caducado", subject="admin@wakanda.es",
+                                expires_at=datetime.utcnow() - timedelta(minutes=1)))
+            db.commit()
+        users_main.REVOCATIONS.next_sync = 0
+        with patch.object(users_main, "next_revocation_purge", 0.0):
+            assert me(second) == 401
+        with UsersSession() as db:
+            assert db.query(RevokedToken).filter(RevokedToken.jti == "caducado").count() == 0
+    finally:
+        with UsersSession() as db:
+            db.query(RevokedToken).filter(RevokedToken.subject == "admin@wakanda.es").delete()
+            db.commit()
+        users_main.REVOCATIONS.not_before.clear()
+
+
+def test_revocation_list_buckets_expire_and_bloom_has_no_false_negatives():
+    from src.gestion_usuarios.app.revocation import BloomFilter, RevocationList, RevocationNotifier
+
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for n in range(1000):
+        bloom.add(f"jti-{n}")
+    assert all(f"jti-{n}" in bloom for n in range(1000))
+    assert sum(f"otro-{n}" in bloom for n in range(10000)) < 300
+
+    now = [10000.0]
+    revocations = RevocationList(bucket=100, clock=lambda: now[0])
+    revocations.refresh([("a", "okoye@wakanda.es", None, 10050.0), (None, "nakia@wakanda.es", 9990.0, 10150.0)])
+    exact = MagicMock(return_value=True)
+    assert revocations.is_revoked({"sub": "okoye@wakanda.es", "jti": "a", "exp": 10050.0}, exact)
+    exact.return_value = False
+    assert not revocations.is_revoked({"sub": "okoye@wakanda.es", "jti": "b", "exp": 10050.0}, exact)
+    assert revocations.is_revoked({"sub": "nakia@wakanda.es", "iat": 9000, "jti": "c", "exp": 10100.0}, exact)
+    assert not revocations.is_revoked({"sub": "nakia@wakanda.es", "iat": 9995, "jti": "c", "exp": 10100.0}, exact)
+    revocations.clock_skew = 10
+    assert revocations.is_revoked({"sub": "nakia@wakanda.es", "iat": 9995, "jti": "c", "exp": 10100.0}, exact)
+    revocations.invalidate()
+    assert revocations.due()
+
+    db, engine = MagicMock(), MagicMock()
+    engine.dialect.name = "sqlite"
+    RevocationNotifier(engine, revocations).notify(db)
+    assert not db.execute.called
+    engine.dialect.name = "postgresql"
+    RevocationNotifier(engine, revocations).notify(db)
+    assert str(db.execute.call_args.args[0]) == "NOTIFY revoked_tokens"
+
+    now[0] = 10200.0
+    revocations.refresh([])
+    assert revocations.filters == {} and revocations.not_before == {}
+
+
+def pokeapi_detail(n):
+    return {"id": n, "name": f"poke{n}", "height": n, "weight": 10 * n,
+            "sprites": {"other": {"official-artwork": {"front_default": f"https://img/{n}.png"}}},
+            "types": [{"type": {"name": "fire"}}], "abilities": [{"ability": {"name": "blaze"}}],
+            "moves": [{"move": {"name": f"move{m}"}} for m in range(500)]}
+
+
+def test_pokemon_gallery_prefetches_with_bounded_concurrency():
+    from src.gateway_api.app.gallery import PokemonGallery
+
+    calls, active, peak = [], [0], [0]
+
+    async def fetch(url):
+        calls.append(url)
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        if "?" in url:
+            offset = int(url.split("offset=")[1].split("&")[0])
+            limit = int(url.split("limit=")[1])
+            names = range(offset + 1, min(30, offset + limit) + 1)
+            return {"count": 30, "results": [{"name": f"poke{n}"} for n in names]}
+        n = int(url.rsplit("poke", 1)[1])
+        return None if n == 13 else pokeapi_detail(n)
+
+    gallery = PokemonGallery("http://pokeapi", fetch, concurrency=4)
+
+    async def run():
+        first, detail = await asyncio.gather(gallery.page(0, 20), gallery.card("poke3"))
+        calls_after_first = len(calls)
+        again = await gallery.page(0, 20)
+        by_id = await gallery.card(7)
+        return first, detail, again, by_id, calls_after_first
+
+    first, detail, again, by_id, calls_after_first = asyncio.run(run())
+    assert peak[0] <= 4
+    assert calls_after_first == 21
+    # Solo se vuelve a pedir el que falló
+    assert calls[21:] == ["http://pokeapi/poke13"] and again == first
+    assert [card["id"] for card in first["results"]] == [n for n in range(1, 21) if n != 13]
+    assert first["missing"] == ["poke13"] and detail.name == "poke3" and by_id.name == "poke7"
+    assert first["results"][0] == {"id": 1, "name": "poke1", "image": "https://img/1.png", "types": ["fire"],
+                                   "height": 1, "weight": 10, "abilities": ["blaze"]}
+
+
+def test_gateway_pokemon_gallery_endpoint():
+    from src.gateway_api.app.main import POKEMON_GALLERY
+
+    async def fetch(url):
+        if "?" in url:
+            return {"count": 2, "results": [{"name": "poke1"}, {"name": "poke2"}]}
+        return pokeapi_detail(int(url.rsplit("poke", 1)[1]))
+
+    POKEMON_GALLERY.cache.entries.clear()
+    with patch.object(POKEMON_GALLERY, "fetch", fetch), TestClient(gateway_app) as client:
+        page = client.get("/pokemon/gallery?limit=2").json()
+        assert [card["name"] for card in page["results"]] == ["poke1", "poke2"]
+        assert client.get("/pokemon/2").json()["weight"] == 20
+        assert client.get("/pokemon/gallery?limit=500").status_code == 422
+    POKEMON_GALLERY.cache.entries.clear()
 
 
 def test_create_access_token_structure():
@@ -191,12 +688,596 @@ def test_protected_route_without_token():
     assert response.status_code == 401
 
 
-@patch("src.gestion_agua.app.main.AsyncSessionLocal")
-def test_water_pressure_data_structure(mock_session):
+def test_water_pressure_data_structure():
     mock_db = MagicMock()
     result = asyncio.run(get_water_pressure(mock_db))
 
     assert "pressure_psi" in result
     assert "purity_level" in result
     assert result["service"] == "Gestión de Agua"
-    assert 35 <= result["pressure_psi"] <= 90
\ No newline at end of file
+    assert 35 <= result["pressure_psi"] <= 90
+
+
+def test_water_pressure_records_history():
+    WATER_HISTORY.raw.clear()
+    WATER_HISTORY.rollups.clear()
+    result = asyncio.run(get_water_pressure(MagicMock()))
+
+    history = WATER_HISTORY.history("pressure_psi")
+    assert history["resolution"] == "raw"
+    assert history["points"][-1]["value"] == result["pressure_psi"]
+
+
+def test_rollup_store_buckets_and_resolution_choice():
+    store = RollupStore()
+    now = 10 * 86400
+    for i in range(3 * 3600):
+        store.record("voltage_v", 200 + (i % 60), ts=now - 3 * 3600 + i)
+
+    raw = store.history("voltage_v", start=now - 600, end=now, max_points=1000, now=now)
+    assert raw["resolution"] == "raw"
+
+    minutes = store.history("voltage_v", start=now - 3 * 3600, end=now, max_points=500, now=now)
+    assert minutes["resolution"] == 60
+    assert minutes["points"][0] == {"t": now - 3 * 3600, "min": 200, "max": 259, "avg": 229.5, "count": 60}
+
+    hours = store.history("voltage_v", start=now - 3 * 3600, end=now, max_points=10, now=now)
+    assert hours["resolution"] == 3600
+    assert sum(p["count"] for p in hours["points"]) == 3 * 3600
+
+
+def test_rollup_store_raw_retention():
+    store = RollupStore(raw_retention=60)
+    store.record("ph_level", 7.0, ts=0)
+    store.record("ph_level", 7.2, ts=120)
+
+    assert [ts for ts, _ in store.raw["ph_level"]] == [120]
+    day = store.history("ph_level", start=0, end=120, max_points=10, now=120)
+    assert day["resolution"] == 60
+    assert [p["count"] for p in day["points"]] == [1, 1]
+
+
+def test_snapshot_hub_polls_once_for_all_subscribers():
+    calls = {"traffic": 0}
+
+    async def fetch_traffic():
+        calls["traffic"] += 1
+        return {"status": "FLUIDO", "n": calls["traffic"]}
+
+    async def scenario():
+        hub = SnapshotHub({"traffic": fetch_traffic}, interval=0.01)
+        subscribers = [hub.subscribe() for _ in range(50)]
+        await asyncio.sleep(0.055)
+        first = await subscribers[0].next(1)
+        for subscriber in subscribers:
+            hub.unsubscribe(subscriber)
+        return hub, first, subscribers[-1]
+
+    hub, first, slow = asyncio.run(scenario())
+    assert 1 <= calls["traffic"] <= 7
+    assert len(first) == 1 and first[0].startswith(b"event: traffic\ndata: ")
+    assert slow.dropped == calls["traffic"] - 1
+    assert hub.tasks == {}
+
+
+def test_snapshot_hub_relays_multiline_bodies():
+    from fastapi import Response
+
+    async def fetch_error_page():
+        return Response(b"<html>\r\n<h1>502 Bad Gateway</h1>\r\n</html>", status_code=502, media_type="text/html")
+
+    async def scenario():
+        hub = SnapshotHub({"energy": fetch_error_page}, interval=0.01)
+        subscriber = hub.subscribe()
+        await asyncio.sleep(0.035)
+        chunks = await subscriber.next(1)
+        alive = not any(task.done() for task in hub.tasks.values())
+        hub.unsubscribe(subscriber)
+        return chunks, alive
+
+    chunks, alive = asyncio.run(scenario())
+    assert alive
+    assert chunks == [b"event: energy\ndata: <html>\ndata: <h1>502 Bad Gateway</h1>\ndata: </html>\n\n"]
+
+
+def test_simulation_engine_is_seedable_and_bounded():
+    def run(seed):
+        engine = SimulationEngine(10_000, seed=seed, clock=lambda: 0.0)
+        engine.add_field("pressure_psi", 35, 90, common=6)
+        engine.add_flag("active", active=0.6)
+        for _ in range(10):
+            engine.advance(30)
+        return engine
+
+    a, b = run(7), run(7)
+    assert (a.values("pressure_psi") == b.values("pressure_psi")).all()
+    assert a.count("active") == b.count("active")
+    assert 35 <= a.values("pressure_psi").min() and a.values("pressure_psi").max() <= 90
+    assert 0.55 < a.count("active") / a.size < 0.65
+
+
+def test_simulation_engine_tick_uses_elapsed_time():
+    now = [0.0]
+    engine = SimulationEngine(100, seed=1, clock=lambda: now[0])
+    engine.add_field("speed_kmh", 200, 800)
+    before = engine.values("speed_kmh").copy()
+
+    engine.tick()
+    assert (engine.values("speed_kmh") == before).all()
+
+    now[0] = 5.0
+    engine.tick()
+    assert (engine.values("speed_kmh") != before).any()
+    assert engine.last_tick == 5.0
+
+
+def test_grid_index_queries_match_linear_scan():
+    import numpy as np
+    rng = np.random.default_rng(3)
+    index = GridIndex(10_000, 10_000, 250)
+    index.load(rng.uniform(0, 10_000, 5_000), rng.uniform(0, 10_000, 5_000))
+    index.move(np.arange(0, 5_000, 7), rng.uniform(0, 10_000, 715), rng.uniform(0, 10_000, 715))
+
+    dist = np.hypot(index.x - 4_000, index.y - 6_000)
+    ids, distances = index.nearest(4_000, 6_000, 12)
+    assert ids.tolist() == np.argsort(dist)[:12].tolist()
+    assert distances[0] <= distances[-1]
+
+    # Un punto muy fuera del espacio aéreo busca desde el borde más cercano
+    for x, y in ((-200_000, -200_000), (10_500, 5_000), (-50, 20_000)):
+        far = np.hypot(index.x - x, index.y - y)
+        ids, _ = index.nearest(x, y, 3)
+        assert ids.tolist() == np.argsort(far)[:3].tolist()
+
+    ids, _ = index.radius(4_000, 6_000, 800)
+    assert sorted(ids.tolist()) == np.flatnonzero(dist <= 800).tolist()
+
+    inside = (index.x >= 1_000) & (index.x <= 3_000) & (index.y >= 2_000) & (index.y <= 2_500)
+    assert sorted(index.bbox(1_000, 2_000, 3_000, 2_500).tolist()) == np.flatnonzero(inside).tolist()
+    assert sum(len(b) for b in index.buckets) == 5_000
+    assert index.heatmap().sum() == 5_000
+
+
+def test_pipe_network_incremental_updates_match_full_solve():
+    network = PipeNetwork.grid(20, seed=4)
+    baseline = network.pressures().copy()
+
+    network.set_valve(10, False)
+    network.set_valve(0, False)
+    network.set_demand(150, 0.2)
+    incremental = network.pressures().copy()
+    assert len(network.pending) == 2
+
+    network.factorize()
+    assert abs(network.pressures() - incremental).max() < 1e-8
+    assert network.pressures()[150] < baseline[150]
+
+    network.set_valve(10, True)
+    network.set_valve(0, True)
+    network.set_demand(150, PipeNetwork.grid(20, seed=4).demand[150])
+    assert abs(network.pressures() - baseline).max() < 1e-6
+
+
+def test_pipe_network_flags_low_pressure_districts():
+    network = PipeNetwork.grid(20, districts_per_side=2, seed=4)
+    for node in range(network.district.size):
+        if network.district[node] == 3 and node not in network.reservoirs:
+            network.set_demand(node, 0.6)
+
+    districts = network.districts(45)
+    assert [d["district"] for d in districts] == [0, 1, 2, 3]
+    assert sum(d["junctions"] for d in districts) == 400
+    assert districts[3]["low_pressure"] and not districts[1]["low_pressure"]
+
+
+def test_load_forecaster_learns_weekly_profile():
+    import math
+    forecaster = LoadForecaster()
+    start = 4 * 86400
+    for minute in range(21 * 1440):
+        ts = start + minute * 60
+        forecaster.update(ts, 60 + 20 * math.sin(2 * math.pi * (minute % 1440) / 1440))
+
+    now = start + 21 * 1440 * 60
+    points = forecaster.forecast(now, horizon_minutes=360, step_minutes=60)
+    expected = [60 + 20 * math.sin(2 * math.pi * ((p["t"] - start) / 60 % 1440) / 1440) for p in points]
+    assert len(points) == 6
+    assert max(abs(p["load"] - e) for p, e in zip(points, expected)) < 6
+    assert forecaster.updates == 21 * 1440
+
+
+def test_load_forecaster_peak_warning():
+    forecaster = LoadForecaster()
+    for minute in range(600):
+        forecaster.update(minute * 60, 80 + minute * 0.02)
+
+    points = forecaster.forecast(600 * 60, horizon_minutes=60, step_minutes=10)
+    warning = forecaster.peak_warning(points, 85)
+    assert warning is not None and warning["expected_load"] >= 85 - 2 * forecaster.mean_abs_error
+    assert forecaster.peak_warning(points, 200) is None
+    assert week_slot(0) == 3 * 24
+
+
+def test_bin_registry_upsert_remove_and_distances():
+    import numpy as np
+    rng = np.random.default_rng(4)
+    registry = BinRegistry(capacity=4)
+    xs, ys = rng.uniform(0, 1000, 30), rng.uniform(0, 1000, 30)
+    for i in range(30):
+        registry.upsert(f"B{i}", xs[i], ys[i], 50)
+    for i in range(0, 30, 3):
+        registry.remove(f"B{i}")
+    version = registry.version
+    registry.upsert("B1", 10.0, 20.0, 90)
+
+    n = len(registry)
+    assert n == 20 and "B3" not in registry and registry.version == version
+    positions = registry.positions(["B1", "B3", "B29"])
+    assert positions[1] == -1 and registry.x[positions[0]] == 10.0 and registry.y[positions[2]] == ys[29]
+    d = np.hypot(xs[29] - 10, ys[29] - 20)
+    assert np.allclose(registry.distances(positions[[0, 2]]), [[0, d], [d, 0]])
+
+
+def test_route_planner_respects_capacity_and_covers_bins():
+    import time
+    import numpy as np
+    rng = np.random.default_rng(5)
+    registry = BinRegistry()
+    registry.load([f"B{i}" for i in range(400)], rng.uniform(0, 5000, 400), rng.uniform(0, 5000, 400),
+                  rng.uniform(0, 100, 400))
+    depots = [{"id": "norte", "x": 2500, "y": 4500, "trucks": [8000] * 6},
+              {"id": "sur", "x": 2500, "y": 500, "trucks": [8000] * 6}]
+    plan = RoutePlanner(registry, bin_volume_l=1000).plan(depots, min_fill_pct=60, time_limit=1.0)
+
+    visited = [b for depot in plan["depots"] for route in depot["routes"] for b in route["bins"]]
+    visited += [b for depot in plan["depots"] for b in depot["unassigned"]]
+    due = {registry.ids[i] for i in range(400) if registry.fill[i] >= 60}
+    assert len(visited) == len(set(visited)) and set(visited) <= due
+    assert len(visited) + plan["pending_bins"] - sum(len(d["unassigned"]) for d in plan["depots"]) == len(due)
+    for depot in plan["depots"]:
+        assert len(depot["routes"]) <= 6
+        assert all(route["load_l"] <= route["capacity_l"] for route in depot["routes"])
+
+    dist = registry.distances(np.arange(400))
+    depot_dist = registry.distances_from(0, 0)
+    route = rng.permutation(40).tolist()
+    improved = two_opt(dist, depot_dist, route, time.perf_counter() + 1.0)
+    assert sorted(improved) == sorted(route)
+    assert route_length(dist, depot_dist, improved) < route_length(dist, depot_dist, route)
+
+
+def test_correlation_engine_deduplicates_and_escalates():
+    engine = CorrelationEngine(cell_size=100, window=60, dedup_window=10, thresholds=(2, 4), clock=lambda: 0)
+    assert engine.ingest(0, 10, 10, "intrusion", "d1") is None
+    assert engine.ingest(1, 20, 20, "intrusion", "d1") is None
+    escalated = engine.ingest(2, 30, 30, "intrusion", "d2")
+    assert escalated is not None and escalated.level == 1
+    engine.ingest(3, 40, 40, "intrusion", "d3")
+    engine.ingest(4, 150, 10, "intrusion", "d4")
+    engine.ingest(5, 50, 50, "vehiculo", "d4")
+
+    incidents = engine.incidents(now=5)
+    assert [i["level"] for i in incidents] == ["AMARILLA"]
+    assert incidents[0]["events"] == 3 and incidents[0]["duplicates"] == 1
+    assert engine.ingest(15, 10, 10, "intrusion", "d1").level == 2
+    assert engine.level(now=15) == "NARANJA"
+
+
+def test_correlation_engine_expires_by_time_bucket():
+    import time
+    engine = CorrelationEngine(cell_size=100, window=10, thresholds=(1,), clock=lambda: 0)
+    for t in range(100):
+        engine.ingest(t, t * 100, 0, "intrusion", "d1")
+    assert len(engine.open) <= 30 and len(engine.buckets) <= 3
+    assert engine.incidents(now=200) == [] and engine.open == {}
+    assert len(engine.closed) == 100
+
+    # Un hueco enorme entre detecciones no recorre los cubos intermedios
+    engine.ingest(-1e12, 0, 0, "intrusion", "d2")
+    started = time.perf_counter()
+    engine.ingest(1e9, 0, 0, "intrusion", "d2")
+    assert time.perf_counter() - started < 0.1
+    assert engine.oldest_bucket == int(1e9 // 10) and len(engine.buckets) == 1
+
+
+def test_anomaly_detector_flags_spikes_and_limits():
+    import numpy as np
+    detector = AnomalyDetector("test", window=200, sensitivity=4.0, limits={"ph_level": (6.5, 8.5)}, clock=lambda: 0)
+    rng = np.random.default_rng(6)
+    flagged = sum(detector.observe("frequency_hz", v) is not None for v in 50 + rng.normal(0, 0.05, 2000))
+    stats = detector.stats("frequency_hz")
+    assert flagged <= 2
+    assert abs(stats["median"] - 50) < 0.02 and abs(stats["std"] - 0.05) < 0.01
+    assert abs(stats["mad"] - 0.0337) < 0.01
+
+    anomaly = detector.observe("frequency_hz", 50.6)
+    assert anomaly["reason"] == "desviación" and anomaly["score"] > 4
+    assert detector.observe_many({"ph_level": 9.1, "frequency_hz": 50.01}) == ["ph_level"]
+    assert [a["metric"] for a in detector.recent()] == ["frequency_hz", "ph_level"]
+    assert ANOMALIES_TOTAL.labels(service="test", metric="ph_level")._value.get() == 1
+
+
+def test_anomaly_detector_adapts_to_level_shift():
+    import numpy as np
+    detector = AnomalyDetector("test_shift", window=200, sensitivity=4.0, clock=lambda: 0)
+    rng = np.random.default_rng(7)
+    for value in 50 + rng.normal(0, 0.05, 1000):
+        detector.observe("frequency_hz", value)
+    shifted = 51 + rng.normal(0, 0.05, 400)
+    flagged = [detector.observe("frequency_hz", v) is not None for v in shifted]
+    # La mediana de la ventana cambia al llegar a la mitad: después ya no hay alertas
+    assert any(flagged[:50]) and not any(flagged[110:])
+    assert abs(detector.stats("frequency_hz")["median"] - 51) < 0.02
+
+
+def test_metrics_middleware_uses_route_templates():
+    from fastapi import FastAPI, HTTPException
+
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, service="test_metrics")
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        if item_id > 10:
+            raise HTTPException(404, "No existe")
+        return {"id": item_id}
+
+    client = TestClient(app)
+    for item_id in (1, 2, 3, 50):
+        client.get(f"/items/{item_id}")
+    client.get("/no/existe")
+    client.request("FOOBAR", "/no/existe")
+
+    latency = HTTP_LATENCY.labels("test_metrics", "GET", "/items/{item_id}")
+    assert sum(b.get() for b in latency._buckets) == 4
+    assert HTTP_RESPONSES.labels("test_metrics", "GET", "/items/{item_id}", "200")._value.get() == 3
+    assert HTTP_RESPONSES.labels("test_metrics", "GET", "/items/{item_id}", "404")._value.get() == 1
+    assert HTTP_RESPONSES.labels("test_metrics", "GET", "sin_ruta", "404")._value.get() == 1
+    assert HTTP_RESPONSES.labels("test_metrics", "OTHER", "sin_ruta", "404")._value.get() == 1
+
+
+def test_instrument_engine_times_queries():
+    from sqlalchemy import create_engine, text
+
+    engine = instrument_engine(create_engine("sqlite://"), "test_engine")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("select 2"))
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM tabla_inexistente"))
+        assert conn.info["wakanda_query_start"] == []
+    histogram = DB_QUERY_DURATION.labels("test_engine", "SELECT")
+    assert sum(b.get() for b in histogram._buckets) == 2
+
+
+def test_query_log_groups_by_fingerprint_and_redacts_slow_queries(caplog):
+    from sqlalchemy import create_engine, text
+    from wakanda_common.querylog import QueryLog, QUERY_LOG, normalize
+
+    assert normalize("SELECT * FROM t1 WHERE id IN (1, 2,3) AND name = 'o''k'\n  AND x > -2.5") == \
+        "SELECT * FROM t1 WHERE id IN (?+) AND name = ? AND x > ?"
+    assert normalize("SELECT a::int FROM t WHERE b = :b AND c = $2") == "SELECT a::int FROM t WHERE b = ? AND c = ?"
+
+    engine = instrument_engine(create_engine("sqlite://"), "test_querylog")
+    with engine.connect() as conn:
+        for n in range(5):
+            conn.execute(text("SELECT :n"), {"n": n})
+        conn.execute(text("SELECT 1 + 1"))
+    top = QUERY_LOG.top(service="test_querylog")
+    assert sorted((row["query"], row["calls"]) for row in top) == [("SELECT ?", 5), ("SELECT ? + ?", 1)]
+
+    log = QueryLog(slow_ms=100, max_fingerprints=2)
+    with caplog.at_level("WARNING"):
+        log.observe("svc", "SELECT * FROM users WHERE email = %(email)s", {"email": "okoye@wakanda.es"}, 0.3)
+    assert "okoye" not in caplog.text and "'email': '<str>'" in caplog.text
+    log.observe("svc", "DELETE FROM a", None, 0.001)
+    log.observe("svc", "DELETE FROM b", None, 0.002)
+    assert len(log.stats) == 3 and ("svc", "otras") in log.stats
+
+
+def test_routing_session_reads_replica_until_it_writes(tmp_path):
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from src.gestion_usuarios.app.models import Base as UsersBase, User
+    from src.gestion_usuarios.app.routing import ReplicaRouter, RoutingSession
+
+    primary = create_engine(f"sqlite:///{tmp_path / 'primario.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for engine, name in ((primary, "Primario"), (replica, "Réplica")):
+        UsersBase.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, name) VALUES (1, 'okoye@wakanda.es', :name)"),
+                         {"name": name})
+
+    lag = {"value": 0.0}
+    now = [0.0]
+    router = ReplicaRouter(primary, replica, max_lag=2.0, check_interval=5.0,
+                           probe=lambda conn: lag["value"], clock=lambda: now[0])
+    Sessions = sessionmaker(autoflush=False, class_=RoutingSession, router=router)
+
+    with Sessions() as db:
+        assert db.get(User, 1).name == "Réplica"
+        assert db.execute(text("SELECT count(*) FROM users")).scalar() == 1
+        db.add(User(id=2, email="nakia@wakanda.es", name="Nakia"))
+        db.commit()
+        # Lo recién escrito se lee del primario el resto de la sesión
+        assert db.query(User).filter(User.email == "nakia@wakanda.es").one().name == "Nakia"
+        assert db.get(User, 1).name == "Primario"
+    with Sessions() as db:
+        assert db.query(User).count() == 1
+
+    lag["value"] = 10.0
+    now[0] = 6.0
+    with Sessions() as db:
+        assert db.query(User).count() == 2 and not router.healthy
+
+    replica.dispose()
+    router.replica = create_engine(f"sqlite:///{tmp_path / 'no_existe' / 'replica.db'}")
+    lag["value"], now[0] = 0.0, 12.0
+    with Sessions(info={"primary": True}) as db:
+        assert db.query(User).count() == 2
+    with Sessions() as db:
+        assert db.query(User).count() == 2 and not router.healthy
+
+
+def test_tracing_follows_request_across_services(tmp_path, monkeypatch):
+    from fastapi import FastAPI
+    from sqlalchemy import create_engine, text
+
+    engine = instrument_engine(create_engine("sqlite://"), "test_tracing")
+    service = FastAPI()
+    service.add_middleware(TracingMiddleware, service="servicio")
+
+    @service.get("/work/{n}")
+    def work(n: int):
+        with engine.connect() as conn:
+            return {"n": conn.execute(text("SELECT :n"), {"n": n}).scalar()}
+
+    gateway = FastAPI()
+    gateway.add_middleware(TracingMiddleware, service="gateway")
+
+    @gateway.get("/call")
+    async def call():
+        transport = TracingTransport(httpx.ASGITransport(app=service))
+        async with httpx.AsyncClient(transport=transport, base_url="http://servicio") as client:
+            await asyncio.sleep(0.01)
+            return (await client.get("/work/7")).json()
+
+    export = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(TRACER, "export_path", str(export))
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = TestClient(gateway).get("/call", headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+    assert response.json() == {"n": 7} and response.headers["x-trace-id"] == trace_id
+
+    spans = {s["name"]: s for s in TRACER.spans(trace_id)}
+    assert set(spans) == {"GET /call", "GET servicio", "GET /work/{n}", "db SELECT"}
+    assert spans["GET /call"]["parentSpanId"] == "00f067aa0ba902b7"
+    assert spans["GET /work/{n}"]["parentSpanId"] == spans["GET servicio"]["spanId"]
+    assert spans["db SELECT"]["parentSpanId"] == spans["GET /work/{n}"]["spanId"]
+    assert spans["db SELECT"]["service"] == "servicio" and spans["GET servicio"]["service"] == "gateway"
+
+    path = critical_path(list(spans.values()))
+    assert [step["name"] for step in path] == ["GET /call", "GET servicio", "GET /work/{n}", "db SELECT"]
+    assert path[0]["self_ms"] >= 10
+    # Muestreada en origen: se exporta entera y cada span una sola vez
+    assert sorted(json.loads(line)["name"] for line in export.read_text().splitlines()) == sorted(spans)
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+
+    # Las tareas que sobreviven a la petición no cuelgan spans de ella
+    async def outlive_request():
+        root, token = TRACER.begin("GET /stream/status", None, "gateway")
+        release = asyncio.Event()
+
+        async def poller():
+            await release.wait()
+            with TRACER.span("GET servicio") as late:
+                return late, TRACER.current()
+
+        inherited, fresh = asyncio.create_task(poller()), detached(poller())
+        TRACER.finish(root, token)
+        release.set()
+        return root, await inherited, await fresh
+
+    root, (late, _), (_, current) = asyncio.run(outlive_request())
+    assert late is None and current is None
+    assert len(TRACER.spans(root.trace_id)) == 1
+
+
+@patch("src.gestion_usuarios.app.main.SessionLocal")
+def test_profile_endpoint_requires_admin_and_samples_stacks(mock_session):
+    import threading
+    from wakanda_common.profiling import profile
+
+    mock_user = MagicMock()
+    mock_user.role = "CITIZEN"
+    mock_session.return_value.query.return_value.filter.return_value.first.return_value = mock_user
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'okoye@wakanda.es'})}"}
+    assert client_users.get("/admin/profile?seconds=0.1", headers=headers).status_code == 403
+
+    mock_user.role = "ADMIN"
+    response = client_users.get("/admin/profile?seconds=0.2&format=collapsed", headers=headers)
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(i * i for i in range(1000))
+
+    worker = threading.Thread(target=busy_loop, name="carga")
+    worker.start()
+    try:
+        result = asyncio.run(profile(0.3, interval=0.002, heap=True, top=5))
+    finally:
+        stop.set()
+        worker.join()
+    assert result["samples"] > 10 and len(result["heap"]) <= 5
+    busy = [line for line in result["collapsed"].splitlines() if line.startswith("carga;") and "busy_loop" in line]
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in busy) > result["samples"] / 2
+    # Los hilos en espera no cuentan sin idle=True
+    assert "select (" not in result["collapsed"]
+
+
+def test_gunicorn_conf_cleans_multiprocess_dir(tmp_path, monkeypatch):
+    import importlib
+    from wakanda_common import metrics
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "prom"))
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    from wakanda_common import gunicorn_conf
+    gunicorn_conf = importlib.reload(gunicorn_conf)
+    assert gunicorn_conf.workers == 3 and gunicorn_conf.worker_class == "uvicorn.workers.UvicornWorker"
+
+    stale = tmp_path / "prom" / "counter_123.db"
+    stale.write_bytes(b"")
+    gunicorn_conf.on_starting(MagicMock())
+    assert not stale.exists()
+
+    engine = MagicMock()
+    monkeypatch.setattr(metrics, "ENGINES", [engine])
+    gunicorn_conf.post_fork(MagicMock(), MagicMock())
+    engine.sync_engine.dispose.assert_called_once_with(close=False)
+
+
+def test_create_service_app_wires_lifespan_and_probes():
+    events = []
+    app = create_service_app(
+        "test_factory", "Servicio de prueba",
+        requests_metric=("test_factory_requests_total", "Peticiones de prueba"),
+        startup=[lambda: events.append("startup")],
+        shutdown=[lambda: events.append("shutdown")],
+        database_url="sqlite:///./test.db",
+    )
+    assert app.state.db._engine is None
+
+    @app.get("/demo")
+    async def demo():
+        app.state.requests.inc()
+        return {"ok": True}
+
+    with TestClient(app) as client:
+        assert events == ["startup"]
+        assert client.get("/health").json() == {"status": "ok"}
+        assert client.get("/demo").status_code == 200
+        ready = client.get("/ready")
+        assert ready.status_code == 503 and ready.json()["status"] == "db_unavailable"
+        assert client.get("/metrics/").status_code == 200
+        assert client.get("/admin/queries").status_code == 401
+        me = AsyncMock(side_effect=lambda url: httpx.Response(200, json={"role": role}))
+        with patch("httpx.AsyncClient.get", me):
+            role = "CITIZEN"
+            assert client.get("/admin/queries", headers={"Authorization": "Bearer x"}).status_code == 403
+            role = "ADMIN"
+            queries = client.get("/admin/queries", headers={"Authorization": "Bearer x"})
+        assert queries.status_code == 200 and queries.json()["service"] == "test_factory"
+        assert me.call_args.args[0].endswith("/me")
+    assert events == ["startup", "shutdown"]
+    assert app.state.requests._value.get() == 1
+
+
+def test_fast_json_response_serializes_numpy_and_matches_stdlib():
+    import numpy as np
+    content = {"points": [{"t": 1.5, "value": 2.25}], "level": np.float64(0.5), "ids": np.arange(3)}
+    body = json_response(content).body
+    assert json.loads(body) == {"points": [{"t": 1.5, "value": 2.25}], "level": 0.5, "ids": [0, 1, 2]}
+    assert JSONResponse({"a": [1, "b"]}).body == b'{"a":[1,"b"]}'
@@ -183,6 +183,11 @@ function App() {
     }, [view]);
 
     const handleLogout = () => {
+        if (token) {
+            axios.post(`${USERS_API}/logout`, {}, {
+                headers: { Authorization: `Bearer ${token}` }
+            }).catch(() => {});
+        }
         sessionStorage.removeItem('wakanda_token');
         localStorage.removeItem('wakanda_last_view');
         setToken(null);
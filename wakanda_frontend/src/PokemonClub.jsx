@@ -56,7 +56,7 @@ export default function PokemonClub({ onExit }) {
 
   const fetchRoster = async () => {
     try {
-      const res = await axios.get(`${API_URL}/pokemon/roster`)
+      const res = await axios.get(`${API_URL}/pokemon/gallery?limit=20`)
       setRoster(res.data.results)
     } catch {}
   }